@@ -1,67 +1,680 @@
+import time
+# Import time of the app is reported by /ready and on /metrics
+_import_started = time.perf_counter()
+
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+import hashlib
+import io
+import json
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import re
+import zipfile
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
 from pydantic import BaseModel
-from typing import List
-from app.services.ingestion import ingest_file, clear_knowledge_base
-from app.services.rag_service import retrieve_context
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional
+from app.services.ingestion import (
+    clear_knowledge_base,
+    create_snapshot,
+    delete_snapshot,
+    delete_source,
+    embedding_stats,
+    get_embeddings,
+    get_kb_version,
+    list_collections,
+    list_snapshots,
+    list_sources,
+    memory_usage,
+    reindex_source,
+    restore_snapshot,
+    validate_collection,
+)
+from app.services.lexical_index import validate_filters
+from app.services.metrics import (
+    COALESCED_REQUESTS,
+    HTTP_REQUEST_SECONDS,
+    METRICS_TIMING_HEADER,
+    end_request_timings,
+    render_metrics,
+    server_timing_header,
+    start_request_timings,
+    timed,
+)
+from app.services.response_cache import test_case_cache
+from app.utils.json_stream import JsonArrayStreamParser
+from app.services.jobs import JobQueueFull, cancel_job, get_job, list_jobs, submit_ingestion
+from app.services.context_builder import CONTEXT_FETCH_K
+from app.services.rag_service import (
+    MAP_REDUCE_FETCH_K,
+    MAP_REDUCE_MAX_PARTITIONS,
+    needs_query_vector,
+    retrieve_context,
+    retrieve_context_batch,
+    retrieve_context_partitions,
+)
+from app.services.uploads import INGEST_MAX_REQUEST_MB, UploadTooLarge, remove_uploads, store_uploads
+from app.services.warmup import WARMUP_ON_STARTUP, record_import_time, start_background_warmup, status as warmup_status, warmup
 
 app = FastAPI(title="QA Agent API")
 
+# Concurrent generation requests with the same payload (against the same
+# knowledge base version) share one computation: one embedding call, one
+# retrieval and one LLM call, whose result every caller receives
+REQUEST_COALESCING = os.environ.get("REQUEST_COALESCING", "true").lower() in ("1", "true", "yes")
+
+# Most queries accepted by one /retrieve/batch request
+RETRIEVE_BATCH_MAX_QUERIES = int(os.environ.get("RETRIEVE_BATCH_MAX_QUERIES", "100"))
+
+# Shared computations in progress, by endpoint and payload hash
+_in_flight: Dict[str, asyncio.Task] = {}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject an /ingest/ request whose declared size is over INGEST_MAX_REQUEST_MB before its body is read."""
+    uploads_files = request.url.path == "/ingest/" or request.url.path.startswith("/kb/sources/")
+    if uploads_files and request.method == "POST":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > INGEST_MAX_REQUEST_MB * 1024 * 1024:
+            # Label the rejection with its route in the request metrics
+            for route in app.router.routes:
+                if route.matches(request.scope)[0] == Match.FULL:
+                    request.scope["route"] = route
+                    break
+            return JSONResponse(
+                {"detail": f"Upload exceeds the {INGEST_MAX_REQUEST_MB:g} MB per-request limit"}, status_code=413
+            )
+    return await call_next(request)
+
+# Starlette runs the middleware registered last first: request metrics are
+# recorded outermost, so they also count uploads rejected by the size limit
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Record request latency and, when enabled, attach the per-stage breakdown
+    as a Server-Timing header. Streamed responses only include the stages
+    that ran before the first byte was sent.
+    """
+    start = time.perf_counter()
+    timings, token = start_request_timings()
+    try:
+        response = await call_next(request)
+    finally:
+        end_request_timings(token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        path=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    if METRICS_TIMING_HEADER or request.headers.get("x-timing") == "1":
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
 class TestGenRequest(BaseModel):
     query: str
+    # Knowledge base to search; defaults to the shared "default" collection
+    collection: Optional[str] = None
+    # Overrides RETRIEVAL_MODE for this request: "vector", "lexical" or "hybrid"
+    retrieval_mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+    # Skip the response cache lookup and generate a fresh answer
+    bypass_cache: bool = False
+    # Only search chunks with matching metadata, e.g. {"source": ["a.md"], "doc_type": "md"}
+    filters: Optional[Dict[str, Any]] = None
+    # Split a broad request into context partitions, generate each one
+    # concurrently and merge the results (renumbered, near-duplicates dropped)
+    map_reduce: bool = False
+    # Partition by these sub-topics instead of by source and section; implies map_reduce
+    subtopics: Optional[List[str]] = None
+
+class BatchRetrieveRequest(BaseModel):
+    queries: List[str]
+    collection: Optional[str] = None
+    retrieval_mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+    # Applied to every query
+    filters: Optional[Dict[str, Any]] = None
+    # Give a chunk found by several queries only to the one it matches best
+    dedupe: bool = False
 
 class SeleniumGenRequest(BaseModel):
     test_case: dict
     html_content: str
 
+class SeleniumBatchRequest(BaseModel):
+    test_cases: List[dict]
+    html_content: str
+    # "json": list of scripts, "zip": archive of .py files, "ndjson": streamed as scripts complete
+    format: Literal["json", "zip", "ndjson"] = "json"
+    # Optional per-request limit, capped at SELENIUM_BATCH_CONCURRENCY
+    max_concurrency: Optional[int] = None
+
+async def coalesce(endpoint: str, payload: Any, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Return `await compute()`, unless a request to `endpoint` with an equal
+    `payload` (JSON-serializable) is already being computed, in which case
+    wait for that one instead. Errors are shared too. The computation runs as
+    its own task, so a caller that disconnects does not cancel it for the others.
+    """
+    if not REQUEST_COALESCING:
+        return await compute()
+    key = endpoint + ":" + hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(compute())
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _finish_flight(key, done))
+    else:
+        COALESCED_REQUESTS.inc(endpoint=endpoint)
+    return await asyncio.shield(task)
+
+def _finish_flight(key: str, task: asyncio.Task):
+    _in_flight.pop(key, None)
+    if not task.cancelled():
+        # Marks the error as retrieved when every caller has gone
+        task.exception()
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+def resolve_collection(name: Optional[str]) -> str:
+    try:
+        return validate_collection(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def resolve_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    try:
+        return validate_filters(filters) or None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def resolve_subtopics(request: TestGenRequest) -> Optional[List[str]]:
+    """The request's sub-topics (None without map-reduce, [] to partition by source and section)."""
+    subtopics = [" ".join(subtopic.split()) for subtopic in request.subtopics or [] if subtopic.strip()]
+    if len(subtopics) > MAP_REDUCE_MAX_PARTITIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAP_REDUCE_MAX_PARTITIONS} subtopics per request.")
+    if not subtopics and not request.map_reduce:
+        return None
+    return subtopics
+
+def cache_namespace(
+    collection: str, request: TestGenRequest, filters: Optional[Dict[str, Any]], subtopics: Optional[List[str]] = None
+) -> str:
+    namespace = f"{collection}:{request.retrieval_mode or ''}"
+    if filters:
+        namespace += ":" + json.dumps(filters, sort_keys=True)
+    if subtopics is not None:
+        namespace += ":map_reduce:" + json.dumps(subtopics)
+    return namespace
+
+@app.on_event("startup")
+def start_warmup():
+    if WARMUP_ON_STARTUP:
+        start_background_warmup()
+
 @app.get("/")
 def read_root():
     return {"message": "QA Agent API is running"}
 
-@app.post("/ingest/")
-async def ingest_documents(files: List[UploadFile] = File(...)):
-    total_chunks = 0
-    processed_files = []
+@app.post("/warmup")
+async def warmup_clients():
+    """Initialize the embedding client, vector store and LLM client now instead of on first use."""
+    return await run_in_threadpool(warmup)
+
+@app.get("/ready")
+def readiness():
+    """Readiness probe: 503 until warmup has completed. "/" stays the liveness check."""
+    state = warmup_status()
+    if not state["ready"]:
+        return JSONResponse(state, status_code=503)
+    return state
+
+@app.post("/ingest/", status_code=202)
+async def ingest_documents(files: List[UploadFile] = File(...), collection: Optional[str] = Query(None)):
+    """
+    Queue the uploaded files for ingestion into `collection` and return a
+    job ID right away. Poll /ingest/jobs/{job_id} for progress.
+    """
+    collection = resolve_collection(collection)
+    try:
+        # Copied to disk in blocks; the job streams them from there
+        uploads = await store_uploads(files)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        job = submit_ingestion([(upload.filename, upload) for upload in uploads], collection)
+    except JobQueueFull as e:
+        remove_uploads(uploads)
+        raise HTTPException(status_code=429, detail=str(e))
     
-    for file in files:
-        content = await file.read()
-        try:
-            chunks = ingest_file(file.filename, content)
-            total_chunks += chunks
-            processed_files.append(file.filename)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error processing {file.filename}: {str(e)}")
-            
-    return {"message": "Ingestion successful", "files": processed_files, "total_chunks": total_chunks}
+    return {"message": "Ingestion queued", "job_id": job.id, "status": job.status, "files": job.filenames, "collection": collection}
+
+@app.get("/ingest/jobs")
+def ingestion_jobs():
+    return {"jobs": [job.to_dict() for job in list_jobs()]}
+
+@app.get("/ingest/jobs/{job_id}")
+def ingestion_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job.to_dict()
+
+@app.post("/ingest/jobs/{job_id}/cancel")
+def cancel_ingestion_job(job_id: str):
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job.to_dict()
 
 @app.post("/clear-kb/")
-def clear_kb():
-    clear_knowledge_base()
-    return {"message": "Knowledge base cleared"}
+def clear_kb(collection: Optional[str] = Query(None)):
+    """Clear one collection (the default one unless `collection` is given)."""
+    collection = resolve_collection(collection)
+    clear_knowledge_base(collection)
+    return {"message": "Knowledge base cleared", "collection": collection}
+
+@app.get("/kb/collections")
+def kb_collections():
+    """Collections with their chunk counts, memory use and load state, plus the memory budget."""
+    return {"collections": list_collections(), **memory_usage()}
+
+@app.get("/kb/sources")
+def kb_sources(collection: Optional[str] = Query(None)):
+    """Sources of a collection with their chunk counts, document type, file hash and ingest time."""
+    collection = resolve_collection(collection)
+    return {"collection": collection, "sources": list_sources(collection)}
+
+@app.delete("/kb/sources/{source:path}")
+def kb_delete_source(source: str, collection: Optional[str] = Query(None)):
+    """Remove one source's chunks; the rest of the collection is untouched."""
+    collection = resolve_collection(collection)
+    try:
+        removed = delete_source(source, collection)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown source: {source}")
+    return {"message": "Source deleted", "source": source, "collection": collection, "chunks": removed}
+
+@app.post("/kb/sources/{source:path}/reindex")
+async def kb_reindex_source(source: str, file: Optional[UploadFile] = File(None), collection: Optional[str] = Query(None)):
+    """
+    Without a file, rebuild the source's vectors, BM25 postings and metadata
+    from its stored chunks. With a file, queue it as the new version of the
+    source (whatever its upload name); only changed chunks are embedded.
+    """
+    collection = resolve_collection(collection)
+    if file is None:
+        try:
+            result = await run_in_threadpool(reindex_source, source, collection)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Unknown source: {source}")
+        return {"message": "Source reindexed", "collection": collection, **result}
+    try:
+        uploads = await store_uploads([file])
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        job = submit_ingestion([(source, uploads[0])], collection)
+    except JobQueueFull as e:
+        remove_uploads(uploads)
+        raise HTTPException(status_code=429, detail=str(e))
+    return JSONResponse(
+        {"message": "Ingestion queued", "job_id": job.id, "status": job.status, "files": job.filenames, "collection": collection},
+        status_code=202,
+    )
+
+@app.get("/kb/snapshots")
+def kb_snapshots(collection: Optional[str] = Query(None)):
+    return {"snapshots": list_snapshots(collection)}
+
+@app.post("/kb/snapshots")
+def kb_create_snapshot(collection: Optional[str] = Query(None)):
+    return create_snapshot(resolve_collection(collection))
+
+@app.post("/kb/snapshots/{name}/restore")
+def kb_restore_snapshot(name: str, collection: Optional[str] = Query(None)):
+    """Restore into the snapshot's own collection, or into `collection` if given."""
+    if collection is not None:
+        collection = resolve_collection(collection)
+    try:
+        snapshot = restore_snapshot(name, collection)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot: {name}")
+    return {"message": "Knowledge base restored", "snapshot": snapshot}
+
+@app.delete("/kb/snapshots/{name}")
+def kb_delete_snapshot(name: str):
+    try:
+        delete_snapshot(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot: {name}")
+    return {"message": "Snapshot deleted"}
 
 @app.post("/retrieve/")
 def retrieve(request: TestGenRequest):
-    context = retrieve_context(request.query)
+    collection = resolve_collection(request.collection)
+    filters = resolve_filters(request.filters)
+    context = retrieve_context(request.query, mode=request.retrieval_mode, collection=collection, filters=filters)
     return {"context": context}
 
+@app.post("/retrieve/batch")
+def retrieve_batch(request: BatchRetrieveRequest):
+    """
+    Context for several queries in one request: the queries are embedded in
+    one batched call and searched in one vectorized pass.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided.")
+    if len(request.queries) > RETRIEVE_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {RETRIEVE_BATCH_MAX_QUERIES} queries per request.")
+    collection = resolve_collection(request.collection)
+    filters = resolve_filters(request.filters)
+    contexts = retrieve_context_batch(
+        request.queries, mode=request.retrieval_mode, collection=collection, filters=filters, dedupe=request.dedupe
+    )
+    return {
+        "collection": collection,
+        "results": [{"query": query, "context": context} for query, context in zip(request.queries, contexts)],
+    }
+
 # Placeholder endpoints for Phase 2 & 3
-from app.services.llm_service import generate_test_cases
+from app.services.llm_service import (
+    TestCaseMerger,
+    generate_test_cases,
+    generate_test_cases_map_reduce,
+    stream_test_cases,
+    stream_test_cases_map_reduce,
+)
+
+def timed_embed_query(query: str):
+    with timed("embed_query"):
+        return get_embeddings().embed_query(query)
+
+def response_cache_vector(request: TestGenRequest, collection: str, filters: Optional[Dict[str, Any]], subtopics: Optional[List[str]]):
+    """
+    The query embedding for the semantic response cache, or None when
+    retrieval would not embed the query (lexical mode, the hybrid fast path,
+    sub-topics); those requests are cached on the normalized query text.
+    """
+    if subtopics:
+        return None
+    # Map-reduce without sub-topics retrieves more candidates for the query
+    k = MAP_REDUCE_FETCH_K if subtopics is not None else CONTEXT_FETCH_K
+    if not needs_query_vector(request.query, request.retrieval_mode, collection, filters, k):
+        return None
+    return timed_embed_query(request.query)
 
 @app.post("/generate-tests/")
-def generate_tests(request: TestGenRequest):
-    context = retrieve_context(request.query)
+async def generate_tests(request: TestGenRequest):
+    collection = resolve_collection(request.collection)
+    filters = resolve_filters(request.filters)
+    subtopics = resolve_subtopics(request)
+    kb_version = await run_in_threadpool(get_kb_version, collection)
+    payload = {
+        "query": normalize_query(request.query),
+        "collection": collection,
+        "kb_version": kb_version,
+        "retrieval_mode": request.retrieval_mode,
+        "bypass_cache": request.bypass_cache,
+        "filters": filters,
+        "subtopics": subtopics,
+    }
+    return await coalesce(
+        "/generate-tests/", payload, lambda: _generate_tests(request, collection, kb_version, filters, subtopics)
+    )
+
+async def _generate_tests(
+    request: TestGenRequest,
+    collection: str,
+    kb_version: int,
+    filters: Optional[Dict[str, Any]] = None,
+    subtopics: Optional[List[str]] = None,
+):
+    # Near-duplicate queries against an unchanged knowledge base reuse the cached suite
+    namespace = cache_namespace(collection, request, filters, subtopics)
+    query_text = normalize_query(request.query)
+    query_vector = await run_in_threadpool(response_cache_vector, request, collection, filters, subtopics)
+    if not request.bypass_cache:
+        cached = test_case_cache.lookup(query_vector, kb_version, namespace, query_text)
+        if cached is not None:
+            return {"test_cases": cached, "cached": True}
+    
+    if subtopics is not None:
+        partitions = await run_in_threadpool(
+            retrieve_context_partitions,
+            request.query,
+            mode=request.retrieval_mode,
+            collection=collection,
+            filters=filters,
+            subtopics=subtopics,
+        )
+        if not partitions:
+            raise HTTPException(status_code=404, detail="No relevant context found in knowledge base.")
+        result = await generate_test_cases_map_reduce(partitions, request.query)
+        # A suite missing a failed partition is not cached
+        if result["test_cases"] and not any("error" in partition for partition in result["partitions"]):
+            test_case_cache.store(query_vector, kb_version, result["test_cases"], namespace, query_text)
+        return {**result, "cached": False}
+    
+    context = await run_in_threadpool(
+        retrieve_context, request.query, mode=request.retrieval_mode, collection=collection, filters=filters
+    )
     if not context:
         raise HTTPException(status_code=404, detail="No relevant context found in knowledge base.")
         
-    test_cases = generate_test_cases(context, request.query)
-    return {"test_cases": test_cases}
+    test_cases = await generate_test_cases(context, request.query)
+    if test_cases:
+        test_case_cache.store(query_vector, kb_version, test_cases, namespace, query_text)
+    return {"test_cases": test_cases, "cached": False}
 
-from app.services.llm_service import generate_selenium_script
+@app.post("/generate-tests/stream")
+async def generate_tests_stream(request: TestGenRequest, http_request: Request):
+    """
+    Stream test cases as they are generated: NDJSON by default, or
+    Server-Sent Events when the client accepts text/event-stream. In
+    map-reduce mode, cases from all partitions are interleaved as they
+    arrive (already renumbered), and a "partition" event marks the end of each.
+    """
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    
+    def encode(event: str, data: dict) -> str:
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, **data}) + "\n"
+    
+    collection = resolve_collection(request.collection)
+    filters = resolve_filters(request.filters)
+    subtopics = resolve_subtopics(request)
+    kb_version = await run_in_threadpool(get_kb_version, collection)
+    namespace = cache_namespace(collection, request, filters, subtopics)
+    query_text = normalize_query(request.query)
+    query_vector = await run_in_threadpool(response_cache_vector, request, collection, filters, subtopics)
+    cached = None if request.bypass_cache else test_case_cache.lookup(query_vector, kb_version, namespace, query_text)
+    
+    context = None
+    partitions = None
+    if cached is None and subtopics is not None:
+        partitions = await run_in_threadpool(
+            retrieve_context_partitions,
+            request.query,
+            mode=request.retrieval_mode,
+            collection=collection,
+            filters=filters,
+            subtopics=subtopics,
+        )
+        if not partitions:
+            raise HTTPException(status_code=404, detail="No relevant context found in knowledge base.")
+    elif cached is None:
+        context = await run_in_threadpool(
+            retrieve_context, request.query, mode=request.retrieval_mode, collection=collection, filters=filters
+        )
+        if not context:
+            raise HTTPException(status_code=404, detail="No relevant context found in knowledge base.")
+    
+    async def stream():
+        if cached is not None:
+            for test_case in cached:
+                yield encode("test_case", {"test_case": test_case})
+            yield encode("done", {"count": len(cached), "truncated": False, "cached": True})
+            return
+        
+        if partitions is not None:
+            merger = TestCaseMerger()
+            summaries = []
+            async for index, test_case, summary in stream_test_cases_map_reduce(partitions, request.query, merger):
+                if test_case is not None:
+                    yield encode("test_case", {"test_case": test_case, "partition": index})
+                else:
+                    summaries.append(summary)
+                    yield encode("partition", {"index": index, **summary})
+            errors = [summary["error"] for summary in summaries if "error" in summary]
+            if len(errors) == len(summaries):
+                yield encode("error", {"message": errors[0], "count": len(merger.test_cases)})
+                return
+            truncated = any(summary["truncated"] for summary in summaries)
+            yield encode("done", {
+                "count": len(merger.test_cases),
+                "truncated": truncated,
+                "cached": False,
+                "partitions": len(summaries),
+                "duplicates_removed": merger.duplicates,
+            })
+            if merger.test_cases and not truncated and not errors:
+                test_case_cache.store(query_vector, kb_version, merger.test_cases, namespace, query_text)
+            return
+        
+        test_cases = []
+        parser = JsonArrayStreamParser()
+        try:
+            async for test_case in stream_test_cases(context, request.query, parser):
+                test_cases.append(test_case)
+                yield encode("test_case", {"test_case": test_case})
+        except Exception as e:
+            yield encode("error", {"message": str(e), "count": len(test_cases)})
+            return
+        yield encode("done", {"count": len(test_cases), "truncated": parser.truncated, "cached": False})
+        # Only complete suites are worth serving to later requests
+        if test_cases and not parser.truncated:
+            test_case_cache.store(query_vector, kb_version, test_cases, namespace, query_text)
+    
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of latency histograms, counters and cache hit rates."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "test_cases": test_case_cache.stats(),
+        "embeddings": embedding_stats(),
+        "coalescing": {
+            "enabled": REQUEST_COALESCING,
+            "in_flight": len(_in_flight),
+            "coalesced": {endpoint: COALESCED_REQUESTS.value(endpoint=endpoint) for endpoint in ("/generate-tests/", "/generate-selenium/")},
+        },
+    }
+
+from app.services.llm_service import generate_selenium_script, generate_selenium_scripts, get_page_index
 
 @app.post("/generate-selenium/")
-def generate_selenium(request: SeleniumGenRequest):
-    script = generate_selenium_script(request.test_case, request.html_content)
-    return {"selenium_script": script}
+async def generate_selenium(request: SeleniumGenRequest):
+    payload = {"test_case": request.test_case, "html_sha256": hashlib.sha256(request.html_content.encode("utf-8")).hexdigest()}
+    return await coalesce("/generate-selenium/", payload, lambda: _generate_selenium(request))
+
+async def _generate_selenium(request: SeleniumGenRequest):
+    page_index = await run_in_threadpool(get_page_index, request.html_content)
+    result = await generate_selenium_script(request.test_case, request.html_content, page_index)
+    return {
+        "selenium_script": result["script"],
+        "validation": result["validation"],
+        "cached": result["cached"],
+        "prompt_tokens": html_token_savings(page_index),
+    }
+
+def html_token_savings(page_index: dict) -> dict:
+    raw, compact = page_index["raw_tokens"], page_index["compact_tokens"]
+    return {
+        "raw_html": raw,
+        "compact_index": compact,
+        "saved": raw - compact,
+        "saved_ratio": round(1 - compact / raw, 4) if raw else 0.0,
+    }
+
+def script_file_name(test_case: dict, index: int) -> str:
+    test_id = str(test_case.get("Test_ID") or f"case_{index + 1}")
+    return f"test_{re.sub(r'[^a-z0-9_]+', '_', test_id.lower())}.py"
+
+def script_file_names(test_cases: List[dict]) -> List[str]:
+    """One file name per test case, in order; repeated names get _2, _3, ... until unused."""
+    names, used = [], set()
+    for index, test_case in enumerate(test_cases):
+        base = script_file_name(test_case, index)
+        name, suffix = base, 2
+        while name in used:
+            name = f"{base[:-3]}_{suffix}.py"
+            suffix += 1
+        used.add(name)
+        names.append(name)
+    return names
+
+@app.post("/generate-selenium/batch")
+async def generate_selenium_batch(request: SeleniumBatchRequest):
+    """
+    Generate Selenium scripts for many test cases against one HTML page.
+    The page is compacted once and scripts are generated concurrently.
+    """
+    if not request.test_cases:
+        raise HTTPException(status_code=400, detail="No test cases provided.")
+    page_index = await run_in_threadpool(get_page_index, request.html_content)
+    total = len(request.test_cases)
+    # Unique across the batch, so every format (and clients keyed on it) keeps every script
+    file_names = script_file_names(request.test_cases)
+    results = generate_selenium_scripts(request.test_cases, request.html_content, request.max_concurrency, page_index)
+    
+    def result_entry(index, result, error):
+        test_case = request.test_cases[index]
+        entry = {"index": index, "Test_ID": test_case.get("Test_ID"), "file_name": file_names[index]}
+        if error is None:
+            entry["selenium_script"] = result["script"]
+            entry["validation"] = result["validation"]
+            entry["cached"] = result["cached"]
+        else:
+            entry["error"] = error
+        return entry
+    
+    if request.format == "ndjson":
+        async def stream():
+            completed = 0
+            async for index, result, error in results:
+                completed += 1
+                entry = result_entry(index, result, error)
+                yield json.dumps({"event": "script", "completed": completed, "total": total, **entry}) + "\n"
+            yield json.dumps({"event": "done", "total": total, "prompt_tokens": html_token_savings(page_index)}) + "\n"
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    
+    entries = sorted([result_entry(*result) async for result in results], key=lambda entry: entry["index"])
+    
+    if request.format == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for entry in entries:
+                if "error" not in entry:
+                    archive.writestr(entry["file_name"], entry["selenium_script"])
+        return Response(
+            content=buffer.getvalue(),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="selenium_scripts.zip"'},
+        )
+    
+    return {"scripts": entries, "prompt_tokens": html_token_savings(page_index)}
+
+record_import_time(time.perf_counter() - _import_started)
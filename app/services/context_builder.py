@@ -0,0 +1,188 @@
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+from app.services.lexical_index import STOPWORDS, tokenize
+from app.utils.tokens import estimate_tokens
+
+if TYPE_CHECKING:
+    from app.services.ingestion import Document
+
+# Prompt context is packed up to a token budget instead of a fixed number of chunks
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1000"))
+# Candidates retrieved before diversification and packing
+CONTEXT_FETCH_K = int(os.environ.get("CONTEXT_FETCH_K", "20"))
+# MMR trade-off: 1.0 ranks by relevance only, lower values favour chunks unlike those already picked
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+# Candidates scoring below this fraction of the best score are not used to fill the budget
+CONTEXT_MIN_RELATIVE_SCORE = float(os.environ.get("CONTEXT_MIN_RELATIVE_SCORE", "0.5"))
+
+# The splitter repeats up to chunk_overlap (100) characters between adjacent
+# chunks; shorter common text is not treated as an overlap
+_MIN_OVERLAP_CHARS = 20
+_MAX_OVERLAP_CHARS = 200
+
+
+def format_block(source: str, text: str) -> str:
+    return f"Source: {source}\nContent: {text}\n\n"
+
+
+def mmr_order(candidates: List[Tuple["Document", float]], lambda_: float = CONTEXT_MMR_LAMBDA) -> List[Tuple["Document", float]]:
+    """
+    Order candidates by maximal marginal relevance: each pick maximizes
+    lambda * relevance - (1 - lambda) * (similarity to the closest chunk
+    already picked). Similarity is the Jaccard overlap of the chunks' terms,
+    so no embeddings are needed and lexical-only retrieval works too.
+    """
+    terms = [_terms(doc.page_content) for doc, _ in candidates]
+    remaining = list(range(len(candidates)))
+    max_similarity = [0.0] * len(candidates)
+    ordered = []
+    while remaining:
+        best = max(remaining, key=lambda i: lambda_ * candidates[i][1] - (1 - lambda_) * max_similarity[i])
+        remaining.remove(best)
+        ordered.append(candidates[best])
+        for i in remaining:
+            max_similarity[i] = max(max_similarity[i], _jaccard(terms[i], terms[best]))
+    return ordered
+
+
+def merge_overlapping(documents: List["Document"]) -> List[Tuple[str, str]]:
+    """
+    Combine chunks of the same source whose text overlaps end-to-start (the
+    splitter's chunk_overlap) into one passage, and drop chunks contained in
+    another. Returns (source, text) passages in the order of their first chunk.
+    """
+    passages: List[List[str]] = []
+    for doc in documents:
+        passages.append([doc.metadata.get("source", "unknown"), doc.page_content])
+
+    merged = True
+    while merged:
+        merged = False
+        for i, first in enumerate(passages):
+            for j, second in enumerate(passages):
+                if i == j or first[0] != second[0]:
+                    continue
+                combined = _join(first[1], second[1])
+                if combined is not None:
+                    first[1] = combined
+                    del passages[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [(source, text) for source, text in passages]
+
+
+def pack_context(
+    candidates: List[Tuple["Document", float]],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    max_chunks: Optional[int] = None,
+) -> str:
+    """
+    Build prompt context from retrieved (Document, score) candidates: order
+    them by MMR, then add chunks while the merged, formatted context fits in
+    `token_budget`. The best chunk is always included, truncated if needed.
+    Candidates must be sorted best first.
+    """
+    if not candidates:
+        return ""
+    # Weak matches don't fill the budget; with no match at all only the top candidate is used
+    floor = candidates[0][1] * CONTEXT_MIN_RELATIVE_SCORE
+    ordered = mmr_order([(doc, score) for doc, score in candidates if score >= floor and score > 0] or candidates[:1])
+
+    selected: List["Document"] = []
+    context = ""
+    for doc, _ in ordered:
+        if max_chunks is not None and len(selected) >= max_chunks:
+            break
+        attempt = _render(merge_overlapping(selected + [doc]))
+        if estimate_tokens(attempt) <= token_budget:
+            selected.append(doc)
+            context = attempt
+        elif not selected:
+            # Truncate the best chunk rather than return nothing
+            source = doc.metadata.get("source", "unknown")
+            room = token_budget * 4 - len(format_block(source, ""))
+            context = format_block(source, doc.page_content[:max(room, 0)])
+            selected.append(doc)
+    return context
+
+
+def partition_candidates(
+    candidates: List[Tuple["Document", float]],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    max_partitions: int = 4,
+) -> List[List[Tuple["Document", float]]]:
+    """
+    Split retrieved (Document, score) candidates into at most `max_partitions`
+    groups that each fit `token_budget`, for map-reduce generation. Chunks of
+    the same source and top-level section stay together (a group too large
+    for one budget is split in order), groups are placed first-fit in order
+    of their best chunk, and those left over once every partition is full
+    are dropped. Each partition is sorted best first, ready for pack_context.
+    """
+    if not candidates:
+        return []
+    floor = candidates[0][1] * CONTEXT_MIN_RELATIVE_SCORE
+    kept = [(doc, score) for doc, score in candidates if score >= floor and score > 0] or candidates[:1]
+
+    groups: Dict[Tuple[str, str], List[Tuple["Document", float]]] = {}
+    for doc, score in kept:
+        key = (doc.metadata.get("source", "unknown"), (doc.metadata.get("section") or "").split(" > ")[0])
+        groups.setdefault(key, []).append((doc, score))
+
+    pieces: List[Tuple[List[Tuple["Document", float]], int]] = []
+    for members in groups.values():
+        piece: List[Tuple["Document", float]] = []
+        size = 0
+        for doc, score in members:
+            tokens = estimate_tokens(format_block(doc.metadata.get("source", "unknown"), doc.page_content))
+            if piece and size + tokens > token_budget:
+                pieces.append((piece, size))
+                piece, size = [], 0
+            piece.append((doc, score))
+            size += tokens
+        pieces.append((piece, size))
+
+    partitions: List[List] = []
+    for piece, size in pieces:
+        target = next((partition for partition in partitions if partition[1] + size <= token_budget), None)
+        if target is None:
+            if len(partitions) >= max_partitions:
+                continue
+            target = [[], 0]
+            partitions.append(target)
+        target[0].extend(piece)
+        target[1] += size
+    return [sorted(members, key=lambda candidate: candidate[1], reverse=True) for members, _ in partitions]
+
+
+def _render(passages: List[Tuple[str, str]]) -> str:
+    return "".join(format_block(source, text) for source, text in passages)
+
+
+def _join(first: str, second: str) -> Optional[str]:
+    """`first` followed by `second` without their shared text, or None if they don't overlap."""
+    if len(second) >= _MIN_OVERLAP_CHARS and second in first:
+        return first
+    probe = second[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return None
+    start = max(0, len(first) - _MAX_OVERLAP_CHARS)
+    position = first.find(probe, start)
+    while position != -1:
+        # The rest of `first` must be a prefix of `second`
+        if second.startswith(first[position:]):
+            return first[:position] + second
+        position = first.find(probe, position + 1)
+    return None
+
+
+def _terms(text: str) -> Set[str]:
+    return {token for token in tokenize(text) if token not in STOPWORDS}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
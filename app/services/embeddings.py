@@ -0,0 +1,264 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    # Only for annotations: the classes below implement langchain's Embeddings
+    # interface without subclassing it, so langchain is not loaded at import
+    from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+# Embedding backend: "google" (Gemini embeddings API) or "hash" (deterministic,
+# offline; for benchmarks and local testing without an API key)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "google")
+HASH_EMBEDDING_DIM = int(os.environ.get("HASH_EMBEDDING_DIM", "256"))
+
+# Persistent embedding cache settings. An empty path keeps the cache in memory only.
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def cache_key(model: str, kind: str, text: str) -> str:
+    """
+    Content address of an embedding: the model name, the kind of embedding
+    (document or query) and the exact text.
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(kind.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding store with size-bounded LRU eviction.
+    Every lookup bumps the entry's recency; once the cache holds more than
+    `max_entries` vectors the least recently used ones are deleted.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path or ":memory:"
+        self.max_entries = max_entries
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()
+        self._count, self._tick = row[0], row[1]
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                self._tick += 1
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._tick, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            self._tick += 1
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), self._tick) for key, vector in items.items()],
+            )
+            self._count += self._conn.total_changes - before
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        overflow = self._count - self.max_entries
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (overflow,),
+        )
+        self._count -= overflow
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+
+class HashEmbeddings:
+    """
+    Deterministic offline embeddings: each word is hashed into one of `dim`
+    buckets with a hashed sign, and the counts are L2-normalized. Texts that
+    share words get similar vectors, so retrieval still behaves sensibly.
+    """
+
+    _WORD_RE = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, dim: int = HASH_EMBEDDING_DIM):
+        self.dim = dim
+
+    @property
+    def model(self) -> str:
+        return f"hash-{self.dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in self._WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def create_embedding_backend(backend: str = EMBEDDING_BACKEND) -> Tuple["Embeddings", str]:
+    """Return the configured embedding backend and the model name used in cache keys."""
+    if backend == "hash":
+        hash_embeddings = HashEmbeddings()
+        return hash_embeddings, hash_embeddings.model
+    if backend != "google":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    # Note: Ensure GOOGLE_API_KEY is set in environment variables
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL
+
+
+def embed_query_batch(backend: "Embeddings", texts: List[str]) -> List[List[float]]:
+    """
+    Embed several queries in one backend call where the backend allows it:
+    Gemini takes them in a single batchEmbedContents request with the query
+    task type, and the hash backend embeds queries like documents. Other
+    backends get one embed_query call per text.
+    """
+    if isinstance(backend, HashEmbeddings):
+        return backend.embed_documents(texts)
+    google = sys.modules.get("langchain_google_genai")
+    if google is not None and isinstance(backend, google.GoogleGenerativeAIEmbeddings):
+        return backend.embed_documents(texts, task_type=backend.task_type or "RETRIEVAL_QUERY")
+    return [backend.embed_query(text) for text in texts]
+
+
+class CachedEmbeddings:
+    """
+    Wraps an embedding backend so that only texts missing from the cache
+    are sent to it. Hit and miss totals are kept for reporting.
+    """
+
+    def __init__(self, backend: "Embeddings", model: str, cache: EmbeddingCache):
+        self.backend = backend
+        self.model = model
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def embed_documents_with_stats(self, texts: List[str]) -> Tuple[List[List[float]], int, int]:
+        """
+        Embed `texts`, returning the vectors along with how many texts were
+        served from the cache (hits) and how many were sent to the backend (misses).
+        """
+        keys = [cache_key(self.model, "document", text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+
+        # Embed each missing text once, even if it appears several times
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.backend.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+
+        misses = len(missing)
+        hits = len(texts) - misses
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+        return [cached[key] for key in keys], hits, misses
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, _, _ = self.embed_documents_with_stats(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, "query", text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            with self._stats_lock:
+                self.hits += 1
+            return cached[key]
+
+        vector = self.backend.embed_query(text)
+        self.cache.put_many({key: vector})
+        with self._stats_lock:
+            self.misses += 1
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, sending the ones missing from the cache to the backend in one batch."""
+        keys = [cache_key(self.model, "query", text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            fresh = dict(zip(missing.keys(), embed_query_batch(self.backend, list(missing.values()))))
+            self.cache.put_many(fresh)
+            cached.update(fresh)
+        with self._stats_lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [cached[key] for key in keys]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.cache)}
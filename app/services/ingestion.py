@@ -1,51 +1,1128 @@
+import atexit
+import hashlib
+import json
 import os
-from typing import List
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.docstore.document import Document
-from app.utils.parsers import parse_file
-
-# Initialize Embeddings
-# Note: Ensure GOOGLE_API_KEY is set in environment variables
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-
-# Global in-memory vector store for cloud deployment
-_vector_store = None
-
-def get_vector_store():
-    """
-    Get or create an in-memory ChromaDB instance.
-    This approach works with cloud platforms that don't support persistent storage.
-    """
-    global _vector_store
-    if _vector_store is None:
-        # Create in-memory ChromaDB (no persist_directory = in-memory)
-        _vector_store = Chroma(embedding_function=embeddings)
-    return _vector_store
-
-def ingest_file(filename: str, content: bytes):
-    text_content = parse_file(filename, content)
-    
-    # Split text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = text_splitter.split_text(text_content)
-    
-    # Create Documents with metadata
-    documents = [
-        Document(page_content=chunk, metadata={"source": filename})
-        for chunk in chunks
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import numpy as np
+from app.utils.parsers import document_type, iter_sections, parse_cache_stats
+from app.services.embeddings import CachedEmbeddings, EmbeddingCache, create_embedding_backend
+from app.services.lexical_index import InvertedIndex
+from app.services.shared_state import SharedState
+from app.services.uploads import Content, content_blocks, content_hash, content_size
+from app.services.vector_index import CompactVectorIndex
+from app.services.metrics import EMBEDDED_CHUNKS, INGEST_BYTES, INGEST_CHUNKS, INGEST_FILES, observe_stage, register_cache, registry, timed
+
+# The embedding client, text splitter, Chroma client and vector stores are
+# created on first use (or by /warmup), so importing the app stays fast and
+# does not need an API key; chromadb and the Gemini SDK are imported then too.
+_embeddings: Optional[CachedEmbeddings] = None
+_text_splitter = None
+_init_lock = threading.Lock()
+
+# Ingestion pipeline settings
+INGEST_PARSE_WORKERS = int(os.environ.get("INGEST_PARSE_WORKERS", "4"))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "100"))
+EMBED_MAX_IN_FLIGHT = int(os.environ.get("EMBED_MAX_IN_FLIGHT", "4"))
+# Characters per chunk, and characters repeated between chunks split from one section
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+# Vector store mode: "memory" keeps the knowledge base in RAM (ephemeral deployments),
+# "persistent" stores vectors and documents under VECTOR_STORE_DIR so restarts keep them.
+VECTOR_STORE_MODE = os.environ.get("VECTOR_STORE_MODE", "memory")
+VECTOR_STORE_DIR = os.environ.get("VECTOR_STORE_DIR", "./chroma_db")
+VECTOR_STORE_SNAPSHOT_DIR = os.environ.get("VECTOR_STORE_SNAPSHOT_DIR", "./chroma_snapshots")
+
+# Vector backend: "chroma" searches Chroma's own full-precision index; "compact"
+# keeps int8/float16 vectors in RAM (see vector_index.py) and re-ranks the best
+# candidates against full-precision vectors memory-mapped from disk, for several
+# times less memory per chunk. Chroma still stores chunk text and metadata. The
+# compact index lives under VECTOR_STORE_DIR in persistent mode, and under
+# VECTOR_INDEX_DIR (default: a temporary directory) in memory mode.
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "")
+
+# Named knowledge bases, one Chroma collection each. The default collection
+# keeps the original Chroma name so existing persistent stores still load.
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME = "knowledge_base"
+_COLLECTION_NAME_RE = re.compile(r"^[a-zA-Z0-9](?:[a-zA-Z0-9_-]{0,46}[a-zA-Z0-9])?$")
+
+# Memory budget for loaded collections. Once it is exceeded, collections idle
+# for at least KB_EVICT_MIN_IDLE_SECONDS are evicted least recently used first:
+# "spill" writes them to KB_SPILL_DIR and reloads them on next use, "drop"
+# discards them. In persistent mode eviction only unloads the in-process
+# indexes, since the data is already on disk.
+KB_MEMORY_BUDGET_MB = float(os.environ.get("KB_MEMORY_BUDGET_MB", "1024"))
+KB_EVICTION_POLICY = os.environ.get("KB_EVICTION_POLICY", "spill")
+KB_SPILL_DIR = os.environ.get("KB_SPILL_DIR", "./chroma_spill")
+KB_EVICT_MIN_IDLE_SECONDS = float(os.environ.get("KB_EVICT_MIN_IDLE_SECONDS", "60"))
+
+# Several uvicorn workers can share one knowledge base in persistent mode.
+# Collection versions, a cross-process write lock and job status live in a
+# small SQLite file next to the store; each worker checks it at most every
+# KB_SYNC_INTERVAL_SECONDS and reloads collections another worker changed.
+KB_SHARED_STATE_PATH = os.environ.get("KB_SHARED_STATE_PATH", "")
+KB_SYNC_INTERVAL_SECONDS = float(os.environ.get("KB_SYNC_INTERVAL_SECONDS", "1.0"))
+
+if VECTOR_STORE_MODE != "persistent" and int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    print("Warning: in-memory vector store with several workers; each worker gets its own knowledge base. "
+          "Set VECTOR_STORE_MODE=persistent to share one.")
+
+# Rough per-chunk costs beyond text and vectors, used for memory accounting:
+# record ids, metadata and HNSW graph links, and one BM25 posting entry
+_RECORD_OVERHEAD_BYTES = 512
+_POSTING_BYTES = 100
+
+# Records read or written per request when paging through the whole store
+_PAGE_SIZE = 1000
+
+# Chroma needs an embedding for every record; with the compact backend it is
+# given this placeholder and the real vectors go to the compact index
+_PLACEHOLDER_EMBEDDING = [0.0]
+# Per-process directory for memory-mode compact indexes, created on first use
+_vector_index_root = None
+
+# Chroma client shared by all collections, created on first use
+_client = None
+# Loaded collections by name
+_collections: Dict[str, "KnowledgeBase"] = {}
+# Incremented whenever a collection's contents change, so caches of answers
+# derived from it can tell when they are stale. Kept across evictions.
+_kb_versions: Dict[str, int] = {}
+# Serializes writes to the vector store from concurrent embedding batches
+_store_lock = threading.RLock()
+# Cross-process coordination, persistent mode only
+_shared = None
+_last_sync = 0.0
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """
+    The shared embedding client (EMBEDDING_BACKEND selects Gemini or offline
+    hash embeddings). Chunks are looked up in the content-addressed cache
+    first, so re-uploading a file only embeds the chunks not seen before.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _init_lock:
+            if _embeddings is None:
+                _embeddings = CachedEmbeddings(*create_embedding_backend(), EmbeddingCache())
+    return _embeddings
+
+def embedding_stats() -> Dict[str, Any]:
+    # Reported on /metrics and /cache/stats without creating the client
+    return _embeddings.stats() if _embeddings is not None else {"hits": 0, "misses": 0, "entries": 0}
+
+register_cache("embeddings", embedding_stats)
+register_cache("parse", parse_cache_stats)
+
+def get_text_splitter():
+    global _text_splitter
+    if _text_splitter is None:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        _text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return _text_splitter
+
+
+class Document:
+    """
+    A chunk and its metadata. It has the fields of langchain's Document,
+    which is not used here because importing it loads most of langchain.
+    """
+
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Optional[Dict[str, Any]] = None):
+        self.page_content = page_content
+        self.metadata = metadata if metadata is not None else {}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Document) and (self.page_content, self.metadata) == (other.page_content, other.metadata)
+
+    def __repr__(self) -> str:
+        return f"Document(page_content={self.page_content!r}, metadata={self.metadata!r})"
+
+
+class KnowledgeBase:
+    """In-process state of one loaded collection."""
+
+    def __init__(self, name: str, vector_store):
+        self.name = name
+        self.vector_store = vector_store
+        # BM25 index over the same chunks, kept in step with the vector store
+        self.lexical_index = None
+        # Chunk ids currently stored for each source filename
+        self.manifest = None
+        # Quantized vectors, with VECTOR_BACKEND=compact
+        self.vector_index = None
+        self.dim = 0
+        self.last_used = time.monotonic()
+        # Ingestions and retrievals in progress; busy collections are never evicted
+        self.busy = 0
+
+    def memory_bytes(self) -> int:
+        """Estimated resident size: vectors, chunk text, BM25 postings and per-record overhead."""
+        count = self.vector_store._collection.count()
+        if VECTOR_BACKEND == "compact":
+            size = count * _RECORD_OVERHEAD_BYTES + (self.vector_index.memory_bytes() if self.vector_index is not None else 0)
+        elif count and not self.dim:
+            sample = self.vector_store._collection.get(limit=1, include=["embeddings"])
+            if len(sample["embeddings"]):
+                self.dim = len(sample["embeddings"][0])
+        if VECTOR_BACKEND != "compact":
+            size = count * (self.dim * 4 + _RECORD_OVERHEAD_BYTES)
+        if self.lexical_index is not None:
+            # Text is held by both Chroma and the lexical index
+            size += 2 * self.lexical_index.text_bytes + self.lexical_index.posting_entries * _POSTING_BYTES
+        return size
+
+
+def validate_collection(name: Optional[str]) -> str:
+    """Return the collection name to use, raising ValueError for invalid names."""
+    name = name or DEFAULT_COLLECTION
+    if not _COLLECTION_NAME_RE.match(name):
+        raise ValueError(
+            f"Invalid collection name: {name!r} (use up to 48 letters, digits, '-' or '_', starting with a letter or digit)"
+        )
+    return name
+
+def _chroma_name(collection: str) -> str:
+    return COLLECTION_NAME if collection == DEFAULT_COLLECTION else f"kb_{collection}"
+
+def _spill_path(collection: str) -> str:
+    return os.path.join(KB_SPILL_DIR, collection)
+
+def _get_client():
+    global _client
+    if _client is None:
+        with _store_lock:
+            if _client is None:
+                import chromadb
+
+                if VECTOR_STORE_MODE == "persistent":
+                    _client = chromadb.PersistentClient(path=VECTOR_STORE_DIR)
+                else:
+                    # Create in-memory ChromaDB (no persist_directory = in-memory)
+                    _client = chromadb.EphemeralClient()
+    return _client
+
+def _open_vector_store(collection: str):
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(
+        client=_get_client(),
+        collection_name=_chroma_name(collection),
+        embedding_function=get_embeddings(),
+    )
+
+def get_shared_state() -> Optional[SharedState]:
+    """The cross-worker coordination database, or None outside persistent mode."""
+    global _shared
+    if _shared is None and VECTOR_STORE_MODE == "persistent":
+        with _store_lock:
+            if _shared is None:
+                os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+                shared = SharedState(KB_SHARED_STATE_PATH or os.path.join(VECTOR_STORE_DIR, "shared_state.sqlite3"))
+                _kb_versions.update(shared.versions())
+                _shared = shared
+    return _shared
+
+def sync_shared_state(force: bool = False):
+    """
+    Pick up changes other worker processes made to the shared store. When a
+    collection's shared version differs from the one this process last saw,
+    the Chroma client is reopened (Chroma only loads other processes' vector
+    index updates from disk on open) and that collection's lexical index and
+    manifest are rebuilt on next use. Checks at most every KB_SYNC_INTERVAL_SECONDS.
+    Reopening relies on chromadb's private SharedSystemClient.clear_system_cache
+    (chromadb 0.5.x), since Chroma has no public way to drop a cached client.
+    May wait on _store_lock, so async handlers must call it off the event loop.
+    """
+    global _client, _last_sync
+    shared = get_shared_state()
+    if shared is None:
+        return
+    now = time.monotonic()
+    if not force and now - _last_sync < KB_SYNC_INTERVAL_SECONDS:
+        return
+    _last_sync = now
+    versions = shared.versions()
+    if all(_kb_versions.get(name, 0) == version for name, version in versions.items()):
+        return
+    with _store_lock:
+        changed = {name for name, version in versions.items() if _kb_versions.get(name, 0) != version}
+        if not changed:
+            return
+        _kb_versions.update({name: versions[name] for name in changed})
+        from chromadb.api.shared_system_client import SharedSystemClient
+
+        SharedSystemClient.clear_system_cache()
+        _client = None
+        for kb in _collections.values():
+            kb.vector_store = _open_vector_store(kb.name)
+            if kb.name in changed:
+                kb.lexical_index = None
+                kb.manifest = None
+                kb.vector_index = None
+
+@contextmanager
+def _store_write():
+    """
+    Serialize a store write within this process and, in persistent mode,
+    across worker processes. The store is synced first so the write applies
+    on top of other workers' changes.
+    """
+    with _store_lock:
+        shared = get_shared_state()
+        if shared is None:
+            yield
+            return
+        with shared.write_lock():
+            sync_shared_state(force=True)
+            yield
+
+def get_knowledge_base(collection: str = DEFAULT_COLLECTION) -> KnowledgeBase:
+    """
+    Get a loaded collection, creating it or reloading it from its spill
+    directory on first use, and mark it as most recently used.
+    """
+    collection = validate_collection(collection)
+    sync_shared_state()
+    kb = _collections.get(collection)
+    if kb is None:
+        with _store_lock:
+            kb = _collections.get(collection)
+            if kb is None:
+                kb = KnowledgeBase(collection, _open_vector_store(collection))
+                spill_path = _spill_path(collection)
+                if os.path.isdir(spill_path):
+                    _load_records(kb, spill_path)
+                    shutil.rmtree(spill_path)
+                _collections[collection] = kb
+                # Build the indexes now so the collection's memory is fully accounted for
+                get_lexical_index(collection)
+                if VECTOR_BACKEND == "compact":
+                    _open_vector_index(kb)
+                enforce_memory_budget(keep=collection)
+    kb.last_used = time.monotonic()
+    return kb
+
+@contextmanager
+def using_collection(collection: str = DEFAULT_COLLECTION) -> Iterator[KnowledgeBase]:
+    """
+    Load a collection and keep it from being evicted until the block exits,
+    so a request reading or writing it never sees it spilled or dropped.
+    """
+    while True:
+        kb = get_knowledge_base(collection)
+        with _store_lock:
+            # Retry if it was evicted between loading and marking it busy
+            if _collections.get(kb.name) is kb:
+                kb.busy += 1
+                break
+    try:
+        yield kb
+    finally:
+        with _store_lock:
+            kb.busy -= 1
+
+def get_vector_store(collection: str = DEFAULT_COLLECTION):
+    """
+    Get or create the ChromaDB collection.
+    In "memory" mode the store lives in RAM, which works with cloud platforms
+    that don't support persistent storage. In "persistent" mode the existing
+    on-disk collection is opened as-is: nothing is re-parsed or re-embedded,
+    and Chroma loads the vector index lazily on the first query.
+    """
+    return get_knowledge_base(collection).vector_store
+
+def get_kb_version(collection: str = DEFAULT_COLLECTION) -> int:
+    sync_shared_state()
+    return _kb_versions.get(collection or DEFAULT_COLLECTION, 0)
+
+def _bump_kb_version(collection: str):
+    with _store_lock:
+        shared = get_shared_state()
+        if shared is not None:
+            # Other workers see the new version and reload the collection
+            _kb_versions[collection] = shared.bump(collection)
+        else:
+            _kb_versions[collection] = _kb_versions.get(collection, 0) + 1
+
+def get_lexical_index(collection: str = DEFAULT_COLLECTION) -> InvertedIndex:
+    """
+    Get the inverted index over a collection's chunks.
+    It is rebuilt from the stored documents when missing (e.g. after a
+    persistent-mode restart, a snapshot restore or a reload from spill);
+    no embedding calls are made.
+    """
+    kb = get_knowledge_base(collection)
+    if kb.lexical_index is None:
+        with _store_lock:
+            if kb.lexical_index is None:
+                index = InvertedIndex()
+                chroma_collection = kb.vector_store._collection
+                count = chroma_collection.count()
+                for offset in range(0, count, _PAGE_SIZE):
+                    page = chroma_collection.get(include=["documents", "metadatas"], limit=_PAGE_SIZE, offset=offset)
+                    index.add_many(page["ids"], page["documents"], page["metadatas"])
+                kb.lexical_index = index
+    return kb.lexical_index
+
+def get_vector_index(collection: str = DEFAULT_COLLECTION) -> CompactVectorIndex:
+    """The compact backend's vector index for a collection."""
+    return _open_vector_index(get_knowledge_base(collection))
+
+def _open_vector_index(kb: KnowledgeBase) -> CompactVectorIndex:
+    """
+    Open a collection's compact index from its directory on first use. A
+    collection whose vectors are stored in Chroma (created before
+    VECTOR_BACKEND was switched to compact) is indexed from them once.
+    """
+    if kb.vector_index is None:
+        with _store_lock:
+            if kb.vector_index is None:
+                index = CompactVectorIndex(_vector_index_path(kb.name))
+                if not len(index):
+                    chroma_collection = kb.vector_store._collection
+                    count = chroma_collection.count()
+                    for offset in range(0, count, _PAGE_SIZE):
+                        page = chroma_collection.get(include=["embeddings"], limit=_PAGE_SIZE, offset=offset)
+                        full = [(doc_id, vector) for doc_id, vector in zip(page["ids"], page["embeddings"]) if len(vector) > 1]
+                        if full:
+                            index.add_many([doc_id for doc_id, _ in full], [vector for _, vector in full])
+                kb.vector_index = index
+    return kb.vector_index
+
+def _vector_index_path(collection: str) -> str:
+    global _vector_index_root
+    if VECTOR_STORE_MODE == "persistent":
+        return os.path.join(VECTOR_STORE_DIR, "vectors", _chroma_name(collection))
+    if _vector_index_root is None:
+        if VECTOR_INDEX_DIR:
+            os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
+        # Unique to this process, like the in-memory store itself
+        _vector_index_root = tempfile.mkdtemp(prefix="vectors-", dir=VECTOR_INDEX_DIR or None)
+        atexit.register(shutil.rmtree, _vector_index_root, True)
+    return os.path.join(_vector_index_root, collection)
+
+def get_manifest(collection: str = DEFAULT_COLLECTION) -> Dict[str, Set[str]]:
+    """
+    Get the per-source manifest of stored chunk ids, rebuilding it from the
+    store's metadata when missing.
+    """
+    kb = get_knowledge_base(collection)
+    if kb.manifest is None:
+        with _store_lock:
+            if kb.manifest is None:
+                manifest = {}
+                chroma_collection = kb.vector_store._collection
+                count = chroma_collection.count()
+                for offset in range(0, count, _PAGE_SIZE):
+                    page = chroma_collection.get(include=["metadatas"], limit=_PAGE_SIZE, offset=offset)
+                    for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                        manifest.setdefault(metadata["source"], set()).add(doc_id)
+                kb.manifest = manifest
+    return kb.manifest
+
+def enforce_memory_budget(keep: Optional[str] = None) -> List[str]:
+    """
+    Evict idle collections, least recently used first, until the loaded
+    collections fit in KB_MEMORY_BUDGET_MB. `keep` is never evicted.
+    Returns the names of the evicted collections.
+    """
+    budget = KB_MEMORY_BUDGET_MB * 1024 * 1024
+    evicted = []
+    with _store_lock:
+        sizes = {name: kb.memory_bytes() for name, kb in _collections.items()}
+        total = sum(sizes.values())
+        now = time.monotonic()
+        for name, kb in sorted(_collections.items(), key=lambda item: item[1].last_used):
+            if total <= budget:
+                break
+            if name == keep or kb.busy or now - kb.last_used < KB_EVICT_MIN_IDLE_SECONDS:
+                continue
+            _evict(kb)
+            total -= sizes[name]
+            evicted.append(name)
+    if evicted:
+        print(f"Evicted idle collections over the memory budget: {evicted}")
+    return evicted
+
+def _evict(kb: KnowledgeBase):
+    if VECTOR_STORE_MODE != "persistent":
+        if KB_EVICTION_POLICY == "spill":
+            path = _spill_path(kb.name)
+            tmp_path = path + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            count = _dump_records(kb, tmp_path)
+            with open(os.path.join(tmp_path, "spill.json"), "w", encoding="utf-8") as f:
+                json.dump({"collection": kb.name, "count": count, "spilled_at": time.time()}, f)
+            os.rename(tmp_path, path)
+        else:
+            # Dropped data is gone, so answers cached against it are stale
+            _bump_kb_version(kb.name)
+        kb.vector_store.delete_collection()
+        if kb.vector_index is not None:
+            kb.vector_index.clear()
+    del _collections[kb.name]
+
+def list_collections() -> List[Dict[str, Any]]:
+    """
+    Loaded, spilled and (in persistent mode) on-disk collections with their
+    chunk and source counts and estimated memory use.
+    """
+    collections = {}
+    now = time.monotonic()
+    with _store_lock:
+        for name, kb in _collections.items():
+            collections[name] = {
+                "name": name,
+                "state": "loaded",
+                "chunks": kb.vector_store._collection.count(),
+                "sources": len(kb.manifest) if kb.manifest is not None else None,
+                "memory_bytes": kb.memory_bytes(),
+                "idle_seconds": round(now - kb.last_used, 1),
+                "busy": kb.busy > 0,
+            }
+    if os.path.isdir(KB_SPILL_DIR):
+        for name in sorted(os.listdir(KB_SPILL_DIR)):
+            info_path = os.path.join(KB_SPILL_DIR, name, "spill.json")
+            if name not in collections and os.path.isfile(info_path):
+                with open(info_path, encoding="utf-8") as f:
+                    info = json.load(f)
+                collections[name] = {"name": name, "state": "spilled", "chunks": info["count"], "memory_bytes": 0}
+    if VECTOR_STORE_MODE == "persistent":
+        for chroma_collection in _get_client().list_collections():
+            # Chroma 0.5 returns collection objects, later versions return names
+            chroma_name = getattr(chroma_collection, "name", chroma_collection)
+            if chroma_name == COLLECTION_NAME:
+                name = DEFAULT_COLLECTION
+            elif chroma_name.startswith("kb_"):
+                name = chroma_name[3:]
+            else:
+                continue
+            collections.setdefault(name, {"name": name, "state": "on_disk", "memory_bytes": 0})
+    return sorted(collections.values(), key=lambda entry: entry["name"])
+
+def memory_usage() -> Dict[str, Any]:
+    with _store_lock:
+        used = sum(kb.memory_bytes() for kb in _collections.values())
+    return {
+        "memory_bytes": used,
+        "budget_bytes": int(KB_MEMORY_BUDGET_MB * 1024 * 1024),
+        "loaded_collections": len(_collections),
+        "eviction_policy": KB_EVICTION_POLICY,
+        "vector_backend": VECTOR_BACKEND,
+    }
+
+def _collect_memory_metrics():
+    with _store_lock:
+        samples = [({"collection": name}, kb.memory_bytes()) for name, kb in _collections.items()]
+    return [
+        ("qa_kb_memory_bytes", "gauge", "Estimated memory used by each loaded collection", samples),
+        ("qa_kb_memory_budget_bytes", "gauge", "Memory budget for loaded collections", [({}, KB_MEMORY_BUDGET_MB * 1024 * 1024)]),
+    ]
+
+registry.add_collector(_collect_memory_metrics)
+
+def chunk_id(source: str, text: str) -> str:
+    """
+    Chunk ids are content hashes scoped to their source, so re-uploading a
+    file maps unchanged chunks onto the ids that are already stored.
+    """
+    return hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+def iter_chunks(sections: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    """
+    Turn parsed (heading path, text) sections into (section, chunk) pairs.
+    Chunks never span two long sections: a section longer than CHUNK_SIZE is
+    split on its own, and consecutive short sections are packed together up
+    to CHUNK_SIZE, labelled with the first one's heading path.
+    """
+    pending: List[str] = []
+    pending_section = ""
+    pending_size = 0
+    for section, text in sections:
+        if len(text) > CHUNK_SIZE:
+            if pending:
+                yield pending_section, "\n\n".join(pending)
+                pending, pending_size = [], 0
+            for piece in get_text_splitter().split_text(text):
+                yield section, piece
+            continue
+        if pending and pending_size + 2 + len(text) > CHUNK_SIZE:
+            yield pending_section, "\n\n".join(pending)
+            pending, pending_size = [], 0
+        if not pending:
+            pending_section = section
+        pending.append(text)
+        pending_size += len(text) + (2 if pending_size else 0)
+    if pending:
+        yield pending_section, "\n\n".join(pending)
+
+def chunk_sections(sections: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return list(iter_chunks(sections))
+
+def iter_file_documents(filename: str, content: Content, ingested_at: Optional[float] = None) -> Iterator[Document]:
+    """
+    Parse a file and yield chunk Documents. Their metadata records the
+    source, its document type, the heading path (or JSON key path) of the
+    section the chunk comes from, the ingest time (Unix seconds) and the
+    SHA-256 of the file. Uploads stored on disk are read in blocks, so
+    chunks are produced while the file is still being read and the file is
+    never held in memory as a whole.
+    """
+    INGEST_BYTES.inc(content_size(content))
+    digest = content_hash(content)
+    file_metadata = {
+        "source": filename,
+        "doc_type": document_type(filename),
+        "ingested_at": round(time.time() if ingested_at is None else ingested_at, 3),
+        "content_hash": digest,
+    }
+    parse_seconds = [0.0]
+    sections = _timed_iter(iter_sections(filename, content_blocks(content), digest), parse_seconds)
+    split_seconds = [0.0]
+    chunks = _timed_iter(iter_chunks(sections), split_seconds)
+    try:
+        for section, chunk in chunks:
+            INGEST_CHUNKS.inc()
+            yield Document(page_content=chunk, metadata={**file_metadata, "section": section})
+    finally:
+        observe_stage("parse", parse_seconds[0])
+        # Splitting time excludes the parsing it drives
+        observe_stage("split", split_seconds[0] - parse_seconds[0])
+
+def _timed_iter(iterable: Iterable, seconds: List[float]) -> Iterator:
+    """Yield from `iterable`, adding the time spent producing its items to `seconds[0]`."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            seconds[0] += time.perf_counter() - start
+            return
+        seconds[0] += time.perf_counter() - start
+        yield item
+
+def split_file(filename: str, content: Content) -> List[Document]:
+    return list(iter_file_documents(filename, content))
+
+def ingest_file(filename: str, content: Content, collection: str = DEFAULT_COLLECTION):
+    result = ingest_files([(filename, content)], collection=collection)
+    file_result = result["files"][0]
+    if file_result["status"] != "ingested":
+        raise RuntimeError(file_result["error"])
+    
+    return {
+        "chunks": file_result["chunks"],
+        "added": file_result["added"],
+        "removed": file_result["removed"],
+        "cache_hits": result["cache_hits"],
+        "cache_misses": result["cache_misses"],
+    }
+
+class IngestionCancelled(Exception):
+    pass
+
+def ingest_files(
+    files: List[Tuple[str, Content]],
+    progress: Optional[Callable[[int, int], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    collection: str = DEFAULT_COLLECTION,
+) -> Dict[str, Any]:
+    """
+    Ingest several files as one streaming pipeline:
+    1. Parse and chunk files concurrently on a worker pool; each file's
+       chunks are produced as it is read (see iter_file_documents).
+    2. Pack chunks from all files into batches of EMBED_BATCH_SIZE as they
+       arrive.
+    3. Embed up to EMBED_MAX_IN_FLIGHT batches at a time and write each batch
+       to the vector store in a single bulk call. Parsing waits while too
+       many batches are queued, so memory use stays flat however large the
+       files are.
+    A file that fails at any stage is reported as failed and its partially
+    written chunks are removed; the other files are unaffected.
+    
+    Content is either bytes or a StoredUpload spooled to disk by /ingest/.
+    
+    Re-uploading a source is an upsert: its new chunks are diffed against the
+    manifest, only added chunks are embedded and written, and chunks no longer
+    present are deleted once the new version is fully stored.
+    
+    `progress(files_done, chunks_embedded)` is called with increments as work
+    completes. Setting `cancel_event` stops the pipeline between batches; files
+    that had not finished are reported as cancelled and rolled back.
+    
+    Files are ingested into `collection`, which is kept loaded while the
+    pipeline runs; afterwards the memory budget is enforced.
+    """
+    collection = validate_collection(collection)
+    try:
+        with using_collection(collection) as kb:
+            return _ingest_files(files, progress, cancel_event, kb)
+    finally:
+        enforce_memory_budget(keep=collection)
+
+def _ingest_files(
+    files: List[Tuple[str, Content]],
+    progress: Optional[Callable[[int, int], None]],
+    cancel_event: Optional[threading.Event],
+    kb: KnowledgeBase,
+) -> Dict[str, Any]:
+    results = [
+        {"filename": filename, "status": "pending", "chunks": 0, "added": 0, "removed": 0, "unchanged": 0}
+        for filename, _ in files
+    ]
+    written_ids = [[] for _ in files]
+    new_ids = [set() for _ in files]
+    removed_ids = [set() for _ in files]
+    # Unchanged chunks whose metadata (file hash, section) is out of date
+    restamped: List[List[Tuple[str, Dict[str, Any]]]] = [[] for _ in files]
+    # Chunks of each file handed to the embedding stage but not yet written
+    pending = [0 for _ in files]
+    cache_hits = 0
+    cache_misses = 0
+    
+    def cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+    
+    def report(files_done: int, chunks_embedded: int):
+        if progress is not None and (files_done or chunks_embedded):
+            progress(files_done, chunks_embedded)
+    
+    def fail(index: int, error: Exception):
+        if results[index]["status"] == "pending":
+            results[index]["status"] = "cancelled" if isinstance(error, IngestionCancelled) else "failed"
+            results[index]["error"] = str(error)
+            report(1, 0)
+    
+    def embed_batch(documents: List[Document]):
+        if cancelled():
+            raise IngestionCancelled("Ingestion cancelled")
+        return _embed_and_store(kb, documents)
+    
+    # Parse threads and embedding callbacks report to the calling thread,
+    # which owns `results`
+    events: "queue.Queue[Tuple[str, List[int], Future]]" = queue.Queue()
+    batch: List[Tuple[int, Document]] = []
+    batch_lock = threading.Lock()
+    in_flight = threading.Semaphore(EMBED_MAX_IN_FLIGHT * 2)
+    submitted = [0]
+    
+    with ThreadPoolExecutor(max_workers=INGEST_PARSE_WORKERS) as parse_pool, \
+            ThreadPoolExecutor(max_workers=EMBED_MAX_IN_FLIGHT) as embed_pool:
+        
+        def submit(documents: List[Tuple[int, Document]]):
+            # Blocks while enough batches are queued or embedding
+            in_flight.acquire()
+            owners = [index for index, _ in documents]
+            future = embed_pool.submit(embed_batch, [doc for _, doc in documents])
+            
+            def done(future: Future):
+                in_flight.release()
+                events.put(("embedded", owners, future))
+            future.add_done_callback(done)
+        
+        def parse(index: int, filename: str, content: Content) -> int:
+            nonlocal batch
+            if cancelled():
+                raise IngestionCancelled("Ingestion cancelled")
+            with _store_lock:
+                stored = get_manifest(kb.name).get(filename, set())
+            lexical_index = get_lexical_index(kb.name)
+            ingested_at = time.time()
+            added = 0
+            for doc in iter_file_documents(filename, content, ingested_at):
+                if cancelled():
+                    raise IngestionCancelled("Ingestion cancelled")
+                doc_id = chunk_id(filename, doc.page_content)
+                if doc_id in new_ids[index]:
+                    # Identical chunk repeated within the file
+                    continue
+                new_ids[index].add(doc_id)
+                if doc_id in stored:
+                    if doc_id in lexical_index and _metadata_changed(lexical_index.get(doc_id)[1], doc.metadata):
+                        restamped[index].append((doc_id, doc.metadata))
+                    continue
+                added += 1
+                full = None
+                with batch_lock:
+                    batch.append((index, doc))
+                    pending[index] += 1
+                    if len(batch) >= EMBED_BATCH_SIZE:
+                        full, batch = batch, []
+                        submitted[0] += 1
+                if full:
+                    submit(full)
+            removed_ids[index] = stored - new_ids[index]
+            return added
+        
+        for index, (filename, content) in enumerate(files):
+            future = parse_pool.submit(parse, index, filename, content)
+            future.add_done_callback(lambda future, index=index: events.put(("parsed", [index], future)))
+        
+        parsing = len(files)
+        parsed = [False for _ in files]
+        embedded = 0
+        while parsing or embedded < submitted[0]:
+            kind, owners, future = events.get()
+            files_done = 0
+            if kind == "parsed":
+                index = owners[0]
+                parsing -= 1
+                parsed[index] = True
+                try:
+                    added = future.result()
+                except Exception as e:
+                    fail(index, e)
+                else:
+                    results[index].update(
+                        chunks=len(new_ids[index]),
+                        added=added,
+                        removed=len(removed_ids[index]),
+                        unchanged=len(new_ids[index]) - added,
+                    )
+                if parsing == 0 and not cancelled():
+                    # The last, partial batch
+                    with batch_lock:
+                        full, batch = batch, []
+                        submitted[0] += 1 if full else 0
+                    if full:
+                        submit(full)
+            else:
+                embedded += 1
+                try:
+                    ids, hits, misses = future.result()
+                except Exception as e:
+                    for index in set(owners):
+                        fail(index, e)
+                    ids = []
+                else:
+                    cache_hits += hits
+                    cache_misses += misses
+                    for index, doc_id in zip(owners, ids):
+                        written_ids[index].append(doc_id)
+                with batch_lock:
+                    for index in owners:
+                        pending[index] -= 1
+            for index in set(owners):
+                with batch_lock:
+                    done = parsed[index] and pending[index] == 0
+                if done and results[index]["status"] == "pending":
+                    results[index]["status"] = "ingested"
+                    files_done += 1
+            report(files_done, len(ids) if kind == "embedded" else 0)
+    
+    changed = any(written_ids)
+    for index, result in enumerate(results):
+        if result["status"] == "pending":
+            # Chunks never reached the embedding stage because the job was cancelled
+            fail(index, IngestionCancelled("Ingestion cancelled"))
+        if result["status"] == "ingested":
+            # The new version is fully stored: drop chunks it no longer contains
+            with _store_lock:
+                if removed_ids[index]:
+                    delete_documents(list(removed_ids[index]), kb.name)
+                    changed = True
+                if restamped[index]:
+                    update_document_metadata(*map(list, zip(*restamped[index])), kb.name)
+                    changed = True
+                get_manifest(kb.name)[result["filename"]] = new_ids[index]
+        else:
+            result.update(chunks=0, added=0, removed=0, unchanged=0)
+            if written_ids[index]:
+                delete_documents(written_ids[index], kb.name)
+    if changed:
+        _bump_kb_version(kb.name)
+    for result in results:
+        INGEST_FILES.inc(status=result["status"])
+    
+    return {
+        "collection": kb.name,
+        "files": results,
+        "total_chunks": sum(result["chunks"] for result in results),
+        "cache_hits": cache_hits,
+        "cache_misses": cache_misses,
+    }
+
+def _metadata_changed(stored: Dict[str, Any], new: Dict[str, Any]) -> bool:
+    # The ingest time of an unchanged file's chunks is kept
+    return any(stored.get(key) != value for key, value in new.items() if key != "ingested_at")
+
+def _embed_and_store(kb: KnowledgeBase, documents: List[Document]):
+    with timed("embed"):
+        vectors, hits, misses = get_embeddings().embed_documents_with_stats(
+            [doc.page_content for doc in documents]
+        )
+    with timed("store"):
+        ids = add_embedded_documents(documents, vectors, kb.name)
+    EMBEDDED_CHUNKS.inc(len(ids))
+    return ids, hits, misses
+
+def add_embedded_documents(documents: List[Document], vectors: List[List[float]], collection: str = DEFAULT_COLLECTION) -> List[str]:
+    """
+    Write documents whose embeddings are already computed, so the store
+    does not call the embedding backend a second time.
+    """
+    if not documents:
+        return []
+    texts = [doc.page_content for doc in documents]
+    metadatas = [doc.metadata for doc in documents]
+    ids = [chunk_id(metadata["source"], text) for text, metadata in zip(texts, metadatas)]
+    kb = get_knowledge_base(collection)
+    with _store_write():
+        embeddings = vectors
+        if VECTOR_BACKEND == "compact":
+            _open_vector_index(kb).add_many(ids, vectors)
+            embeddings = [_PLACEHOLDER_EMBEDDING] * len(ids)
+        kb.vector_store._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+        get_lexical_index(collection).add_many(ids, texts, metadatas)
+        kb.dim = len(vectors[0])
+    return ids
+
+def update_document_metadata(ids: List[str], metadatas: List[Dict[str, Any]], collection: str = DEFAULT_COLLECTION):
+    """Replace the metadata of stored chunks without re-embedding them."""
+    kb = get_knowledge_base(collection)
+    with _store_write():
+        for start in range(0, len(ids), _PAGE_SIZE):
+            kb.vector_store._collection.update(ids=ids[start:start + _PAGE_SIZE], metadatas=metadatas[start:start + _PAGE_SIZE])
+        lexical_index = get_lexical_index(collection)
+        for doc_id, metadata in zip(ids, metadatas):
+            lexical_index.update_metadata(doc_id, metadata)
+
+def delete_documents(ids: List[str], collection: str = DEFAULT_COLLECTION):
+    kb = get_knowledge_base(collection)
+    with _store_write():
+        kb.vector_store._collection.delete(ids=ids)
+        if VECTOR_BACKEND == "compact":
+            _open_vector_index(kb).remove_many(ids)
+        lexical_index = get_lexical_index(collection)
+        for doc_id in ids:
+            lexical_index.remove(doc_id)
+
+def list_sources(collection: str = DEFAULT_COLLECTION) -> List[Dict[str, Any]]:
+    """Sources of a collection with their chunk counts, document type, file hash and ingest time."""
+    collection = validate_collection(collection)
+    groups = get_lexical_index(collection).groups("source")
+    return [
+        {
+            "source": source,
+            "chunks": chunks,
+            "doc_type": metadata.get("doc_type"),
+            "content_hash": metadata.get("content_hash"),
+            "ingested_at": metadata.get("ingested_at"),
+        }
+        for source, (chunks, metadata) in sorted(groups.items())
     ]
+
+def delete_source(source: str, collection: str = DEFAULT_COLLECTION) -> int:
+    """
+    Remove one source's chunks from a collection, leaving the rest in place.
+    Returns the number of chunks removed; raises KeyError for an unknown source.
+    """
+    collection = validate_collection(collection)
+    with _store_lock:
+        manifest = get_manifest(collection)
+        if source not in manifest:
+            raise KeyError(source)
+        ids = list(manifest[source])
+        delete_documents(ids, collection)
+        del manifest[source]
+    _bump_kb_version(collection)
+    return len(ids)
+
+def reindex_source(source: str, collection: str = DEFAULT_COLLECTION) -> Dict[str, Any]:
+    """
+    Rebuild one source's index entries from its stored chunks: re-embed them
+    (with the current embedding model; unchanged vectors come from the
+    embedding cache), rewrite their vectors, BM25 postings and metadata, and
+    stamp them with the current time. Chunks stored before metadata was
+    recorded get their document type. Raises KeyError for an unknown source.
+    """
+    collection = validate_collection(collection)
+    kb = get_knowledge_base(collection)
+    with _store_lock:
+        manifest = get_manifest(collection)
+        if source not in manifest:
+            raise KeyError(source)
+        ids = sorted(manifest[source])
+        kb.busy += 1
+    try:
+        ingested_at = round(time.time(), 3)
+        cache_hits = cache_misses = 0
+        for start in range(0, len(ids), EMBED_BATCH_SIZE):
+            page = kb.vector_store._collection.get(ids=ids[start:start + EMBED_BATCH_SIZE], include=["documents", "metadatas"])
+            documents = [
+                Document(
+                    page_content=text,
+                    metadata={"doc_type": document_type(source), **metadata, "ingested_at": ingested_at},
+                )
+                for text, metadata in zip(page["documents"], page["metadatas"])
+            ]
+            _, hits, misses = _embed_and_store(kb, documents)
+            cache_hits += hits
+            cache_misses += misses
+    finally:
+        with _store_lock:
+            kb.busy -= 1
+        enforce_memory_budget(keep=collection)
+    _bump_kb_version(collection)
+    return {"source": source, "chunks": len(ids), "cache_hits": cache_hits, "cache_misses": cache_misses}
+
+def clear_knowledge_base(collection: str = DEFAULT_COLLECTION):
+    """
+    Clear one collection by dropping it from the store and unloading it, so
+    other collections are unaffected. In persistent mode this also removes
+    the data on disk; any spilled copy is deleted too.
+    """
+    collection = validate_collection(collection)
+    with _store_write():
+        kb = _collections.pop(collection, None)
+        if kb is not None:
+            kb.vector_store.delete_collection()
+        else:
+            try:
+                _get_client().delete_collection(_chroma_name(collection))
+            except Exception:
+                # Nothing stored under this name
+                pass
+        if kb is not None and kb.vector_index is not None:
+            kb.vector_index.clear()
+        elif VECTOR_BACKEND == "compact":
+            shutil.rmtree(_vector_index_path(collection), ignore_errors=True)
+        shutil.rmtree(_spill_path(collection), ignore_errors=True)
+        _bump_kb_version(collection)
+
+def _dump_records(kb: KnowledgeBase, path: str) -> int:
+    """
+    Write every record of a collection to `path`: embeddings as a float32
+    .npy array and documents/metadata as JSON lines. Dumps hold full vectors
+    with either vector backend.
+    """
+    chroma_collection = kb.vector_store._collection
+    count = chroma_collection.count()
+    vectors = []
+    with open(os.path.join(path, "records.jsonl"), "w", encoding="utf-8") as records:
+        for offset in range(0, count, _PAGE_SIZE):
+            page = chroma_collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=_PAGE_SIZE,
+                offset=offset,
+            )
+            for doc_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                records.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}) + "\n")
+            if VECTOR_BACKEND == "compact":
+                vectors.extend(_open_vector_index(kb).get_vectors(page["ids"]))
+            else:
+                vectors.extend(page["embeddings"])
+    np.save(os.path.join(path, "embeddings.npy"), np.asarray(vectors, dtype=np.float32))
+    return count
+
+def _load_records(kb: KnowledgeBase, path: str):
+    """Add the records written by `_dump_records` to a collection."""
+    # Memory-map the vectors so large dumps are streamed into the store
+    vectors = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    with open(os.path.join(path, "records.jsonl"), encoding="utf-8") as records:
+        page = []
+        offset = 0
+        for line in records:
+            page.append(json.loads(line))
+            if len(page) >= _PAGE_SIZE:
+                _restore_page(kb, page, vectors[offset:offset + len(page)])
+                offset += len(page)
+                page = []
+        if page:
+            _restore_page(kb, page, vectors[offset:offset + len(page)])
+
+def create_snapshot(collection: str = DEFAULT_COLLECTION) -> Dict[str, Any]:
+    """
+    Write a consistent backup of a collection to VECTOR_STORE_SNAPSHOT_DIR.
+    Store writes are blocked while the snapshot is taken, in every worker
+    process in persistent mode (see _store_write).
+    """
+    collection = validate_collection(collection)
+    name = time.strftime("%Y%m%d-%H%M%S") + f"-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(VECTOR_STORE_SNAPSHOT_DIR, name)
+    tmp_path = path + ".tmp"
+    os.makedirs(tmp_path)
     
-    # Add to Vector Store
-    vector_store = get_vector_store()
-    vector_store.add_documents(documents)
+    with _store_write():
+        count = _dump_records(get_knowledge_base(collection), tmp_path)
     
-    return len(documents)
+    info = {"name": name, "created_at": time.time(), "count": count, "mode": VECTOR_STORE_MODE, "collection": collection}
+    with open(os.path.join(tmp_path, "snapshot.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    # Only complete snapshots are visible under their final name
+    os.rename(tmp_path, path)
+    return info
 
-def clear_knowledge_base():
+def list_snapshots(collection: Optional[str] = None) -> List[Dict[str, Any]]:
+    """List snapshots, optionally only those taken of `collection`."""
+    if not os.path.isdir(VECTOR_STORE_SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(VECTOR_STORE_SNAPSHOT_DIR)):
+        info_path = os.path.join(VECTOR_STORE_SNAPSHOT_DIR, name, "snapshot.json")
+        if os.path.isfile(info_path):
+            with open(info_path, encoding="utf-8") as f:
+                info = json.load(f)
+            # Snapshots taken before collections existed belong to the default one
+            info.setdefault("collection", DEFAULT_COLLECTION)
+            if collection is None or info["collection"] == collection:
+                snapshots.append(info)
+    return snapshots
+
+def restore_snapshot(name: str, collection: Optional[str] = None) -> Dict[str, Any]:
     """
-    Clear the in-memory knowledge base by resetting the global vector store.
+    Replace a collection with the contents of a snapshot: the collection the
+    snapshot was taken of, or `collection` if given.
+    Raises KeyError if no snapshot with that name exists.
     """
-    global _vector_store
-    _vector_store = None
+    info = next((snapshot for snapshot in list_snapshots() if snapshot["name"] == name), None)
+    if info is None:
+        raise KeyError(name)
+    target = validate_collection(collection or info["collection"])
+    
+    with _store_write():
+        clear_knowledge_base(target)
+        kb = get_knowledge_base(target)
+        _load_records(kb, os.path.join(VECTOR_STORE_SNAPSHOT_DIR, name))
+        # The lexical index and manifest are rebuilt from the restored documents on next use
+        kb.lexical_index = None
+        kb.manifest = None
+    _bump_kb_version(target)
+    return {**info, "restored_to": target}
+
+def _restore_page(kb: KnowledgeBase, page: List[Dict[str, Any]], vectors):
+    ids = [record["id"] for record in page]
+    if VECTOR_BACKEND == "compact":
+        _open_vector_index(kb).add_many(ids, vectors)
+        embeddings = [_PLACEHOLDER_EMBEDDING] * len(ids)
+    else:
+        embeddings = np.asarray(vectors).tolist()
+    kb.vector_store._collection.add(
+        ids=ids,
+        embeddings=embeddings,
+        documents=[record["document"] for record in page],
+        metadatas=[record["metadata"] for record in page],
+    )
+
+def delete_snapshot(name: str):
+    if name not in {snapshot["name"] for snapshot in list_snapshots()}:
+        raise KeyError(name)
+    shutil.rmtree(os.path.join(VECTOR_STORE_SNAPSHOT_DIR, name))
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.ingestion import DEFAULT_COLLECTION, get_shared_state, ingest_files
+from app.services.uploads import Content, remove_uploads
+
+# Ingestion jobs run off the event loop on a small, bounded executor so that
+# large uploads cannot starve query endpoints of CPU or embedding quota.
+INGEST_JOB_WORKERS = int(os.environ.get("INGEST_JOB_WORKERS", "1"))
+INGEST_MAX_PENDING_JOBS = int(os.environ.get("INGEST_MAX_PENDING_JOBS", "20"))
+INGEST_JOB_HISTORY = int(os.environ.get("INGEST_JOB_HISTORY", "100"))
+# With several workers sharing a persistent store, job status is published to
+# the shared state at most this often while a job runs
+INGEST_JOB_PUBLISH_INTERVAL = float(os.environ.get("INGEST_JOB_PUBLISH_INTERVAL", "0.5"))
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_JOB_WORKERS, thread_name_prefix="ingest-job")
+_jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class IngestionJob:
+    def __init__(self, files: List[Tuple[str, Content]], collection: str = DEFAULT_COLLECTION):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.collection = collection
+        self.filenames = [filename for filename, _ in files]
+        self.files_total = len(files)
+        self.files_done = 0
+        self.chunks_embedded = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self._files = files
+        self._lock = threading.Lock()
+        self._published_at = 0.0
+
+    def _progress(self, files_done: int, chunks_embedded: int):
+        with self._lock:
+            self.files_done += files_done
+            self.chunks_embedded += chunks_embedded
+        self._publish()
+
+    def _publish(self, force: bool = False):
+        """Share this job's status with other workers, and pick up cancel requests made through them."""
+        shared = get_shared_state()
+        if shared is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._published_at < INGEST_JOB_PUBLISH_INTERVAL:
+            return
+        self._published_at = now
+        if self.status in ACTIVE_STATUSES and shared.cancel_requested(self.id):
+            self.cancel_event.set()
+        shared.publish_job(self.id, self.to_dict(), INGEST_JOB_HISTORY)
+
+    def run(self):
+        # Picks up a cancel request made through another worker while queued
+        self._publish(force=True)
+        if self.cancel_event.is_set():
+            self._finish("cancelled")
+            return
+        self.status = "running"
+        self.started_at = time.time()
+        self._publish(force=True)
+        try:
+            self.result = ingest_files(
+                self._files, progress=self._progress, cancel_event=self.cancel_event, collection=self.collection
+            )
+        except Exception as e:
+            self.error = str(e)
+            self._finish("failed")
+            return
+        # A cancel that arrives after the last file was stored abandons nothing
+        abandoned = any(file["status"] == "cancelled" for file in self.result["files"])
+        self._finish("cancelled" if abandoned else "completed")
+
+    def _finish(self, status: str):
+        self.status = status
+        self.finished_at = time.time()
+        # Uploaded files are no longer needed once the job is done
+        if self._files:
+            remove_uploads(content for _, content in self._files)
+        self._files = None
+        self._publish(force=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "collection": self.collection,
+            "files": self.filenames,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "chunks_embedded": self.chunks_embedded,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput": {
+                "files_per_second": round(self.files_done / elapsed, 2) if elapsed else 0.0,
+                "chunks_per_second": round(self.chunks_embedded / elapsed, 2) if elapsed else 0.0,
+            },
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class RemoteJob:
+    """Status of a job running in another worker process, as last published."""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data["job_id"]
+        self.status = data["status"]
+        self._data = data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._data
+
+
+def submit_ingestion(files: List[Tuple[str, Content]], collection: str = DEFAULT_COLLECTION) -> IngestionJob:
+    """
+    Queue an ingestion job into `collection` and return immediately.
+    Raises JobQueueFull when too many jobs are already waiting or running.
+    """
+    job = IngestionJob(files, collection)
+    with _jobs_lock:
+        active = sum(1 for existing in _jobs.values() if existing.status in ACTIVE_STATUSES)
+        if active >= INGEST_MAX_PENDING_JOBS:
+            raise JobQueueFull(f"Too many ingestion jobs in progress ({active})")
+        _jobs[job.id] = job
+        _prune_history()
+    job._publish(force=True)
+    job.future = _executor.submit(job.run)
+    return job
+
+
+def _prune_history():
+    finished = [job_id for job_id, job in _jobs.items() if job.status not in ACTIVE_STATUSES]
+    for job_id in finished[:max(0, len(_jobs) - INGEST_JOB_HISTORY)]:
+        del _jobs[job_id]
+
+
+def get_job(job_id: str):
+    """A job of this worker, or the published status of one in another worker."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    shared = get_shared_state()
+    data = shared.get_job(job_id) if shared is not None else None
+    return RemoteJob(data) if data is not None else None
+
+
+def list_jobs() -> List[Any]:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    shared = get_shared_state()
+    if shared is not None:
+        local_ids = {job.id for job in jobs}
+        jobs.extend(RemoteJob(data) for job_id, data in shared.list_jobs().items() if job_id not in local_ids)
+        jobs.sort(key=lambda job: job.to_dict()["created_at"])
+    return jobs
+
+
+def cancel_job(job_id: str) -> Optional[IngestionJob]:
+    """
+    Request cancellation. A queued job is cancelled at once; a running job
+    stops after its in-flight embedding batches and rolls back unfinished files.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return None
+    if isinstance(job, RemoteJob):
+        # The owning worker sees the request when it next reports progress
+        get_shared_state().request_cancel(job_id)
+        return RemoteJob(get_shared_state().get_job(job_id))
+    job.cancel_event.set()
+    if job.future is not None and job.future.cancel():
+        job._finish("cancelled")
+    return job
@@ -0,0 +1,238 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Identifiers such as SAVE15 or pay-now-btn are kept whole; hyphenated and
+# underscored tokens are also indexed by their parts.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_][a-z0-9]+)*")
+_PART_RE = re.compile(r"[-_]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it of on or that the this "
+    "to was were what when where which will with all any can do does should".split()
+)
+
+
+# Chunk metadata fields with an exact-match filter index
+FILTER_FIELDS = ("source", "doc_type", "section", "content_hash")
+# Range filters on the ingest time (Unix seconds)
+RANGE_FILTERS = {"ingested_after": "ingested_at", "ingested_before": "ingested_at"}
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if "-" in token or "_" in token:
+            tokens.extend(part for part in _PART_RE.split(token) if part)
+    return tokens
+
+
+def query_terms(text: str) -> List[str]:
+    """Distinct, non-stopword terms of a query, in order of appearance."""
+    return list(dict.fromkeys(token for token in tokenize(text) if token not in STOPWORDS))
+
+
+def validate_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Check a metadata filter: FILTER_FIELDS map to a value or a list of
+    accepted values, `ingested_after` / `ingested_before` to Unix times.
+    Raises ValueError for anything else.
+    """
+    for field, value in (filters or {}).items():
+        if field in RANGE_FILTERS:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Filter {field} takes a Unix time")
+        elif field in FILTER_FIELDS:
+            values = value if isinstance(value, list) else [value]
+            if not values or not all(isinstance(item, str) for item in values):
+                raise ValueError(f"Filter {field} takes a string or a list of strings")
+        else:
+            raise ValueError(f"Unknown filter: {field} (expected one of {', '.join(FILTER_FIELDS + tuple(RANGE_FILTERS))})")
+    return filters or {}
+
+
+class InvertedIndex:
+    """
+    In-process BM25 index over the chunks in the vector store.
+    Documents are added and removed incrementally by chunk id.
+    It also holds each chunk's text and metadata, with an exact-match index
+    over FILTER_FIELDS so filtered retrieval starts from the matching ids.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # field -> value -> chunk ids
+        self._fields: Dict[str, Dict[str, Set[str]]] = {field: {} for field in FILTER_FIELDS}
+        self._total_length = 0
+        # Running totals for memory accounting
+        self.text_bytes = 0
+        self.posting_entries = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._docs
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            if doc_id in self._docs:
+                self.remove(doc_id)
+            self._docs[doc_id] = (text, metadata or {})
+            self._doc_terms[doc_id] = terms
+            self._doc_lengths[doc_id] = sum(terms.values())
+            self._total_length += self._doc_lengths[doc_id]
+            self.text_bytes += len(text)
+            self.posting_entries += len(terms)
+            for term, freq in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = freq
+            self._index_metadata(doc_id, metadata or {})
+
+    def add_many(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            self.add(doc_id, text, metadata)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            text, metadata = self._docs.pop(doc_id)
+            self._unindex_metadata(doc_id, metadata)
+            self._total_length -= self._doc_lengths.pop(doc_id)
+            self.text_bytes -= len(text)
+            self.posting_entries -= len(terms)
+            for term in terms:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._docs.clear()
+            for values in self._fields.values():
+                values.clear()
+            self._total_length = 0
+            self.text_bytes = 0
+            self.posting_entries = 0
+
+    def get(self, doc_id: str) -> Tuple[str, Dict[str, Any]]:
+        return self._docs[doc_id]
+
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        with self._lock:
+            if doc_id not in self._docs:
+                return
+            text, previous = self._docs[doc_id]
+            self._unindex_metadata(doc_id, previous)
+            self._docs[doc_id] = (text, metadata)
+            self._index_metadata(doc_id, metadata)
+
+    def groups(self, field: str) -> Dict[str, Tuple[int, Dict[str, Any]]]:
+        """Per value of an indexed field: its chunk count and the metadata of one of its chunks."""
+        with self._lock:
+            return {
+                value: (len(ids), self._docs[next(iter(ids))][1])
+                for value, ids in self._fields[field].items()
+            }
+
+    def matching(self, filters: Dict[str, Any]) -> Set[str]:
+        """
+        Ids of the chunks whose metadata passes `filters` (see validate_filters).
+        Exact-match fields are intersected from the index, smallest first; the
+        ingest-time range is then checked on those candidates only.
+        """
+        with self._lock:
+            candidates: Optional[Set[str]] = None
+            exact = []
+            for field in FILTER_FIELDS:
+                if field in filters:
+                    values = filters[field] if isinstance(filters[field], list) else [filters[field]]
+                    ids: Set[str] = set()
+                    for value in values:
+                        ids |= self._fields[field].get(value, set())
+                    exact.append(ids)
+            for ids in sorted(exact, key=len):
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    return set()
+            after, before = filters.get("ingested_after"), filters.get("ingested_before")
+            if after is None and before is None:
+                return candidates if candidates is not None else set(self._docs)
+            pool: Iterable[str] = candidates if candidates is not None else self._docs
+            matched = set()
+            for doc_id in pool:
+                ingested_at = self._docs[doc_id][1].get("ingested_at")
+                if ingested_at is None:
+                    continue
+                if (after is None or ingested_at > after) and (before is None or ingested_at < before):
+                    matched.add(doc_id)
+            return matched
+
+    def _index_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        for field in FILTER_FIELDS:
+            value = metadata.get(field)
+            if value is not None:
+                self._fields[field].setdefault(value, set()).add(doc_id)
+                self.posting_entries += 1
+
+    def _unindex_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        for field in FILTER_FIELDS:
+            value = metadata.get(field)
+            ids = self._fields[field].get(value) if value is not None else None
+            if ids is not None and doc_id in ids:
+                ids.discard(doc_id)
+                self.posting_entries -= 1
+                if not ids:
+                    del self._fields[field][value]
+
+    def coverage(self, doc_id: str, terms: List[str]) -> float:
+        """Fraction of `terms` that occur in the document."""
+        if not terms:
+            return 0.0
+        doc_terms = self._doc_terms.get(doc_id, {})
+        return sum(1 for term in terms if term in doc_terms) / len(terms)
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Return up to `k` (doc_id, bm25_score) pairs, best first. With
+        `allowed`, only those chunks are scored, walking whichever is shorter
+        per term: the allowed ids or the term's postings.
+        """
+        terms = query_terms(query)
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                if allowed is None:
+                    matches = postings.items()
+                elif len(allowed) < len(postings):
+                    matches = [(doc_id, postings[doc_id]) for doc_id in allowed if doc_id in postings]
+                else:
+                    matches = [(doc_id, freq) for doc_id, freq in postings.items() if doc_id in allowed]
+                for doc_id, freq in matches:
+                    length = self._doc_lengths[doc_id]
+                    norm = freq + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, Optional
+from app.services.metrics import LLM_CALLS, LLM_PROMPT_TOKENS, LLM_RESPONSE_TOKENS, observe_stage
+from app.utils.tokens import estimate_tokens
+
+# Backend used for generation: "gemini" (Google Generative AI) or "stub" (canned local responses)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gemini-flash-latest")
+# Token bucket: sustained requests per second and burst size, shared by all models
+LLM_RATE_LIMIT_RPS = float(os.environ.get("LLM_RATE_LIMIT_RPS", "2"))
+LLM_RATE_LIMIT_BURST = int(os.environ.get("LLM_RATE_LIMIT_BURST", "5"))
+# Concurrent in-flight calls per model
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", "20"))
+# Deadline for one call, including retries and backoff
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "90"))
+
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class GeminiBackend:
+    """Google Generative AI backend. Model instances are created once and reused."""
+
+    def __init__(self):
+        import google.generativeai as genai
+
+        # Note: Ensure GOOGLE_API_KEY is set in environment variables
+        genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+        self._genai = genai
+        self._models: Dict[str, object] = {}
+
+    def _model(self, name: str):
+        if name not in self._models:
+            self._models[name] = self._genai.GenerativeModel(name)
+        return self._models[name]
+
+    async def generate(self, model: str, prompt: str) -> str:
+        response = await self._model(model).generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        response = await self._model(model).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. a final safety/finish chunk)
+                continue
+            yield text
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        from google.api_core import exceptions
+
+        return isinstance(error, (
+            exceptions.ResourceExhausted,
+            exceptions.TooManyRequests,
+            exceptions.ServiceUnavailable,
+            exceptions.InternalServerError,
+            exceptions.DeadlineExceeded,
+        ))
+
+
+def default_stub_response(prompt: str) -> str:
+    """Canned responses shaped like the real model's output for each prompt type."""
+    if "Selenium" in prompt:
+        return (
+            "from selenium.webdriver.common.by import By\n\n"
+            "def test_case(driver):\n"
+            "    assert driver.find_element(By.TAG_NAME, 'body')\n"
+        )
+    test_cases = [
+        {
+            "Test_ID": "TC001",
+            "Feature": "Stub Feature",
+            "Test_Scenario": "Stub scenario generated without calling the model",
+            "Expected_Result": "Stub expected result",
+            "Grounded_In": "stub",
+        }
+    ]
+    return "```json\n" + json.dumps(test_cases, indent=2) + "\n```"
+
+
+class StubBackend:
+    """
+    Local backend for tests and offline runs. `responder` maps a prompt to the
+    response text; `latency` simulates model round-trip time in seconds.
+    """
+
+    def __init__(self, responder: Callable[[str], str] = default_stub_response, latency: float = 0.0, chunk_size: int = 64):
+        self.responder = responder
+        self.latency = latency
+        self.chunk_size = chunk_size
+
+    async def generate(self, model: str, prompt: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.responder(prompt)
+
+    async def stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        text = await self.generate(model, prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        return False
+
+
+class LLMClient:
+    """
+    Shared async client for all LLM calls. Applies a token-bucket rate limit,
+    a per-model concurrency limit, retries with jittered exponential backoff
+    on rate-limit and transient errors, and an overall deadline per call.
+    """
+
+    def __init__(
+        self,
+        backend,
+        model: str = LLM_MODEL,
+        rate: float = LLM_RATE_LIMIT_RPS,
+        burst: int = LLM_RATE_LIMIT_BURST,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+    ):
+        self.backend = backend
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._bucket = TokenBucket(rate, burst)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[model]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    async def generate(self, prompt: str, model: Optional[str] = None, timeout: Optional[float] = None, operation: str = "generate") -> str:
+        """`operation` labels the call in the LLM metrics (e.g. "test_cases", "selenium")."""
+        start = time.perf_counter()
+        status = "error"
+        try:
+            text = await self._generate(prompt, model, timeout)
+            status = "ok"
+            LLM_RESPONSE_TOKENS.inc(estimate_tokens(text), operation=operation)
+            return text
+        except LLMTimeoutError:
+            status = "timeout"
+            raise
+        finally:
+            observe_stage("llm", time.perf_counter() - start)
+            LLM_CALLS.inc(operation=operation, status=status)
+            LLM_PROMPT_TOKENS.inc(estimate_tokens(prompt), operation=operation)
+
+    async def _generate(self, prompt: str, model: Optional[str], timeout: Optional[float]) -> str:
+        model = model or self.model
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise LLMTimeoutError(f"LLM call exceeded its {timeout or self.timeout}s deadline")
+            try:
+                async with self._semaphore(model):
+                    await asyncio.wait_for(self._bucket.acquire(), remaining)
+                    return await asyncio.wait_for(self.backend.generate(model, prompt), deadline - loop.time())
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"LLM call exceeded its {timeout or self.timeout}s deadline")
+            except Exception as e:
+                if attempt >= self.max_retries or not self.backend.is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                if loop.time() + delay >= deadline:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def stream(self, prompt: str, model: Optional[str] = None, timeout: Optional[float] = None, operation: str = "stream") -> AsyncIterator[str]:
+        """
+        Stream response text. Retries only happen before the first chunk,
+        since a partially delivered response cannot be replayed.
+        """
+        start = time.perf_counter()
+        status = "error"
+        response_tokens = 0
+        try:
+            first = True
+            async for text in self._stream(prompt, model, timeout):
+                if first:
+                    observe_stage("llm_first_chunk", time.perf_counter() - start)
+                    first = False
+                response_tokens += estimate_tokens(text)
+                yield text
+            status = "ok"
+        except GeneratorExit:
+            # The consumer stopped reading, e.g. once the JSON array was closed
+            status = "ok"
+            raise
+        except LLMTimeoutError:
+            status = "timeout"
+            raise
+        finally:
+            observe_stage("llm", time.perf_counter() - start)
+            LLM_CALLS.inc(operation=operation, status=status)
+            LLM_PROMPT_TOKENS.inc(estimate_tokens(prompt), operation=operation)
+            LLM_RESPONSE_TOKENS.inc(response_tokens, operation=operation)
+
+    async def _stream(self, prompt: str, model: Optional[str], timeout: Optional[float]) -> AsyncIterator[str]:
+        model = model or self.model
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._semaphore(model):
+                    await asyncio.wait_for(self._bucket.acquire(), max(0.0, deadline - loop.time()))
+                    chunks = self.backend.stream(model, prompt).__aiter__()
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            text = await asyncio.wait_for(chunks.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield text
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"LLM stream exceeded its {timeout or self.timeout}s deadline")
+            except Exception as e:
+                if started or attempt >= self.max_retries or not self.backend.is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                if loop.time() + delay >= deadline:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    """Get the shared client, creating the configured backend on first use."""
+    global _llm_client
+    if _llm_client is None:
+        backend = StubBackend() if LLM_BACKEND == "stub" else GeminiBackend()
+        _llm_client = LLMClient(backend)
+    return _llm_client
+
+
+def set_llm_client(client: Optional[LLMClient]):
+    """Replace the shared client, e.g. with a StubBackend client in tests."""
+    global _llm_client
+    _llm_client = client
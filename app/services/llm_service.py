@@ -1,20 +1,44 @@
+import asyncio
+import hashlib
 import os
 import json
-import google.generativeai as genai
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from app.services.llm_client import get_llm_client
+from app.services.lexical_index import STOPWORDS, tokenize
+from app.services.metrics import SELENIUM_VALIDATIONS, TEST_CASE_DUPLICATES, register_cache, timed
+from app.utils import parsers
+from app.utils.selenium_validation import format_problems, problem_count, validate_script
+from app.utils.json_stream import JsonArrayStreamParser, parse_json_array_prefix
 
-# Configure Gemini API
-# Note: Ensure GOOGLE_API_KEY is set in environment variables
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+# Gemini is configured by the shared client in llm_client.py, which also
+# handles rate limiting, concurrency limits, retries and deadlines.
 
-def generate_test_cases(context: str, query: str) -> List[Dict[str, Any]]:
-    model = genai.GenerativeModel('gemini-flash-latest')
-    
-    prompt = f"""
+# Upper bound on concurrent Gemini calls for one batch Selenium request
+SELENIUM_BATCH_CONCURRENCY = int(os.environ.get("SELENIUM_BATCH_CONCURRENCY", "4"))
+# A script whose locators do not match the page gets one targeted repair prompt
+SELENIUM_REPAIR = os.environ.get("SELENIUM_REPAIR", "true").lower() in ("1", "true", "yes")
+# Validated scripts kept per (test case, page) pair
+SELENIUM_SCRIPT_CACHE_SIZE = int(os.environ.get("SELENIUM_SCRIPT_CACHE_SIZE", "256"))
+# Upper bound on concurrent Gemini calls for one map-reduce test generation request
+MAP_REDUCE_CONCURRENCY = int(os.environ.get("MAP_REDUCE_CONCURRENCY", "4"))
+# Merged test cases whose scenario and expected result share at least this
+# fraction (Jaccard) of their terms with a case already kept are dropped
+TEST_CASE_DEDUPE_THRESHOLD = float(os.environ.get("TEST_CASE_DEDUPE_THRESHOLD", "0.8"))
+
+_script_cache: "OrderedDict[str, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+_script_cache_stats = {"hits": 0, "misses": 0}
+_script_cache_lock = threading.Lock()
+
+def build_test_case_prompt(context: str, query: str, focus: Optional[str] = None) -> str:
+    # A map-reduce partition covers only its own part of the request
+    scope = f"\n    Scope: This is one part of a larger request. Cover only: {focus}\n    " if focus else ""
+    return f"""
     Role: You are a Senior QA Automation Engineer.
     
     Task: Generate comprehensive test cases based ONLY on the provided context.
-    
+    {scope}
     Context:
     {context}
     
@@ -43,12 +67,16 @@ def generate_test_cases(context: str, query: str) -> List[Dict[str, Any]]:
     ]
     ```
     """
+
+async def generate_test_cases(context: str, query: str, focus: Optional[str] = None) -> List[Dict[str, Any]]:
+    with timed("prompt_build"):
+        prompt = build_test_case_prompt(context, query, focus)
     
-    response = model.generate_content(prompt)
+    response_text = await get_llm_client().generate(prompt, operation="test_cases")
     
     try:
         # Extract JSON from code block if present
-        text = response.text
+        text = response_text
         if "```json" in text:
             text = text.split("```json")[1].split("```")[0]
         elif "```" in text:
@@ -57,39 +85,297 @@ def generate_test_cases(context: str, query: str) -> List[Dict[str, Any]]:
         return json.loads(text)
     except Exception as e:
         print(f"Error parsing LLM response: {e}")
-        return []
+        # Keep whatever complete test cases a truncated response contains
+        return parse_json_array_prefix(response_text)
 
-def generate_selenium_script(test_case: Dict[str, Any], html_content: str) -> str:
-    model = genai.GenerativeModel('gemini-flash-latest')
+async def stream_test_cases(
+    context: str, query: str, parser: Optional[JsonArrayStreamParser] = None, focus: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate test cases with the streaming API, yielding each test case as
+    soon as its JSON object is complete. If the response is cut off, the
+    cases completed so far have already been yielded; pass a `parser` to
+    check `parser.truncated` afterwards.
+    """
+    with timed("prompt_build"):
+        prompt = build_test_case_prompt(context, query, focus)
     
+    if parser is None:
+        parser = JsonArrayStreamParser()
+    async for text in get_llm_client().stream(prompt, operation="test_cases"):
+        for test_case in parser.feed(text):
+            yield test_case
+        if parser.done:
+            break
+
+class TestCaseMerger:
+    """
+    Merges test cases from several map-reduce partitions: each case is
+    renumbered TC001, TC002, ... in the order it is added, unless its
+    scenario and expected result are a near-duplicate of a case already kept.
+    """
+
+    def __init__(self, threshold: float = TEST_CASE_DEDUPE_THRESHOLD):
+        self.threshold = threshold
+        self.test_cases: List[Dict[str, Any]] = []
+        self.duplicates = 0
+        self._terms: List[set] = []
+
+    def add(self, test_case: Any) -> Optional[Dict[str, Any]]:
+        """The renumbered test case, or None if it was dropped."""
+        if not isinstance(test_case, dict):
+            return None
+        text = f"{test_case.get('Test_Scenario', '')} {test_case.get('Expected_Result', '')}"
+        terms = {token for token in tokenize(text) if token not in STOPWORDS}
+        for kept in self._terms:
+            if terms and kept and len(terms & kept) / len(terms | kept) >= self.threshold:
+                self.duplicates += 1
+                TEST_CASE_DUPLICATES.inc()
+                return None
+        merged = {**test_case, "Test_ID": f"TC{len(self.test_cases) + 1:03d}"}
+        self.test_cases.append(merged)
+        self._terms.append(terms)
+        return merged
+
+def merge_test_cases(suites: List[List[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Merge partition suites in order; returns the merged cases and how many duplicates were dropped."""
+    merger = TestCaseMerger()
+    for suite in suites:
+        for test_case in suite:
+            merger.add(test_case)
+    return merger.test_cases, merger.duplicates
+
+async def generate_test_cases_map_reduce(partitions: List[Dict[str, str]], query: str) -> Dict[str, Any]:
+    """
+    Generate test cases for each {"focus", "context"} partition concurrently
+    (at most MAP_REDUCE_CONCURRENCY calls at a time), then merge them in
+    partition order with merge_test_cases. A failed partition is reported in
+    "partitions" and the others are kept; if every partition fails, the
+    first error is raised.
+    """
+    limit = asyncio.Semaphore(max(1, MAP_REDUCE_CONCURRENCY))
+    
+    async def generate(partition: Dict[str, str]):
+        async with limit:
+            return await generate_test_cases(partition["context"], query, partition["focus"])
+    
+    results = await asyncio.gather(*(generate(partition) for partition in partitions), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors and len(errors) == len(results):
+        raise errors[0]
+    suites = [result if isinstance(result, list) else [] for result in results]
+    with timed("test_case_merge"):
+        test_cases, duplicates = merge_test_cases(suites)
+    summary = []
+    for partition, result in zip(partitions, results):
+        entry = {"focus": partition["focus"], "test_cases": len(result) if isinstance(result, list) else 0}
+        if isinstance(result, BaseException):
+            entry["error"] = str(result)
+        summary.append(entry)
+    return {"test_cases": test_cases, "partitions": summary, "duplicates_removed": duplicates}
+
+async def stream_test_cases_map_reduce(
+    partitions: List[Dict[str, str]], query: str, merger: Optional[TestCaseMerger] = None
+) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Stream every partition at once (at most MAP_REDUCE_CONCURRENCY calls at a
+    time), merging cases as they arrive. Yields (partition index, merged test
+    case, None) for each kept case and (partition index, None, summary) when
+    a partition ends, where summary has its case count, whether it was
+    truncated and any error. Pass a `merger` to read the duplicate count after.
+    """
+    if merger is None:
+        merger = TestCaseMerger()
+    limit = asyncio.Semaphore(max(1, MAP_REDUCE_CONCURRENCY))
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def produce(index: int, partition: Dict[str, str]):
+        summary = {"focus": partition["focus"], "test_cases": 0, "truncated": False}
+        parser = JsonArrayStreamParser()
+        try:
+            async with limit:
+                async for test_case in stream_test_cases(partition["context"], query, parser, partition["focus"]):
+                    summary["test_cases"] += 1
+                    await queue.put((index, test_case, None))
+            summary["truncated"] = parser.truncated
+        except Exception as e:
+            summary["error"] = str(e)
+        await queue.put((index, None, summary))
+    
+    tasks = [asyncio.ensure_future(produce(index, partition)) for index, partition in enumerate(partitions)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            index, test_case, summary = await queue.get()
+            if summary is not None:
+                remaining -= 1
+                yield index, None, summary
+                continue
+            merged = merger.add(test_case)
+            if merged is not None:
+                yield index, merged, None
+    finally:
+        # Stop outstanding generations if the caller goes away early
+        for task in tasks:
+            task.cancel()
+
+def get_page_index(html_content: str) -> Dict[str, Any]:
+    """parsers.get_page_index, timed as the html_index stage."""
+    with timed("html_index"):
+        return parsers.get_page_index(html_content)
+
+async def generate_selenium_script(test_case: Dict[str, Any], html_content: str, page_index: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Generate a Selenium script for a test case and validate it offline: the
+    script must parse and every literal locator must match the page. Bad
+    locators get one repair prompt listing only them. Returns the script,
+    its validation report and whether it came from the script cache, which
+    holds validated scripts by (test case, HTML hash).
+    """
+    # Send the compact element index instead of the raw page
+    if page_index is None:
+        page_index = await asyncio.to_thread(get_page_index, html_content)
+    key = _script_cache_key(test_case, page_index["html_hash"])
+    cached = _script_cache_get(key)
+    if cached is not None:
+        SELENIUM_VALIDATIONS.inc(result="cached")
+        script, validation = cached
+        return {"script": script, "validation": validation, "cached": True}
+
     prompt = f"""
     Role: You are a Senior Selenium Automation Expert.
     
-    Task: Generate a Python Selenium script for the following test case, using the provided HTML to identify elements.
+    Task: Generate a Python Selenium script for the following test case, using the provided page elements to identify elements.
     
     Test Case:
     {json.dumps(test_case, indent=2)}
     
-    Target HTML:
-    {html_content}
+    Target Page Elements (one per line: tag | attributes | stable XPath):
+    {page_index["prompt"]}
     
     Requirements:
     1. Use `selenium` library.
     2. Assume `driver` is already initialized (but provide a setup block commented out).
-    3. Select elements using ID, Class, or XPath based on the provided HTML.
+    3. Select elements using ID, Name, Class, or the XPath listed for each element. Only use elements listed above.
     4. Include assertions to verify the Expected Result.
     5. Output ONLY raw Python code. No markdown formatting.
     
     Code:
     """
     
-    response = model.generate_content(prompt)
+    script = _strip_code_fences(await get_llm_client().generate(prompt, operation="selenium"))
+    with timed("script_validation"):
+        validation = await asyncio.to_thread(validate_script, script, page_index["locators"])
+    validation["repaired"] = False
+
+    if not validation["valid"] and SELENIUM_REPAIR:
+        repair_prompt = build_repair_prompt(script, validation, page_index)
+        repaired = _strip_code_fences(await get_llm_client().generate(repair_prompt, operation="selenium_repair"))
+        with timed("script_validation"):
+            repaired_validation = await asyncio.to_thread(validate_script, repaired, page_index["locators"])
+        # Keep the repair unless it made things worse
+        if problem_count(repaired_validation) <= problem_count(validation):
+            script, validation = repaired, repaired_validation
+            validation["repaired"] = True
+
+    if validation["valid"]:
+        SELENIUM_VALIDATIONS.inc(result="repaired" if validation["repaired"] else "valid")
+        _script_cache_put(key, script, validation)
+    else:
+        SELENIUM_VALIDATIONS.inc(result="invalid")
+    return {"script": script, "validation": validation, "cached": False}
+
+def build_repair_prompt(script: str, validation: Dict[str, Any], page_index: Dict[str, Any]) -> str:
+    return f"""
+    Role: You are a Senior Selenium Automation Expert.
+    
+    Task: The Python Selenium script below was checked against the target page and has these problems:
+    {format_problems(validation)}
+    
+    Target Page Elements (one per line: tag | attributes | stable XPath):
+    {page_index["prompt"]}
     
-    text = response.text
+    Script:
+    {script}
+    
+    Requirements:
+    1. Fix only the problems listed, choosing locators from the page elements above.
+    2. Leave every other line of the script unchanged.
+    3. Output the complete corrected script as raw Python code. No markdown formatting.
+    
+    Code:
+    """
+
+def _strip_code_fences(text: str) -> str:
     # Clean up markdown code blocks if present
     if "```python" in text:
         text = text.split("```python")[1].split("```")[0]
     elif "```" in text:
         text = text.split("```")[1]
-        
     return text.strip()
+
+def _script_cache_key(test_case: Dict[str, Any], html_hash: str) -> str:
+    case_hash = hashlib.sha256(json.dumps(test_case, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{case_hash}:{html_hash}"
+
+def _script_cache_get(key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    with _script_cache_lock:
+        entry = _script_cache.get(key)
+        if entry is None:
+            _script_cache_stats["misses"] += 1
+            return None
+        _script_cache.move_to_end(key)
+        _script_cache_stats["hits"] += 1
+        return entry
+
+def _script_cache_put(key: str, script: str, validation: Dict[str, Any]):
+    if SELENIUM_SCRIPT_CACHE_SIZE <= 0:
+        return
+    with _script_cache_lock:
+        _script_cache[key] = (script, validation)
+        _script_cache.move_to_end(key)
+        while len(_script_cache) > SELENIUM_SCRIPT_CACHE_SIZE:
+            _script_cache.popitem(last=False)
+
+def script_cache_stats() -> Dict[str, float]:
+    with _script_cache_lock:
+        return {**_script_cache_stats, "entries": len(_script_cache)}
+
+def clear_script_cache():
+    with _script_cache_lock:
+        _script_cache.clear()
+
+register_cache("selenium_scripts", script_cache_stats)
+
+async def generate_selenium_scripts(
+    test_cases: List[Dict[str, Any]],
+    html_content: str,
+    max_concurrency: Optional[int] = None,
+    page_index: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Generate scripts for many test cases against one page.
+    The HTML is compacted once and shared by every prompt; scripts are
+    generated concurrently (at most SELENIUM_BATCH_CONCURRENCY at a time) and
+    yielded as (index, result, error) tuples in completion order, where
+    result is what generate_selenium_script returns.
+    """
+    if page_index is None:
+        page_index = await asyncio.to_thread(get_page_index, html_content)
+    limit = asyncio.Semaphore(max(1, min(max_concurrency or SELENIUM_BATCH_CONCURRENCY, SELENIUM_BATCH_CONCURRENCY)))
+    
+    async def generate(index: int, test_case: Dict[str, Any]):
+        async with limit:
+            try:
+                return index, await generate_selenium_script(test_case, html_content, page_index), None
+            except Exception as e:
+                return index, None, str(e)
+    
+    tasks = [asyncio.ensure_future(generate(index, test_case)) for index, test_case in enumerate(test_cases)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Stop outstanding generations if the caller goes away early
+        for task in tasks:
+            task.cancel()
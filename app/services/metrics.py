@@ -0,0 +1,260 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Attach a Server-Timing header with the per-stage breakdown to every response.
+# Clients can also ask for it on a single request with an "X-Timing: 1" header.
+METRICS_TIMING_HEADER = os.environ.get("METRICS_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+
+# Latency buckets in seconds, from sub-millisecond index lookups to long LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in Prometheus layout."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(tuple(str(labels.get(name, "")) for name in self.labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    """
+    Holds the service's metrics and renders them in the Prometheus text format.
+    Collectors are callbacks that report values owned elsewhere (such as cache
+    statistics) at scrape time as (name, type, help, [(labels, value)]).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector: Callable):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                # A failing collector must not break the whole scrape
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "qa_stage_duration_seconds",
+    "Time spent in each pipeline stage (parse, split, embed, retrieve, llm, ...)",
+    ("stage",),
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "qa_http_request_duration_seconds",
+    "HTTP request latency until the response headers are sent",
+    ("method", "path", "status"),
+)
+INGEST_FILES = registry.counter("qa_ingest_files_total", "Files processed by ingestion, by outcome", ("status",))
+INGEST_BYTES = registry.counter("qa_ingest_bytes_total", "Bytes of uploaded file content parsed")
+INGEST_CHUNKS = registry.counter("qa_ingest_chunks_total", "Chunks produced by the text splitter")
+EMBEDDED_CHUNKS = registry.counter("qa_embedded_chunks_total", "Chunks embedded and written to the vector store")
+RETRIEVALS = registry.counter("qa_retrievals_total", "Retrieval calls, by mode and path taken", ("mode", "path"))
+RETRIEVED_CHUNKS = registry.counter("qa_retrieved_chunks_total", "Chunks returned by retrieval")
+CONTEXT_TOKENS = registry.counter("qa_context_tokens_total", "Estimated tokens of retrieved context packed into prompts")
+LLM_CALLS = registry.counter("qa_llm_calls_total", "LLM calls, by operation and outcome", ("operation", "status"))
+LLM_PROMPT_TOKENS = registry.counter("qa_llm_prompt_tokens_total", "Estimated prompt tokens sent to the LLM", ("operation",))
+LLM_RESPONSE_TOKENS = registry.counter("qa_llm_response_tokens_total", "Estimated response tokens received from the LLM", ("operation",))
+COALESCED_REQUESTS = registry.counter(
+    "qa_coalesced_requests_total", "Requests answered by joining an identical request already in flight", ("endpoint",)
+)
+SELENIUM_VALIDATIONS = registry.counter(
+    "qa_selenium_validations_total", "Generated Selenium scripts by validation outcome", ("result",)
+)
+TEST_CASE_DUPLICATES = registry.counter(
+    "qa_test_case_duplicates_total", "Test cases dropped as near-duplicates when merging map-reduce partitions"
+)
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_timings", default=None)
+
+
+# Caches reporting hit/miss statistics, by name
+_caches: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, float]]):
+    """Expose a cache's `stats()` dict (hits, misses, entries) on /metrics."""
+    _caches[name] = stats
+
+
+def _collect_caches():
+    stats = {name: fn() for name, fn in list(_caches.items())}
+    families = []
+    for key, kind, help_text in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses"),
+        ("entries", "gauge", "Entries currently held in the cache"),
+        ("hit_rate", "gauge", "Cache hit rate since startup"),
+    ):
+        samples = []
+        for name, values in stats.items():
+            if key == "hit_rate":
+                total = values.get("hits", 0) + values.get("misses", 0)
+                value = values.get("hits", 0) / total if total else 0.0
+            elif key in values:
+                value = values[key]
+            else:
+                continue
+            samples.append(({"cache": name}, value))
+        suffix = "_total" if kind == "counter" else ""
+        families.append((f"qa_cache_{key}{suffix}", kind, help_text, samples))
+    return families
+
+
+registry.add_collector(_collect_caches)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Record the duration of the enclosed block under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def start_request_timings() -> Tuple[Dict[str, float], contextvars.Token]:
+    """Collect stage timings for the current request; pass the token to `end_request_timings`."""
+    timings: Dict[str, float] = {}
+    return timings, _request_timings.set(timings)
+
+
+def end_request_timings(token: contextvars.Token):
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """Format stage timings as a Server-Timing header value (durations in ms)."""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -1,11 +1,355 @@
-from app.services.ingestion import get_vector_store
-
-def retrieve_context(query: str, k: int = 3) -> str:
-    vector_store = get_vector_store()
-    docs = vector_store.similarity_search(query, k=k)
-    
-    context = ""
-    for doc in docs:
-        context += f"Source: {doc.metadata['source']}\nContent: {doc.page_content}\n\n"
-    
-    return context
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.services.context_builder import CONTEXT_FETCH_K, CONTEXT_TOKEN_BUDGET, pack_context, partition_candidates
+from app.services.ingestion import (
+    DEFAULT_COLLECTION,
+    VECTOR_BACKEND,
+    Document,
+    get_embeddings,
+    get_lexical_index,
+    get_vector_index,
+    get_vector_store,
+    using_collection,
+)
+from app.services.lexical_index import FILTER_FIELDS, query_terms, validate_filters
+from app.services.metrics import CONTEXT_TOKENS, RETRIEVALS, RETRIEVED_CHUNKS, timed
+from app.utils.tokens import estimate_tokens
+
+# Retrieval mode: "vector" (similarity search only), "lexical" (BM25 only, no
+# embedding call) or "hybrid" (BM25 and vector scores fused).
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+# Weight of the vector score in hybrid fusion; BM25 gets the remainder
+HYBRID_ALPHA = float(os.environ.get("HYBRID_ALPHA", "0.5"))
+# Candidates taken from each retriever before fusion
+HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", "20"))
+# Hybrid mode answers from BM25 alone, without embedding the query, when at
+# least LEXICAL_FASTPATH_MIN_HITS chunks contain LEXICAL_FASTPATH_COVERAGE of
+# the query terms (e.g. a query for an exact code such as SAVE15)
+LEXICAL_FASTPATH_COVERAGE = float(os.environ.get("LEXICAL_FASTPATH_COVERAGE", "1.0"))
+LEXICAL_FASTPATH_MIN_HITS = int(os.environ.get("LEXICAL_FASTPATH_MIN_HITS", "1"))
+# Map-reduce test generation: candidates retrieved for a broad request, and
+# the most partitions (each packed to CONTEXT_TOKEN_BUDGET) they are split into
+MAP_REDUCE_FETCH_K = int(os.environ.get("MAP_REDUCE_FETCH_K", "60"))
+MAP_REDUCE_MAX_PARTITIONS = int(os.environ.get("MAP_REDUCE_MAX_PARTITIONS", "4"))
+
+
+def retrieve_context(
+    query: str,
+    k: Optional[int] = None,
+    mode: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION,
+    token_budget: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Prompt context for `query`: CONTEXT_FETCH_K candidates are retrieved,
+    diversified with MMR, overlapping chunks of the same source are merged,
+    and the result is packed up to `token_budget` (CONTEXT_TOKEN_BUDGET).
+    `k` optionally caps the number of chunks used; `filters` restricts the
+    search to chunks with matching metadata (see retrieve_documents).
+    """
+    return retrieve_context_batch([query], k, mode, collection, token_budget, filters)[0]
+
+
+def retrieve_context_batch(
+    queries: List[str],
+    k: Optional[int] = None,
+    mode: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION,
+    token_budget: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    dedupe: bool = False,
+) -> List[str]:
+    """
+    retrieve_context for several queries at once, sharing one embedding
+    call and one vector search pass (see retrieve_documents_batch).
+    """
+    results = retrieve_documents_batch(
+        queries, k=max(k or 0, CONTEXT_FETCH_K), mode=mode, collection=collection, filters=filters, dedupe=dedupe
+    )
+    contexts = []
+    for docs in results:
+        with timed("context_build"):
+            context = pack_context(docs, token_budget or CONTEXT_TOKEN_BUDGET, max_chunks=k)
+        CONTEXT_TOKENS.inc(estimate_tokens(context))
+        contexts.append(context)
+    return contexts
+
+
+def retrieve_context_partitions(
+    query: str,
+    mode: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION,
+    token_budget: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    subtopics: Optional[List[str]] = None,
+) -> List[Dict[str, str]]:
+    """
+    Prompt contexts for map-reduce generation, as {"focus", "context"} dicts.
+    With `subtopics`, each one is retrieved separately (one batched call,
+    chunks deduplicated across subtopics). Otherwise MAP_REDUCE_FETCH_K
+    candidates for `query` are split by source and section into up to
+    MAP_REDUCE_MAX_PARTITIONS partitions. Each context fits `token_budget`;
+    partitions without context are left out.
+    """
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    if subtopics:
+        contexts = retrieve_context_batch(
+            subtopics, mode=mode, collection=collection, token_budget=token_budget, filters=filters, dedupe=True
+        )
+        return [{"focus": subtopic, "context": context} for subtopic, context in zip(subtopics, contexts) if context]
+
+    candidates = retrieve_documents(query, k=MAP_REDUCE_FETCH_K, mode=mode, collection=collection, filters=filters)
+    partitions = []
+    with timed("context_build"):
+        for members in partition_candidates(candidates, token_budget, MAP_REDUCE_MAX_PARTITIONS):
+            context = pack_context(members, token_budget)
+            CONTEXT_TOKENS.inc(estimate_tokens(context))
+            partitions.append({"focus": _partition_focus(members), "context": context})
+    return partitions
+
+
+def needs_query_vector(
+    query: str,
+    mode: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION,
+    filters: Optional[Dict[str, Any]] = None,
+    k: int = CONTEXT_FETCH_K,
+) -> bool:
+    """
+    Whether retrieving for `query` embeds it: always in vector mode, never in
+    lexical mode, and in hybrid mode unless the BM25 fast path answers it.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode != "hybrid":
+        return mode == "vector"
+    filters = validate_filters(filters)
+    with using_collection(collection):
+        index = get_lexical_index(collection)
+        allowed = index.matching(filters) if filters else None
+        if allowed is not None and not allowed:
+            return False
+        hits = _lexical_search(query, max(k, HYBRID_FETCH_K), collection, allowed)
+        return _lexical_fastpath(index, query, hits, k) is None
+
+
+def retrieve_documents(
+    query: str,
+    k: int = 3,
+    mode: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Return the top `k` chunks of `collection` for `query` as (Document, score) pairs, best first.
+    `filters` keeps only chunks whose metadata matches, e.g.
+    {"source": ["a.md", "b.md"], "doc_type": "md", "ingested_after": 1700000000}.
+    The matching ids come from the metadata index, and only they are searched.
+    """
+    return retrieve_documents_batch([query], k, mode, collection, filters)[0]
+
+
+def retrieve_documents_batch(
+    queries: List[str],
+    k: int = 3,
+    mode: Optional[str] = None,
+    collection: str = DEFAULT_COLLECTION,
+    filters: Optional[Dict[str, Any]] = None,
+    dedupe: bool = False,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    retrieve_documents for several queries, returning one result list per
+    query. Queries that need a vector search are embedded in one batched
+    call and searched together in one pass. With `dedupe`, a chunk found by
+    several queries is only returned for the query it scores highest for,
+    except that each query keeps its top hit.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    filters = validate_filters(filters)
+
+    with timed("retrieve"), using_collection(collection):
+        index = get_lexical_index(collection)
+        allowed = None
+        if filters:
+            with timed("metadata_filter"):
+                allowed = index.matching(filters)
+            if not allowed:
+                return [[] for _ in queries]
+        if mode == "vector":
+            hits = _vector_search_many(queries, k, collection, allowed, filters)
+            raw_scores = [dict(query_hits) for query_hits in hits]
+            RETRIEVALS.inc(len(queries), mode=mode, path="vector")
+        elif mode == "lexical":
+            lexical_hits = [_lexical_search(query, k, collection, allowed) for query in queries]
+            hits = [_normalize(query_hits) for query_hits in lexical_hits]
+            raw_scores = [dict(query_hits) for query_hits in lexical_hits]
+            RETRIEVALS.inc(len(queries), mode=mode, path="lexical")
+        else:
+            hits, raw_scores = _hybrid_search_many(queries, k, collection, allowed, filters)
+        if dedupe:
+            hits = _dedupe(hits, raw_scores)
+
+        results = [
+            [(_to_document(index, doc_id), score) for doc_id, score in query_hits if doc_id in index]
+            for query_hits in hits
+        ]
+    RETRIEVED_CHUNKS.inc(sum(len(docs) for docs in results))
+    return results
+
+
+def _vector_search_many(
+    queries: List[str],
+    k: int,
+    collection: str,
+    allowed: Optional[Set[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> List[List[Tuple[str, float]]]:
+    if not queries:
+        return []
+    if VECTOR_BACKEND == "compact":
+        index = get_vector_index(collection)
+        if not len(index):
+            return [[] for _ in queries]
+        with timed("embed_query"):
+            query_embeddings = get_embeddings().embed_queries(queries)
+        with timed("vector_search"):
+            results = index.search_many(query_embeddings, k, ids=allowed)
+    else:
+        chroma_collection = get_vector_store(collection)._collection
+        n_results = min(k, chroma_collection.count() if allowed is None else len(allowed))
+        if n_results == 0:
+            return [[] for _ in queries]
+        with timed("embed_query"):
+            query_embeddings = get_embeddings().embed_queries(queries)
+        with timed("vector_search"):
+            result = chroma_collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=chroma_where(filters) if filters else None,
+                include=["distances"],
+            )
+        results = [list(zip(ids, distances)) for ids, distances in zip(result["ids"], result["distances"])]
+    # Both backends return squared L2 distance; for unit-normalized embeddings
+    # that is 2 - 2cos, so 1 - d/2 is the cosine similarity
+    return [
+        [(doc_id, max(0.0, 1.0 - distance / 2)) for doc_id, distance in hits]
+        for hits in results
+    ]
+
+
+def chroma_where(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """The Chroma `where` clause equivalent to a metadata filter."""
+    clauses = []
+    for field in FILTER_FIELDS:
+        if field in filters:
+            values = filters[field] if isinstance(filters[field], list) else [filters[field]]
+            clauses.append({field: values[0]} if len(values) == 1 else {field: {"$in": values}})
+    if "ingested_after" in filters:
+        clauses.append({"ingested_at": {"$gt": filters["ingested_after"]}})
+    if "ingested_before" in filters:
+        clauses.append({"ingested_at": {"$lt": filters["ingested_before"]}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _lexical_search(query: str, k: int, collection: str, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+    with timed("lexical_search"):
+        return get_lexical_index(collection).search(query, k=k, allowed=allowed)
+
+
+def _hybrid_search_many(
+    queries: List[str],
+    k: int,
+    collection: str,
+    allowed: Optional[Set[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[List[Tuple[str, float]]], List[Dict[str, float]]]:
+    """
+    Hybrid hits per query, plus each hit's score before per-query BM25
+    scaling (raw BM25, plus cosine when fused) for comparing across queries.
+    """
+    index = get_lexical_index(collection)
+    results: List[List[Tuple[str, float]]] = [[] for _ in queries]
+    raw_scores: List[Dict[str, float]] = [{} for _ in queries]
+    lexical_hits: Dict[int, List[Tuple[str, float]]] = {}
+    for position, query in enumerate(queries):
+        hits = _lexical_search(query, max(k, HYBRID_FETCH_K), collection, allowed)
+        strong = _lexical_fastpath(index, query, hits, k)
+        if strong is not None:
+            RETRIEVALS.inc(mode="hybrid", path="lexical_fastpath")
+            results[position] = _normalize(strong)
+            raw_scores[position] = dict(strong)
+        else:
+            RETRIEVALS.inc(mode="hybrid", path="fused")
+            lexical_hits[position] = hits
+
+    # Queries not answered by the fast path share one embedding call and vector pass
+    pending = list(lexical_hits)
+    vector_hits = _vector_search_many([queries[position] for position in pending], max(k, HYBRID_FETCH_K), collection, allowed, filters)
+    for position, hits in zip(pending, vector_hits):
+        fused: Dict[str, float] = {}
+        raw: Dict[str, float] = {}
+        for (doc_id, score), (_, bm25) in zip(_normalize(lexical_hits[position]), lexical_hits[position]):
+            fused[doc_id] = (1 - HYBRID_ALPHA) * score
+            raw[doc_id] = (1 - HYBRID_ALPHA) * bm25
+        for doc_id, score in hits:
+            fused[doc_id] = fused.get(doc_id, 0.0) + HYBRID_ALPHA * score
+            raw[doc_id] = raw.get(doc_id, 0.0) + HYBRID_ALPHA * score
+        results[position] = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        raw_scores[position] = {doc_id: raw[doc_id] for doc_id, _ in results[position]}
+    return results, raw_scores
+
+
+def _lexical_fastpath(index, query: str, hits: List[Tuple[str, float]], k: int) -> Optional[List[Tuple[str, float]]]:
+    """The top `k` BM25 hits if exact-token matches are strong enough to skip the embedding call, else None."""
+    terms = query_terms(query)
+    strong = [
+        (doc_id, score) for doc_id, score in hits
+        if index.coverage(doc_id, terms) >= LEXICAL_FASTPATH_COVERAGE
+    ]
+    if len(strong) >= min(k, LEXICAL_FASTPATH_MIN_HITS):
+        return strong[:k]
+    return None
+
+
+def _dedupe(hits: List[List[Tuple[str, float]]], raw_scores: List[Dict[str, float]]) -> List[List[Tuple[str, float]]]:
+    """
+    Keep each chunk only in the result list where its raw score is highest
+    (the earliest on ties). `hits` may be scaled per query, so ownership is
+    decided on `raw_scores`. A query always keeps its top hit, even if shared.
+    """
+    owner: Dict[str, Tuple[float, int]] = {}
+    for position, scores in enumerate(raw_scores):
+        for doc_id, score in scores.items():
+            if doc_id not in owner or score > owner[doc_id][0]:
+                owner[doc_id] = (score, position)
+    return [
+        [(doc_id, score) for rank, (doc_id, score) in enumerate(query_hits) if rank == 0 or owner[doc_id][1] == position]
+        for position, query_hits in enumerate(hits)
+    ]
+
+
+def _normalize(hits: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+    """Scale BM25 scores into [0, 1] relative to the best hit."""
+    if not hits:
+        return []
+    best = hits[0][1] or 1.0
+    return [(doc_id, score / best) for doc_id, score in hits]
+
+
+def _partition_focus(members: List[Tuple[Document, float]]) -> str:
+    """A partition's sources and top-level sections, e.g. "checkout.md (Discounts, Payment); faq.md"."""
+    sections: Dict[str, List[str]] = {}
+    for doc, _ in members:
+        section = (doc.metadata.get("section") or "").split(" > ")[0]
+        names = sections.setdefault(doc.metadata.get("source", "unknown"), [])
+        if section and section not in names:
+            names.append(section)
+    return "; ".join(f"{source} ({', '.join(names)})" if names else source for source, names in sections.items())
+
+
+def _to_document(index, doc_id: str) -> Document:
+    text, metadata = index.get(doc_id)
+    return Document(page_content=text, metadata=metadata)
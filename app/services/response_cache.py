@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.services.metrics import register_cache
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# Cosine similarity between query embeddings above which a cached response is reused
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.97"))
+
+
+class _Entry:
+    __slots__ = ("vector", "text", "kb_version", "namespace", "value", "created_at")
+
+    def __init__(self, vector, text, kb_version, namespace, value):
+        self.vector = vector
+        self.text = text
+        self.kb_version = kb_version
+        self.namespace = namespace
+        self.value = value
+        self.created_at = time.monotonic()
+
+
+class SemanticResponseCache:
+    """
+    Caches responses keyed on the query embedding. A lookup hits when a stored
+    query in the same namespace is at least `threshold` cosine-similar and was
+    answered against the same knowledge base version. Requests whose retrieval
+    does not embed the query pass no vector and are keyed on their `text`
+    (the normalized query) alone, so caching never costs an embedding call. Entries expire after
+    `ttl` seconds and the least recently used are evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        threshold: float = RESPONSE_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def lookup(
+        self, vector: Optional[List[float]], kb_version: int, namespace: str = "", text: Optional[str] = None
+    ) -> Optional[Any]:
+        query = _unit(vector) if vector is not None else None
+        with self._lock:
+            self._expire(kb_version, namespace)
+            keys = [
+                key for key, entry in self._entries.items()
+                if entry.namespace == namespace and entry.kb_version == kb_version
+            ]
+            best_key = self._best_match(query, text, keys)
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key].value
+
+    def store(
+        self, vector: Optional[List[float]], kb_version: int, value: Any, namespace: str = "", text: Optional[str] = None
+    ):
+        query = _unit(vector) if vector is not None else None
+        with self._lock:
+            # A request that started before the knowledge base changed has a stale answer
+            if any(entry.namespace == namespace and entry.kb_version > kb_version for entry in self._entries.values()):
+                return
+            self._expire(kb_version, namespace)
+            # A near-identical query replaces the older answer instead of adding a duplicate
+            keys = [key for key, entry in self._entries.items() if entry.namespace == namespace]
+            existing = self._best_match(query, text, keys)
+            if existing is not None:
+                del self._entries[existing]
+            self._entries[self._next_key] = _Entry(query, text, kb_version, namespace, value)
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "similarity_threshold": self.threshold,
+        }
+
+    def _best_match(self, query: Optional[np.ndarray], text: Optional[str], keys: List[int]) -> Optional[int]:
+        if query is None:
+            return next((key for key in keys if text is not None and self._entries[key].text == text), None)
+        keys = [key for key in keys if self._entries[key].vector is not None]
+        if not keys:
+            return None
+        matrix = np.stack([self._entries[key].vector for key in keys])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.threshold else None
+
+    def _expire(self, kb_version: int, namespace: str):
+        """
+        Drop entries that are past their TTL, or that were answered in this
+        namespace against a knowledge base version older than `kb_version`.
+        Newer entries are kept: `kb_version` may come from a slow request
+        that started before the latest ingest.
+        """
+        now = time.monotonic()
+        stale = [
+            key for key, entry in self._entries.items()
+            if (entry.namespace == namespace and entry.kb_version < kb_version) or now - entry.created_at > self.ttl
+        ]
+        for key in stale:
+            del self._entries[key]
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+# Shared cache for /generate-tests/ responses
+test_case_cache = SemanticResponseCache()
+register_cache("test_cases", test_case_cache.stats)
@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+class SharedState:
+    """
+    Small SQLite database that lets several worker processes on one host
+    coordinate around a shared persistent vector store:
+    - per-collection versions, bumped after every change, so each worker can
+      tell when another one has changed a collection and reload it
+    - a cross-process write lock, so only one worker writes to the store at a time
+    - ingestion job status, so any worker can report on (or cancel) a job
+      that is running in another one
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Short statements (versions, job rows); autocommit, shared by threads
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kb_versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, cancel_requested INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        # A transaction on this separate database is held for the duration of
+        # a store write, so version and job updates are never blocked behind it
+        self._write_conn = self._connect(path + ".lock")
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+
+    def _connect(self, path: Optional[str] = None) -> sqlite3.Connection:
+        return sqlite3.connect(path or self.path, timeout=60, isolation_level=None, check_same_thread=False)
+
+    def versions(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT collection, version FROM kb_versions").fetchall())
+
+    def bump(self, collection: str) -> int:
+        """Increment and return a collection's version."""
+        with self._lock:
+            # One transaction, so a concurrent bump by another worker cannot be mistaken for ours
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO kb_versions (collection, version) VALUES (?, 1) "
+                    "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+                    (collection,),
+                )
+                version = self._conn.execute("SELECT version FROM kb_versions WHERE collection = ?", (collection,)).fetchone()[0]
+            finally:
+                self._conn.execute("COMMIT")
+            return version
+
+    @contextmanager
+    def write_lock(self):
+        """
+        Block other processes' writers (and this process's other threads)
+        until the block exits. Reentrant within a thread.
+        """
+        with self._write_lock:
+            if self._write_depth == 0:
+                self._write_conn.execute("BEGIN IMMEDIATE")
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._write_conn.execute("COMMIT")
+
+    def publish_job(self, job_id: str, data: Dict[str, Any], history: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (job_id, json.dumps(data), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY updated_at DESC LIMIT ?)",
+                (history,),
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[0]), "cancel_requested": bool(row[1])}
+
+    def list_jobs(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM jobs ORDER BY updated_at").fetchall()
+        return {job_id: json.loads(data) for job_id, data in rows}
+
+    def request_cancel(self, job_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,)).rowcount > 0
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import Iterable, Iterator, List, Optional, Union
+
+# Size limits for /ingest/ uploads; a request over either limit is rejected with 413
+INGEST_MAX_FILE_MB = float(os.environ.get("INGEST_MAX_FILE_MB", "50"))
+INGEST_MAX_REQUEST_MB = float(os.environ.get("INGEST_MAX_REQUEST_MB", "200"))
+# Uploads are copied to disk and read back by ingestion in blocks of this size,
+# so memory use does not grow with file size
+UPLOAD_BLOCK_KB = int(os.environ.get("UPLOAD_BLOCK_KB", "1024"))
+# Where uploads wait for their ingestion job (default: the system temp directory)
+INGEST_UPLOAD_DIR = os.environ.get("INGEST_UPLOAD_DIR", "")
+
+_MB = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StoredUpload:
+    """An uploaded file spooled to disk until its ingestion job has run."""
+
+    def __init__(self, filename: str, path: str):
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self.sha256 = ""
+
+    def blocks(self, block_size: int = UPLOAD_BLOCK_KB * 1024) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    return
+                yield block
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# File content as accepted by ingestion: raw bytes or an upload on disk
+Content = Union[bytes, StoredUpload]
+
+
+async def store_uploads(files) -> List[StoredUpload]:
+    """
+    Copy FastAPI UploadFiles to disk in UPLOAD_BLOCK_KB blocks, hashing them
+    on the way, in a worker thread. Raises UploadTooLarge (and removes what
+    was written) once a file or the request as a whole exceeds its limit.
+    Starlette has already received and spooled the whole body by then, so
+    only a declared Content-Length is rejected before the upload arrives (see
+    the upload-size middleware); the copy outlives the request for the job.
+    """
+    return await asyncio.to_thread(_copy_uploads, files)
+
+
+def _copy_uploads(files) -> List[StoredUpload]:
+    stored: List[StoredUpload] = []
+    total = 0
+    block_size = UPLOAD_BLOCK_KB * 1024
+    try:
+        for file in files:
+            if INGEST_UPLOAD_DIR:
+                os.makedirs(INGEST_UPLOAD_DIR, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix="upload-", dir=INGEST_UPLOAD_DIR or None)
+            upload = StoredUpload(file.filename, path)
+            stored.append(upload)
+            digest = hashlib.sha256()
+            file.file.seek(0)
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    block = file.file.read(block_size)
+                    if not block:
+                        break
+                    upload.size += len(block)
+                    total += len(block)
+                    if upload.size > INGEST_MAX_FILE_MB * _MB:
+                        raise UploadTooLarge(f"{file.filename} exceeds the {INGEST_MAX_FILE_MB:g} MB per-file limit")
+                    if total > INGEST_MAX_REQUEST_MB * _MB:
+                        raise UploadTooLarge(f"Upload exceeds the {INGEST_MAX_REQUEST_MB:g} MB per-request limit")
+                    digest.update(block)
+                    out.write(block)
+            upload.sha256 = digest.hexdigest()
+    except BaseException:
+        remove_uploads(stored)
+        raise
+    return stored
+
+
+def remove_uploads(contents: Iterable[Optional[Content]]):
+    for content in contents:
+        if isinstance(content, StoredUpload):
+            content.remove()
+
+
+def content_blocks(content: Content) -> Iterable[bytes]:
+    return content.blocks() if isinstance(content, StoredUpload) else [content]
+
+
+def content_size(content: Content) -> int:
+    return content.size if isinstance(content, StoredUpload) else len(content)
+
+
+def content_hash(content: Content) -> str:
+    return content.sha256 if isinstance(content, StoredUpload) else hashlib.sha256(content).hexdigest()
@@ -0,0 +1,310 @@
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+
+# Precision of the in-memory vectors: "int8" (one byte per dimension plus a
+# per-vector scale) or "float16" (two bytes per dimension)
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "int8")
+# Candidates from the quantized scan that are re-scored with full-precision
+# vectors; at least this many, and at least 4x the number of results asked for
+VECTOR_RERANK_CANDIDATES = int(os.environ.get("VECTOR_RERANK_CANDIDATES", "100"))
+
+QUANTIZATIONS = ("int8", "float16")
+
+# Rows scored per step of the quantized scan, bounding its temporary arrays
+_SCAN_ROWS = 4096
+# Queries scored together by search_many, bounding its score matrix
+_SCAN_QUERIES = 32
+_INITIAL_CAPACITY = 256
+# Rough cost of a row's id string and its dict entry
+_ID_BYTES = 150
+
+
+class CompactVectorIndex:
+    """
+    Vectors of one collection for the compact vector backend.
+
+    Quantized copies are kept in RAM in contiguous NumPy arrays and scanned
+    with vectorized dot products; the best candidates are then re-scored
+    against the full-precision vectors, which live in a memory-mapped file in
+    `path` and are only read for those candidates. Distances are exact squared
+    L2, as Chroma's "l2" space reports them, so scores from both backends are
+    interchangeable.
+
+    On disk, `vectors.f32` holds one float32 row per slot and `ids.log`
+    records which id occupies each slot; freed slots are reused. Opening an
+    existing directory restores the index, which is how persistent-mode
+    collections survive restarts.
+    """
+
+    def __init__(self, path: str, quantization: str = VECTOR_QUANTIZATION):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.dim = 0
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._codes: Optional[np.ndarray] = None
+        # Per-row dequantization scale (int8) and exact squared norm
+        self._scales: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        self._valid: Optional[np.ndarray] = None
+        self._exact: Optional[np.memmap] = None
+        self._log_lines = 0
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._rows
+
+    @property
+    def _capacity(self) -> int:
+        return 0 if self._codes is None else len(self._codes)
+
+    def memory_bytes(self) -> int:
+        """RAM held by the quantized rows and ids; full-precision vectors stay on disk."""
+        if self._codes is None:
+            return 0
+        arrays = self._codes.nbytes + self._scales.nbytes + self._norms.nbytes + self._valid.nbytes
+        return arrays + len(self._rows) * _ID_BYTES
+
+    def add_many(self, ids: List[str], vectors):
+        """Add or replace vectors by id."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(ids):
+            return
+        with self._lock:
+            if not self.dim:
+                self._initialize(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})")
+            assigned: Dict[str, int] = {}
+            for doc_id in ids:
+                if doc_id in assigned:
+                    continue
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = self._free.pop() if self._free else len(self._ids)
+                    if row == len(self._ids):
+                        self._ids.append(None)
+                assigned[doc_id] = row
+            # A repeated id keeps its last vector
+            rows = [assigned[doc_id] for doc_id in ids]
+            if len(self._ids) > self._capacity:
+                self._grow(len(self._ids))
+            rows = np.asarray(rows)
+            # Vectors reach the file before the log names their rows
+            self._exact[rows] = vectors
+            self._exact.flush()
+            self._quantize(rows, vectors)
+            for doc_id, row in zip(ids, rows.tolist()):
+                self._ids[row] = doc_id
+                self._rows[doc_id] = row
+            self._append_log([f"+{row} {doc_id}" for doc_id, row in zip(ids, rows.tolist())])
+
+    def remove_many(self, ids: List[str]):
+        with self._lock:
+            rows = [self._rows.pop(doc_id) for doc_id in ids if doc_id in self._rows]
+            for row in rows:
+                self._ids[row] = None
+                self._valid[row] = False
+            self._free.extend(rows)
+            self._append_log([f"-{row}" for row in rows])
+
+    def get_vectors(self, ids: List[str]) -> np.ndarray:
+        """Full-precision vectors for `ids`, which must be in the index."""
+        with self._lock:
+            rows = [self._rows[doc_id] for doc_id in ids]
+            return np.array(self._exact[rows], dtype=np.float32) if rows else np.empty((0, self.dim), np.float32)
+
+    def search(self, query, k: int, candidates: Optional[int] = None, ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        The `k` nearest ids to `query` as (id, squared L2 distance) pairs, closest first.
+        The quantized scan picks `candidates` rows (VECTOR_RERANK_CANDIDATES by
+        default), which are then ranked by their exact distance. With `ids`,
+        only those rows are considered; when they are no more than the
+        candidates, they are ranked exactly without the quantized scan.
+        """
+        return self.search_many([query], k, candidates, ids)[0]
+
+    def search_many(self, queries, k: int, candidates: Optional[int] = None, ids: Optional[Set[str]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        `search` for several queries at once. The quantized rows are scanned
+        in one pass per _SCAN_QUERIES queries, scoring each block of rows
+        against all of them with a single matrix product.
+        """
+        with self._lock:
+            # Arrays are replaced, not resized, when the index grows, so a
+            # consistent set can be read without holding the lock
+            codes, scales, norms, valid, exact, row_ids = (
+                self._codes, self._scales, self._norms, self._valid, self._exact, self._ids
+            )
+            count = len(row_ids)
+            scope = None
+            if ids is not None:
+                scope = np.fromiter((self._rows[doc_id] for doc_id in ids if doc_id in self._rows), dtype=np.int64)
+                scope.sort()
+        if codes is None or not count or k <= 0 or not len(queries) or (scope is not None and not len(scope)):
+            return [[] for _ in queries]
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        candidates = max(candidates or VECTOR_RERANK_CANDIDATES, 4 * k)
+
+        if scope is not None and len(scope) <= candidates:
+            row_sets = [scope] * len(queries)
+        else:
+            row_sets = []
+            for start in range(0, len(queries), _SCAN_QUERIES):
+                row_sets.extend(self._scan(queries[start:start + _SCAN_QUERIES], candidates, codes, scales, norms, valid, count, scope))
+        results = []
+        for query, rows in zip(queries, row_sets):
+            if rows is None:
+                results.append([])
+                continue
+            differences = np.asarray(exact[rows], dtype=np.float32) - query
+            distances = np.einsum("ij,ij->i", differences, differences)
+            order = np.argsort(distances, kind="stable")[:k]
+            results.append([(row_ids[row], float(distances[i])) for i, row in zip(order, rows[order]) if row_ids[row] is not None])
+        return results
+
+    def _scan(self, queries, candidates, codes, scales, norms, valid, count, scope) -> List[Optional[np.ndarray]]:
+        """For each query, the best `candidates` rows (of `scope`, or of all rows) by quantized score, sorted."""
+        # Ranking by x.q - |x|^2 / 2 is ranking by L2 distance to q
+        size = count if scope is None else len(scope)
+        scores = np.empty((size, len(queries)), dtype=np.float32)
+        for start in range(0, size, _SCAN_ROWS):
+            end = min(start + _SCAN_ROWS, size)
+            block = codes[start:end] if scope is None else codes[scope[start:end]]
+            scores[start:end] = block.astype(np.float32) @ queries.T
+        selection = slice(0, count) if scope is None else scope
+        scores *= scales[selection][:, None]
+        scores -= 0.5 * norms[selection][:, None]
+        live_rows = valid[selection]
+        scores[~live_rows] = -np.inf
+
+        top = min(candidates, int(live_rows.sum()))
+        if top == 0:
+            return [None] * len(queries)
+        row_sets = []
+        for column in scores.T:
+            picked = np.argpartition(-column, top - 1)[:top] if top < size else np.arange(size)
+            picked = picked[np.isfinite(column[picked])]
+            rows = picked if scope is None else scope[picked]
+            rows.sort()
+            row_sets.append(rows)
+        return row_sets
+
+    def clear(self):
+        """Delete the index and its files."""
+        with self._lock:
+            self._exact = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.dim = 0
+            self._ids, self._rows, self._free = [], {}, []
+            self._codes = self._scales = self._norms = self._valid = None
+            self._log_lines = 0
+
+    def _initialize(self, dim: int):
+        self.dim = dim
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": dim}, f)
+        self._grow(_INITIAL_CAPACITY)
+
+    def _grow(self, rows: int):
+        # Modest growth steps keep unused capacity, which costs RAM, small
+        capacity = max(_INITIAL_CAPACITY, self._capacity)
+        while capacity < rows:
+            capacity = int(capacity * 1.25)
+        old = self._capacity
+        dtype = np.int8 if self.quantization == "int8" else np.float16
+        codes = np.zeros((capacity, self.dim), dtype=dtype)
+        scales = np.ones(capacity, dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        valid = np.zeros(capacity, dtype=bool)
+        if old:
+            codes[:old], scales[:old], norms[:old], valid[:old] = self._codes, self._scales, self._norms, self._valid
+        exact_path = os.path.join(self.path, "vectors.f32")
+        with open(exact_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._exact = np.memmap(exact_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._codes, self._scales, self._norms, self._valid = codes, scales, norms, valid
+
+    def _quantize(self, rows: np.ndarray, vectors: np.ndarray):
+        self._norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        if self.quantization == "int8":
+            # Symmetric per-vector scale: the largest component maps to 127
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._codes[rows] = np.rint(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._codes[rows] = vectors.astype(np.float16)
+        self._valid[rows] = True
+
+    def _append_log(self, lines: List[str]):
+        if not lines:
+            return
+        with open(os.path.join(self.path, "ids.log"), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self._log_lines += len(lines)
+        if self._log_lines > 2 * len(self._rows) + _INITIAL_CAPACITY:
+            self._rewrite_log()
+
+    def _rewrite_log(self):
+        log_path = os.path.join(self.path, "ids.log")
+        with open(log_path + ".tmp", "w", encoding="utf-8") as f:
+            for doc_id, row in self._rows.items():
+                f.write(f"+{row} {doc_id}\n")
+        os.replace(log_path + ".tmp", log_path)
+        self._log_lines = len(self._rows)
+
+    def _load(self):
+        info_path = os.path.join(self.path, "index.json")
+        log_path = os.path.join(self.path, "ids.log")
+        if not os.path.isfile(info_path):
+            return
+        with open(info_path, encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        rows: Dict[str, int] = {}
+        if os.path.isfile(log_path):
+            by_row: Dict[int, str] = {}
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    # A line without its newline was cut off by a crash mid-write
+                    if not line.endswith("\n"):
+                        break
+                    self._log_lines += 1
+                    if line.startswith("+"):
+                        row, doc_id = line[1:-1].split(" ", 1)
+                        if by_row.get(int(row)) is not None:
+                            rows.pop(by_row[int(row)], None)
+                        previous = rows.get(doc_id)
+                        if previous is not None:
+                            by_row.pop(previous, None)
+                        by_row[int(row)] = doc_id
+                        rows[doc_id] = int(row)
+                    elif line.startswith("-"):
+                        doc_id = by_row.pop(int(line[1:-1]), None)
+                        if doc_id is not None:
+                            rows.pop(doc_id, None)
+        size = max(rows.values()) + 1 if rows else 0
+        self._grow(max(size, 1))
+        self._ids = [None] * size
+        for doc_id, row in rows.items():
+            self._ids[row] = doc_id
+        self._rows = rows
+        self._free = [row for row in range(size - 1, -1, -1) if self._ids[row] is None]
+        # Quantize in blocks, so restoring does not load every full vector at once
+        live = np.asarray(sorted(rows.values()), dtype=np.int64)
+        for start in range(0, len(live), _SCAN_ROWS):
+            block = live[start:start + _SCAN_ROWS]
+            self._quantize(block, np.asarray(self._exact[block], dtype=np.float32))
@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from app.services.ingestion import (
+    DEFAULT_COLLECTION,
+    VECTOR_BACKEND,
+    get_embeddings,
+    get_knowledge_base,
+    get_text_splitter,
+    get_vector_index,
+)
+from app.services.llm_client import get_llm_client
+from app.services.metrics import registry
+
+# Warm up in a background thread when the server starts. The API accepts
+# requests right away (anything not yet initialized is created on first use)
+# and /ready reports ready once warmup has finished.
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Seconds spent importing app.main, set by main.py
+_import_seconds: Optional[float] = None
+_state: Dict[str, Any] = {"status": "cold", "components": {}, "seconds": None, "finished_at": None}
+_lock = threading.Lock()
+
+
+def _warm_vector_store():
+    if VECTOR_BACKEND == "compact":
+        # Opens the index and quantizes its vectors
+        get_vector_index(DEFAULT_COLLECTION)
+        return
+    kb = get_knowledge_base(DEFAULT_COLLECTION)
+    # Chroma loads the vector index on the first query; run one so a real request doesn't pay for it
+    if kb.dim and kb.vector_store._collection.count():
+        kb.vector_store._collection.query(query_embeddings=[[0.0] * kb.dim], n_results=1)
+
+
+# Initialized in order: the vector store needs the embedding client
+COMPONENTS = (
+    ("embeddings", get_embeddings),
+    ("text_splitter", get_text_splitter),
+    ("vector_store", _warm_vector_store),
+    ("llm_client", get_llm_client),
+)
+
+
+def record_import_time(seconds: float):
+    global _import_seconds
+    _import_seconds = seconds
+
+
+def warmup() -> Dict[str, Any]:
+    """
+    Initialize the embedding client, text splitter, default vector store and
+    LLM client, timing each one. Concurrent callers wait for the run in
+    progress; once every component is up, later calls return immediately.
+    A failed component is reported and retried on the next call.
+    """
+    with _lock:
+        if _state["status"] == "ready":
+            return status()
+        _state["status"] = "warming"
+        start = time.perf_counter()
+        for name, init in COMPONENTS:
+            component_start = time.perf_counter()
+            try:
+                init()
+                _state["components"][name] = {"status": "ready"}
+            except Exception as e:
+                print(f"Warmup of {name} failed: {e}")
+                _state["components"][name] = {"status": "failed", "error": str(e)}
+            _state["components"][name]["seconds"] = round(time.perf_counter() - component_start, 4)
+        _state["seconds"] = round(time.perf_counter() - start, 4)
+        _state["finished_at"] = time.time()
+        failed = any(component["status"] != "ready" for component in _state["components"].values())
+        _state["status"] = "failed" if failed else "ready"
+        return status()
+
+
+def start_background_warmup() -> threading.Thread:
+    thread = threading.Thread(target=warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "ready": is_ready(),
+        "status": _state["status"],
+        "import_seconds": _import_seconds,
+        "warmup_seconds": _state["seconds"],
+        "components": {name: dict(component) for name, component in _state["components"].items()},
+    }
+
+
+def _collect_startup_metrics():
+    phases = [({"phase": "import"}, _import_seconds)]
+    if _state["seconds"] is not None:
+        phases.append(({"phase": "warmup"}, _state["seconds"]))
+    return [
+        ("qa_startup_seconds", "gauge", "Time spent importing the app and warming up its clients", [s for s in phases if s[1] is not None]),
+        ("qa_ready", "gauge", "1 once warmup has completed", [({}, 1 if is_ready() else 0)]),
+    ]
+
+
+registry.add_collector(_collect_startup_metrics)
@@ -2,7 +2,10 @@ import streamlit as st
 import requests
 import json
 import graphviz
+import io
 import os
+import time
+import zipfile
 
 # Backend API URL - use environment variable for deployment, fallback to localhost
 API_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
@@ -177,9 +180,10 @@ with st.sidebar:
     
     st.divider()
     st.markdown("### 🧠 Knowledge Base")
+    collection = st.text_input("Collection", value="default", help="Each team or project can use its own knowledge base")
     if st.button("🗑️ Clear Database", use_container_width=True):
         try:
-            requests.post(f"{API_URL}/clear-kb/")
+            requests.post(f"{API_URL}/clear-kb/", params={"collection": collection})
             st.success("✅ Database Cleared!")
         except:
             st.error("❌ Backend Offline")
@@ -343,14 +347,33 @@ with tab2:
             files = [("files", (file.name, file, file.type)) for file in uploaded_files]
             with st.spinner("🔄 Processing Knowledge Base..."):
                 try:
-                    response = requests.post(f"{API_URL}/ingest/", files=files)
-                    if response.status_code == 200:
-                        st.balloons()
-                        st.success(f"✅ Successfully ingested {len(uploaded_files)} files!")
-                        result = response.json()
+                    response = requests.post(f"{API_URL}/ingest/", files=files, params={"collection": collection})
+                    if response.status_code == 202:
+                        job_id = response.json()["job_id"]
+                        progress_bar = st.progress(0.0, text="⏳ Queued...")
+                        while True:
+                            job = requests.get(f"{API_URL}/ingest/jobs/{job_id}").json()
+                            done = job["files_done"] / max(job["files_total"], 1)
+                            progress_bar.progress(
+                                done,
+                                text=f"⚙️ {job['files_done']}/{job['files_total']} files | {job['chunks_embedded']} chunks embedded"
+                            )
+                            if job["status"] not in ("queued", "running"):
+                                break
+                            time.sleep(1)
+                        
+                        result = job.get("result") or {}
+                        failed = [f for f in result.get("files", []) if f["status"] != "ingested"]
+                        if job["status"] == "completed" and not failed:
+                            st.balloons()
+                            st.success(f"✅ Successfully ingested {len(uploaded_files)} files!")
+                        elif job["status"] == "completed":
+                            st.warning(f"⚠️ {len(failed)} file(s) could not be ingested")
+                        else:
+                            st.error(f"❌ Ingestion {job['status']}: {job.get('error') or ''}")
                         st.info(f"📊 Created {result.get('total_chunks', 0)} knowledge chunks")
                         with st.expander("📋 View Details"):
-                            st.json(result)
+                            st.json(job)
                     else:
                         st.error(f"❌ Error: {response.text}")
                 except Exception as e:
@@ -371,19 +394,47 @@ with tab3:
             height=180,
             help="Describe what you want to test in natural language"
         )
+        map_reduce = st.checkbox(
+            "🧩 Broad scope (split and generate in parallel)",
+            help="Split the knowledge base context into partitions, generate each one concurrently and merge the results"
+        )
         generate_btn = st.button("✨ GENERATE TESTS", use_container_width=True, type="primary")
     
     with col_r:
         if generate_btn:
             with st.spinner("🤖 AI Analyzing Knowledge Base..."):
                 try:
-                    response = requests.post(f"{API_URL}/generate-tests/", json={"query": user_query})
-                    if response.status_code == 200:
-                        test_cases = response.json().get("test_cases", [])
-                        st.session_state['test_cases'] = test_cases
-                        st.success(f"✅ Generated {len(test_cases)} Test Cases")
-                    else:
-                        st.error(f"❌ Error: {response.text}")
+                    # Stream test cases so they appear as soon as each one is generated
+                    with requests.post(f"{API_URL}/generate-tests/stream", json={"query": user_query, "collection": collection, "map_reduce": map_reduce}, stream=True) as response:
+                        if response.status_code == 200:
+                            test_cases = []
+                            live_status = st.empty()
+                            summary = {}
+                            for line in response.iter_lines():
+                                if not line:
+                                    continue
+                                event = json.loads(line)
+                                if event["event"] == "test_case":
+                                    test_cases.append(event["test_case"])
+                                    live_status.info(f"🧪 {len(test_cases)} test cases received... latest: {event['test_case'].get('Test_ID')}")
+                                elif event["event"] == "partition":
+                                    if event.get("error"):
+                                        st.warning(f"⚠️ Partition {event['focus']} failed: {event['error']}")
+                                elif event["event"] == "error":
+                                    st.error(f"❌ Generation stopped: {event['message']}")
+                                else:
+                                    summary = event
+                            live_status.empty()
+                            st.session_state['test_cases'] = test_cases
+                            st.success(f"✅ Generated {len(test_cases)} Test Cases")
+                            if summary.get("cached"):
+                                st.caption("⚡ Served from response cache")
+                            if summary.get("duplicates_removed"):
+                                st.caption(f"🧹 {summary['duplicates_removed']} near-duplicate test cases removed across {summary['partitions']} partitions")
+                            if summary.get("truncated"):
+                                st.warning("⚠️ The response was cut off; showing the test cases completed before that point")
+                        else:
+                            st.error(f"❌ Error: {response.text}")
                 except Exception as e:
                     st.error(f"❌ Connection Error: {e}")
 
@@ -425,8 +476,15 @@ with tab4:
                         }
                         response = requests.post(f"{API_URL}/generate-selenium/", json=payload)
                         if response.status_code == 200:
-                            script = response.json().get("selenium_script", "")
+                            result = response.json()
+                            script = result.get("selenium_script", "")
                             st.success("✅ Script Generated Successfully!")
+                            validation = result.get("validation") or {}
+                            if validation and not validation.get("valid", True):
+                                problems = [f"line {l['line']}: By.{l['by']} `{l['value']}` ({l['reason']})" for l in validation.get("invalid_locators", [])]
+                                if validation.get("syntax_error"):
+                                    problems.insert(0, f"line {validation['syntax_error']['line']}: {validation['syntax_error']['message']}")
+                                st.warning("⚠️ Some locators could not be verified against the page:\n\n" + "\n".join(f"- {p}" for p in problems))
                             st.code(script, language="python")
                             st.download_button(
                                 label="⬇️ Download Script",
@@ -442,6 +500,70 @@ with tab4:
             st.warning("⚠️ Please upload the target HTML file to proceed.")
     else:
         st.info("👈 Please select a test case from the 'Test Generation' tab first.")
+    
+    # Batch automation: one HTML upload, scripts for the whole generated suite
+    if st.session_state.get('test_cases'):
+        st.divider()
+        st.markdown("### 📦 Batch Automation")
+        suite = st.session_state['test_cases']
+        st.caption(f"Generate scripts for all {len(suite)} test cases against one page")
+        
+        batch_html = st.file_uploader(
+            "📄 Upload Target HTML for the whole suite",
+            type=["html"],
+            key="batch_html_uploader"
+        )
+        
+        if batch_html and st.button("🚀 GENERATE ALL SCRIPTS", use_container_width=True):
+            payload = {
+                "test_cases": suite,
+                "html_content": batch_html.getvalue().decode("utf-8"),
+                "format": "ndjson"
+            }
+            progress_bar = st.progress(0.0, text="⏳ Preparing page...")
+            scripts = {}
+            failures = []
+            try:
+                with requests.post(f"{API_URL}/generate-selenium/batch", json=payload, stream=True) as response:
+                    if response.status_code != 200:
+                        st.error(f"❌ Error: {response.text}")
+                    else:
+                        for line in response.iter_lines():
+                            if not line:
+                                continue
+                            event = json.loads(line)
+                            if event["event"] != "script":
+                                continue
+                            if "error" in event:
+                                failures.append(f"{event.get('Test_ID')}: {event['error']}")
+                            else:
+                                # Never overwrite a script whose test case shares a Test_ID
+                                file_name, suffix = event["file_name"], 2
+                                while file_name in scripts:
+                                    file_name = f"{event['file_name'][:-3]}_{suffix}.py"
+                                    suffix += 1
+                                scripts[file_name] = event["selenium_script"]
+                            progress_bar.progress(
+                                event["completed"] / event["total"],
+                                text=f"👨‍💻 {event['completed']}/{event['total']} scripts generated"
+                            )
+            except Exception as e:
+                st.error(f"❌ Connection Error: {e}")
+            
+            if scripts:
+                st.success(f"✅ Generated {len(scripts)} scripts")
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                    for file_name, script in scripts.items():
+                        zf.writestr(file_name, script)
+                st.download_button(
+                    label="⬇️ Download All Scripts (.zip)",
+                    data=archive.getvalue(),
+                    file_name="selenium_scripts.zip",
+                    mime="application/zip"
+                )
+            for failure in failures:
+                st.error(f"❌ {failure}")
 
 # Footer
 st.divider()
@@ -0,0 +1,97 @@
+import json
+from typing import Any, List
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally extracts complete objects from a JSON array that arrives in
+    pieces, e.g. a streamed LLM response. The array starts at the first `[`
+    followed, after optional whitespace, by `{` or `]`; anything before it
+    (a ```json fence, or a preface such as "Here are the cases [see below]:")
+    is skipped. Objects are returned as soon as their closing brace arrives,
+    so a truncated response still yields every object that was completed.
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.started = False
+        self.done = False
+        # A `[` was seen before the array started; the next non-space decides
+        self._opening = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume more text and return the objects completed by it."""
+        if self.done or not text:
+            return []
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self.done:
+            char = buffer[i]
+            if not self.started:
+                if self._opening and not char.isspace():
+                    self._opening = False
+                    if char in "{]":
+                        # The array starts here; handle this character as part of it
+                        self.started = True
+                        continue
+                if char == "[":
+                    self._opening = True
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode(buffer[self._start:i + 1])
+                    if item is not None:
+                        completed.append(item)
+                    self._start = None
+            elif char == "]" and self._depth == 0:
+                self.done = True
+            i += 1
+
+        # Keep only the unfinished object, so memory stays bounded by one item
+        keep_from = self._start if self._start is not None else i
+        self._buffer = buffer[keep_from:]
+        self._pos = i - keep_from
+        if self._start is not None:
+            self._start = 0
+        self.items.extend(completed)
+        return completed
+
+    @property
+    def truncated(self) -> bool:
+        """True if the array was never closed."""
+        return not self.done
+
+    @staticmethod
+    def _decode(text: str):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+
+def parse_json_array_prefix(text: str) -> List[Any]:
+    """Return every complete object in a possibly truncated JSON array."""
+    parser = JsonArrayStreamParser()
+    parser.feed(text)
+    return parser.items
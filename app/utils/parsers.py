@@ -1,5 +1,62 @@
+import codecs
+import functools
+import hashlib
 import json
-from bs4 import BeautifulSoup
+import os
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from bs4 import BeautifulSoup, Comment
+from app.utils.selenium_validation import LocatorIndex
+from app.utils.tokens import estimate_tokens
+
+# Number of compacted HTML pages kept, keyed by content hash
+HTML_INDEX_CACHE_SIZE = int(os.environ.get("HTML_INDEX_CACHE_SIZE", "64"))
+
+# Nodes that carry no semantics for locating or asserting on elements
+NON_SEMANTIC_TAGS = ["script", "style", "svg", "noscript", "iframe", "canvas", "template", "meta", "link", "object", "embed"]
+INTERACTIVE_TAGS = ["input", "button", "a", "form", "select", "textarea"]
+# Attributes worth showing the model besides id/name/class
+INDEX_ATTRIBUTES = ["type", "value", "placeholder", "href", "action", "method", "onclick", "onchange", "onsubmit", "required", "checked", "disabled", "aria-label", "role"]
+
+# HTML backend for uploaded documents: "lxml" (C parser), "html.parser" (standard
+# library) or "auto" (lxml when installed). Both stream events into the same
+# section extractor; no document tree is built.
+HTML_PARSER = os.environ.get("HTML_PARSER", "auto")
+# Parsed documents kept by content hash, so re-uploading a file skips parsing
+PARSE_CACHE_MAX_MB = float(os.environ.get("PARSE_CACHE_MAX_MB", "64"))
+
+# A section is (heading path, text); the splitter keeps chunks within sections
+Section = Tuple[str, str]
+# File content streamed as byte blocks
+Blocks = Iterable[bytes]
+# Streaming parsers emit a longer section in parts (at a paragraph break where
+# possible), so the text they hold does not grow with the file
+STREAM_SECTION_CHARS = 64 * 1024
+
+# Uploaded-document content that is never indexed
+SKIPPED_TAGS = {"script", "style", "svg", "noscript", "iframe", "canvas", "template", "head", "object"}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# Tags that end a line of text
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article", "header", "footer", "nav", "aside",
+    "main", "form", "label", "button", "option", "select", "textarea", "blockquote", "pre", "dt", "dd", "hr",
+} | set(HEADING_TAGS)
+# Inline tags whose neighbours would otherwise run together
+SPACED_TAGS = {"td", "th", "img", "input"}
+
+_MARKDOWN_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+_html_index_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_html_index_lock = threading.Lock()
+
+_parse_cache: "OrderedDict[str, List[Section]]" = OrderedDict()
+_parse_cache_sizes: Dict[str, int] = {}
+_parse_cache_bytes = 0
+_parse_cache_stats = {"hits": 0, "misses": 0}
+_parse_cache_lock = threading.Lock()
 
 def parse_text(file_content: bytes) -> str:
     return file_content.decode("utf-8")
@@ -8,21 +65,476 @@ def parse_markdown(file_content: bytes) -> str:
     return file_content.decode("utf-8")
 
 def parse_json(file_content: bytes) -> str:
-    data = json.loads(file_content.decode("utf-8"))
-    return json.dumps(data, indent=2)
+    return _join_sections(json_sections([file_content]))
 
 def parse_html(file_content: bytes) -> str:
-    soup = BeautifulSoup(file_content, "html.parser")
-    return soup.get_text(separator="\n")
+    return _join_sections(html_sections([file_content]))
 
-def parse_file(filename: str, content: bytes) -> str:
-    if filename.endswith(".txt"):
-        return parse_text(content)
-    elif filename.endswith(".md"):
-        return parse_markdown(content)
-    elif filename.endswith(".json"):
-        return parse_json(content)
-    elif filename.endswith(".html"):
-        return parse_html(content)
+def text_sections(blocks: Blocks) -> Iterator[Section]:
+    return _line_sections(blocks, headings=False)
+
+def markdown_sections(blocks: Blocks) -> Iterator[Section]:
+    """Split at ATX headings (outside code fences); each section is labelled with its heading path."""
+    return _line_sections(blocks, headings=True)
+
+def fallback_sections(blocks: Blocks) -> Iterator[Section]:
+    return _line_sections(blocks, headings=False, errors="ignore")
+
+def _line_sections(blocks: Blocks, headings: bool, errors: str = "strict") -> Iterator[Section]:
+    path: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    size = 0
+    in_fence = False
+    for line in _iter_lines(blocks, errors):
+        match = None
+        if headings:
+            if line.lstrip().startswith(("```", "~~~")):
+                in_fence = not in_fence
+            match = None if in_fence else _MARKDOWN_HEADING_RE.match(line)
+        if match:
+            yield from _section(path, lines)
+            lines, size = [], 0
+            level = len(match.group(1))
+            path = [heading for heading in path if heading[0] < level] + [(level, match.group(2))]
+        elif size >= STREAM_SECTION_CHARS and (not line.strip() or size >= 4 * STREAM_SECTION_CHARS):
+            # Emit a long section in parts, at a paragraph break where there is one
+            yield from _section(path, lines)
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line) + 1
+    yield from _section(path, lines)
+
+def _iter_lines(blocks: Blocks, errors: str = "strict") -> Iterator[str]:
+    """Decode UTF-8 blocks incrementally and yield lines without their line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors=errors)
+    pending = ""
+    for block in blocks:
+        pending += decoder.decode(block)
+        if "\n" not in pending:
+            continue
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line[:-1] if line.endswith("\r") else line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield from (line[:-1] if line.endswith("\r") else line for line in pending.split("\n"))
+
+def json_sections(blocks: Blocks) -> Iterator[Section]:
+    """
+    Flatten JSON into compact "key.path: value" lines, one section per
+    top-level key (or per element of a top-level or second-level array), so
+    each object is chunked on its own instead of as indented JSON. The
+    document itself is decoded in one piece, bounded by INGEST_MAX_FILE_MB.
+    """
+    data = json.loads(b"".join(blocks).decode("utf-8"))
+    units: List[Tuple[str, Any]] = []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, list) and any(isinstance(item, (dict, list)) for item in value):
+                units.extend((f"{key}[{index}]", item) for index, item in enumerate(value))
+            else:
+                units.append((str(key), value))
+    elif isinstance(data, list):
+        units = [(f"[{index}]", item) for index, item in enumerate(data)]
+    else:
+        units = [("", data)]
+
+    for path, value in units:
+        lines: List[str] = []
+        _flatten_json(path, value, lines)
+        yield path, "\n".join(lines)
+
+def _flatten_json(path: str, value: Any, lines: List[str]):
+    if isinstance(value, dict) and value:
+        for key, item in value.items():
+            _flatten_json(f"{path}.{key}" if path else str(key), item, lines)
+    elif isinstance(value, list) and value and any(isinstance(item, (dict, list)) for item in value):
+        for index, item in enumerate(value):
+            _flatten_json(f"{path}[{index}]", item, lines)
+    else:
+        if isinstance(value, str):
+            text = value
+        elif isinstance(value, list):
+            # Lists of scalars stay on one line
+            text = ", ".join(item if isinstance(item, str) else json.dumps(item) for item in value) if value else "[]"
+        else:
+            text = json.dumps(value)
+        lines.append(f"{path}: {text}" if path else text)
+
+class _HtmlSectionExtractor:
+    """
+    Collects visible text of an HTML document into sections that start at
+    each heading. Works as an lxml parser target and behind html.parser;
+    completed sections are taken with `drain()` while the document streams in.
+    """
+
+    def __init__(self):
+        self.sections: List[Section] = []
+        self._headings: List[Tuple[int, str]] = []
+        self._lines: List[str] = []
+        self._size = 0
+        self._line: List[str] = []
+        self._skip_depth = 0
+        self._heading_level = 0
+        self._heading_text: List[str] = []
+
+    def start(self, tag, attrib=None):
+        tag = tag.lower()
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif self._skip_depth:
+            return
+        elif tag in HEADING_TAGS:
+            self._end_line()
+            self._end_section()
+            self._heading_level = HEADING_TAGS[tag]
+            self._heading_text = []
+        elif tag in BLOCK_TAGS:
+            self._end_line()
+        elif tag in SPACED_TAGS:
+            self._line.append(" ")
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif self._skip_depth:
+            return
+        elif tag in HEADING_TAGS and self._heading_level:
+            title = " ".join("".join(self._heading_text).split())
+            level = self._heading_level
+            self._headings = [heading for heading in self._headings if heading[0] < level] + [(level, title)]
+            self._heading_level = 0
+            self._end_line()
+        elif tag in BLOCK_TAGS:
+            self._end_line()
+
+    def data(self, text):
+        if self._skip_depth:
+            return
+        self._line.append(text)
+        if self._heading_level:
+            self._heading_text.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self) -> List[Section]:
+        self._end_line()
+        self._end_section()
+        return self.sections
+
+    def drain(self) -> List[Section]:
+        sections, self.sections = self.sections, []
+        return sections
+
+    def _end_line(self):
+        line = " ".join("".join(self._line).split())
+        if line:
+            self._lines.append(line)
+            self._size += len(line) + 1
+        self._line = []
+        if self._size >= STREAM_SECTION_CHARS:
+            self._end_section()
+
+    def _end_section(self):
+        self.sections.extend(_section(self._headings, self._lines))
+        self._lines = []
+        self._size = 0
+
+class _StdlibHtmlParser(HTMLParser):
+    def __init__(self, target: _HtmlSectionExtractor):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.target.start(tag)
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+def html_backend() -> str:
+    """The HTML parser used for uploads, resolving "auto"."""
+    if HTML_PARSER != "auto":
+        return HTML_PARSER
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+def html_sections(blocks: Blocks) -> Iterator[Section]:
+    """Visible text of an HTML document, one section per heading, parsed as blocks arrive."""
+    extractor = _HtmlSectionExtractor()
+    if html_backend() == "lxml":
+        from lxml import etree
+
+        parser = etree.HTMLParser(target=extractor, encoding="utf-8")
+        fed = False
+        for block in blocks:
+            if block:
+                parser.feed(block)
+                fed = True
+                yield from extractor.drain()
+        if fed:
+            parser.close()
     else:
-        return content.decode("utf-8", errors="ignore")
+        parser = _StdlibHtmlParser(extractor)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        for block in blocks:
+            parser.feed(decoder.decode(block))
+            yield from extractor.drain()
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        extractor.close()
+    yield from extractor.drain()
+
+# Section parsers by file extension. Each takes the file as an iterable of
+# byte blocks and yields sections; register_parser adds or replaces one.
+PARSERS: Dict[str, Callable[[Blocks], Iterable[Section]]] = {
+    ".txt": text_sections,
+    ".md": markdown_sections,
+    ".markdown": markdown_sections,
+    ".json": json_sections,
+    ".html": html_sections,
+    ".htm": html_sections,
+}
+
+# Extensions that name the same document type in chunk metadata
+DOC_TYPE_ALIASES = {"markdown": "md", "htm": "html"}
+
+def document_type(filename: str) -> str:
+    """The `doc_type` recorded on a file's chunks: its lowercased extension, or "text" without one."""
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return DOC_TYPE_ALIASES.get(extension, extension) or "text"
+
+def register_parser(extension: str, parser: Callable, streaming: bool = False):
+    """
+    Parse files ending in `extension` (e.g. ".csv") with `parser`, which
+    returns sections. A streaming parser receives an iterable of byte blocks;
+    any other receives the whole file content as bytes.
+    """
+    if not streaming:
+        whole_file = parser
+
+        @functools.wraps(whole_file)
+        def parser(blocks: Blocks) -> Iterable[Section]:
+            return whole_file(b"".join(blocks))
+    PARSERS[extension.lower()] = parser
+    clear_parse_cache()
+
+def iter_sections(filename: str, blocks: Blocks, content_hash: Optional[str] = None) -> Iterator[Section]:
+    """
+    Parse a file, given as an iterable of byte blocks, into (heading path,
+    text) sections with the parser for its extension. Sections are yielded
+    as they are parsed. With `content_hash`, results are cached, so
+    re-uploading the same file (under any name) does not parse it again.
+    """
+    global _parse_cache_bytes
+    extension = os.path.splitext(filename)[1].lower()
+    parser = PARSERS.get(extension, fallback_sections)
+    key = f"{parser.__module__}.{parser.__qualname__}:{content_hash}" if content_hash else None
+    if key is not None:
+        with _parse_cache_lock:
+            sections = _parse_cache.get(key)
+            if sections is not None:
+                _parse_cache.move_to_end(key)
+                _parse_cache_stats["hits"] += 1
+            else:
+                _parse_cache_stats["misses"] += 1
+        if sections is not None:
+            yield from sections
+            return
+
+    limit = PARSE_CACHE_MAX_MB * 1024 * 1024
+    collected: Optional[List[Section]] = [] if key is not None else None
+    size = 0
+    for section, text in parser(blocks):
+        if not text.strip():
+            continue
+        if collected is not None:
+            size += len(section) + len(text)
+            # Files too large for the cache are only streamed
+            collected = collected if size <= limit else None
+            if collected is not None:
+                collected.append((section, text))
+        yield section, text
+
+    if collected is not None:
+        with _parse_cache_lock:
+            if key not in _parse_cache:
+                _parse_cache[key] = collected
+                _parse_cache_sizes[key] = size
+                _parse_cache_bytes += size
+                while _parse_cache_bytes > limit:
+                    evicted, _ = _parse_cache.popitem(last=False)
+                    _parse_cache_bytes -= _parse_cache_sizes.pop(evicted)
+
+def parse_sections(filename: str, content: bytes) -> List[Section]:
+    return list(iter_sections(filename, [content], hashlib.sha256(content).hexdigest()))
+
+def parse_file(filename: str, content: bytes) -> str:
+    return _join_sections(parse_sections(filename, content))
+
+def parse_cache_stats() -> Dict[str, float]:
+    with _parse_cache_lock:
+        return {**_parse_cache_stats, "entries": len(_parse_cache), "bytes": _parse_cache_bytes}
+
+def clear_parse_cache():
+    global _parse_cache_bytes
+    with _parse_cache_lock:
+        _parse_cache.clear()
+        _parse_cache_sizes.clear()
+        _parse_cache_bytes = 0
+
+def _section(headings: List[Tuple[int, str]], lines: List[str]) -> Iterator[Section]:
+    text = "\n".join(lines).strip("\n")
+    if text.strip():
+        yield " > ".join(title for _, title in headings), text
+
+def _join_sections(sections: Iterable[Section]) -> str:
+    return "\n\n".join(text for _, text in sections)
+
+def get_page_index(html_content: str) -> Dict[str, Any]:
+    """
+    Build (or fetch from cache) a compact index of a page for Selenium prompting.
+    Non-semantic nodes are stripped and every interactive element, plus any
+    other element with an id, is listed with its id, name, classes, label and
+    a stable XPath. A LocatorIndex of the full page is built alongside, for
+    validating generated scripts. The result is cached by a hash of the HTML.
+    """
+    html_hash = hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+    with _html_index_lock:
+        if html_hash in _html_index_cache:
+            _html_index_cache.move_to_end(html_hash)
+            return _html_index_cache[html_hash]
+
+    elements = extract_interactive_elements(html_content)
+    prompt = format_page_index(elements)
+    locators = LocatorIndex(html_content)
+    page_index = {
+        "html_hash": html_hash,
+        "elements": elements,
+        "prompt": prompt,
+        "raw_tokens": estimate_tokens(html_content),
+        "compact_tokens": estimate_tokens(prompt),
+        "locators": locators,
+    }
+
+    with _html_index_lock:
+        _html_index_cache[html_hash] = page_index
+        while len(_html_index_cache) > HTML_INDEX_CACHE_SIZE:
+            _html_index_cache.popitem(last=False)
+    return page_index
+
+def compact_html(html_content: str) -> BeautifulSoup:
+    """
+    Parse HTML and remove scripts, styles, SVGs, comments and other nodes
+    that do not help locate or assert on elements.
+    """
+    soup = BeautifulSoup(html_content, "html.parser")
+    for node in soup.find_all(NON_SEMANTIC_TAGS):
+        node.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    return soup
+
+def extract_interactive_elements(html_content: str) -> List[Dict[str, Any]]:
+    soup = compact_html(html_content)
+    labels = {
+        label["for"]: label.get_text(" ", strip=True)
+        for label in soup.find_all("label")
+        if label.get("for")
+    }
+
+    elements = []
+    for node in soup.find_all(True):
+        if node.name not in INTERACTIVE_TAGS and not node.get("id"):
+            continue
+        element = {"tag": node.name, "xpath": stable_xpath(node)}
+        for attr in ("id", "name"):
+            if node.get(attr):
+                element[attr] = node[attr]
+        if node.get("class"):
+            element["class"] = " ".join(node["class"])
+
+        label = _element_label(node, labels)
+        if label:
+            element["label"] = label
+        if node.name not in ("form", "select") and node.name in INTERACTIVE_TAGS:
+            text = node.get_text(" ", strip=True)
+            if text:
+                element["text"] = text[:80]
+        elif node.name not in INTERACTIVE_TAGS:
+            # Containers with ids (messages, totals) are listed for assertions
+            text = node.get_text(" ", strip=True)
+            if text and len(node.find_all(True)) <= 2:
+                element["text"] = text[:80]
+
+        for attr in INDEX_ATTRIBUTES:
+            value = node.get(attr)
+            if value is not None:
+                element[attr] = value if isinstance(value, str) else " ".join(value)
+        elements.append(element)
+    return elements
+
+def _element_label(node, labels: Dict[str, str]) -> str:
+    if node.get("id") in labels:
+        return labels[node["id"]]
+    parent_label = node.find_parent("label")
+    if parent_label is not None:
+        return parent_label.get_text(" ", strip=True)
+    if node.get("aria-label"):
+        return node["aria-label"]
+    if node.name == "input" and node.get("type") in ("radio", "checkbox"):
+        # Radio/checkbox captions are usually the text right after the input
+        sibling = node.next_sibling
+        if isinstance(sibling, str) and sibling.strip():
+            return sibling.strip()
+    return ""
+
+def stable_xpath(node) -> str:
+    """
+    XPath anchored on the element's own id, or on the nearest ancestor with an
+    id, falling back to a positional path from the document root.
+    """
+    if node.get("id"):
+        return f"//*[@id={xpath_literal(node['id'])}]"
+    if node.name == "input" and node.get("name") and node.get("type") in ("radio", "checkbox"):
+        return f"//input[@name={xpath_literal(node['name'])} and @value={xpath_literal(node.get('value', ''))}]"
+
+    steps = []
+    current = node
+    while current is not None and current.name and current.name != "[document]":
+        if current is not node and current.get("id"):
+            return f"//*[@id={xpath_literal(current['id'])}]/" + "/".join(reversed(steps))
+        position = len(current.find_previous_siblings(current.name)) + 1
+        steps.append(f"{current.name}[{position}]")
+        current = current.parent
+    return "/" + "/".join(reversed(steps))
+
+def xpath_literal(value: str) -> str:
+    """Quote a string for XPath 1.0, which has no escapes: concat() joins the parts when it holds both quote kinds."""
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in value.split("'")) + ")"
+
+def format_page_index(elements: List[Dict[str, Any]]) -> str:
+    """One line per element: compact enough for the prompt, explicit enough to pick locators."""
+    lines = []
+    for element in elements:
+        fields = [element["tag"]]
+        fields += [f'{key}="{value}"' for key, value in element.items() if key not in ("tag", "xpath")]
+        fields.append(f"xpath={element['xpath']}")
+        lines.append(" | ".join(fields))
+    return "\n".join(lines)
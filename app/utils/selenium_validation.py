@@ -0,0 +1,187 @@
+import ast
+import threading
+from typing import Any, Dict, List, Optional, Set
+from bs4 import BeautifulSoup
+
+# Selenium `By` strategies that are checked against the page, with the string
+# values Selenium also accepts in their place (find_element("id", ...))
+LOCATOR_STRATEGIES = {
+    "ID": "id",
+    "NAME": "name",
+    "CLASS_NAME": "class name",
+    "CSS_SELECTOR": "css selector",
+    "XPATH": "xpath",
+}
+_STRATEGY_BY_VALUE = {value: name for name, value in LOCATOR_STRATEGIES.items()}
+_FIND_METHODS = {"find_element", "find_elements"}
+
+
+class LocatorIndex:
+    """
+    Answers whether a Selenium locator matches anything on a page, without a
+    browser: ids, names and classes are looked up in sets, XPath expressions
+    run against an lxml tree of the page and CSS selectors against a
+    BeautifulSoup tree (parsed on the first CSS check). Built once per page
+    by get_page_index; the full page is indexed, not the compacted prompt view.
+    """
+
+    def __init__(self, html_content: str):
+        self.html_content = html_content
+        self.ids: Set[str] = set()
+        self.names: Set[str] = set()
+        self.classes: Set[str] = set()
+        self._soup = None
+        self._lock = threading.Lock()
+        try:
+            from lxml import etree
+        except ImportError:
+            # Without lxml, XPath locators are reported as unchecked
+            self.tree = None
+            self.xpath_supported = False
+            for node in self.soup.find_all(True):
+                self._add(node.get("id"), node.get("name"), " ".join(node.get("class") or []))
+            return
+        self.xpath_supported = True
+        self.tree = etree.HTML(html_content.encode("utf-8")) if html_content.strip() else None
+        if self.tree is not None:
+            for node in self.tree.iter(tag=etree.Element):
+                self._add(node.get("id"), node.get("name"), node.get("class"))
+
+    @property
+    def soup(self):
+        with self._lock:
+            if self._soup is None:
+                self._soup = BeautifulSoup(self.html_content, "html.parser")
+            return self._soup
+
+    def check(self, strategy: str, value: str) -> Optional[str]:
+        """None if the locator matches an element, otherwise the reason it does not."""
+        if strategy == "ID":
+            return None if value in self.ids else "no element has this id"
+        if strategy == "NAME":
+            return None if value in self.names else "no element has this name"
+        if strategy == "CLASS_NAME":
+            if not value.strip() or len(value.split()) > 1:
+                return "CLASS_NAME takes a single class name; use a CSS selector for several"
+            return None if value.strip() in self.classes else "no element has this class"
+        if strategy == "CSS_SELECTOR":
+            soup = self.soup
+            try:
+                with self._lock:
+                    found = soup.select_one(value)
+            except Exception as e:
+                return f"invalid CSS selector: {str(e).splitlines()[0]}"
+            return None if found is not None else "no element matches this selector"
+        if strategy == "XPATH":
+            if self.tree is None:
+                return "no element matches this XPath"
+            try:
+                with self._lock:
+                    found = self.tree.xpath(value)
+            except Exception as e:
+                return f"invalid XPath: {str(e).splitlines()[0]}"
+            return None if found else "no element matches this XPath"
+        return None
+
+    def _add(self, element_id: Optional[str], name: Optional[str], classes: Optional[str]):
+        if element_id:
+            self.ids.add(element_id)
+        if name:
+            self.names.add(name)
+        if classes:
+            self.classes.update(classes.split())
+
+
+def extract_locators(tree: ast.AST) -> List[Dict[str, Any]]:
+    """
+    Every (strategy, value) locator in a parsed script: `By.X, "value"` pairs
+    in call arguments, tuples and lists (find_element, expected_conditions
+    locators), the `by=`/`value=` keywords, and find_element with a strategy
+    string. Values that are not string literals are returned with value None.
+    """
+    locators = []
+    for node in ast.walk(tree):
+        sequences = []
+        if isinstance(node, ast.Call):
+            sequences.append(node.args)
+            keywords = {keyword.arg: keyword.value for keyword in node.keywords if keyword.arg}
+            if "by" in keywords:
+                sequences.append([keywords["by"], keywords.get("value")])
+            method = node.func.attr if isinstance(node.func, ast.Attribute) else None
+            if method in _FIND_METHODS and node.args and _string(node.args[0]) in _STRATEGY_BY_VALUE:
+                locators.append(_locator(_STRATEGY_BY_VALUE[_string(node.args[0])], node.args[1:2], node))
+        elif isinstance(node, (ast.Tuple, ast.List)):
+            sequences.append(node.elts)
+        for elements in sequences:
+            for position, element in enumerate(elements):
+                strategy = _by_strategy(element)
+                if strategy is not None:
+                    locators.append(_locator(strategy, elements[position + 1:position + 2], element))
+    # A locator inside a call's tuple argument is seen once per enclosing node
+    unique = {(locator["line"], locator["column"], locator["by"]): locator for locator in locators}
+    return sorted(unique.values(), key=lambda locator: (locator["line"], locator["column"]))
+
+
+def validate_script(script: str, locators: LocatorIndex) -> Dict[str, Any]:
+    """
+    Check that a generated script parses and that every literal locator in
+    it matches an element of the page. Returns a report with the syntax
+    error (if any), the number of locators checked and the invalid ones.
+    """
+    report: Dict[str, Any] = {
+        "valid": True,
+        "syntax_error": None,
+        "locators_checked": 0,
+        "unchecked_locators": 0,
+        "invalid_locators": [],
+    }
+    try:
+        tree = ast.parse(script)
+    except SyntaxError as e:
+        report["valid"] = False
+        report["syntax_error"] = {"message": e.msg, "line": e.lineno}
+        return report
+    for locator in extract_locators(tree):
+        if locator["value"] is None or (locator["by"] == "XPATH" and not locators.xpath_supported):
+            report["unchecked_locators"] += 1
+            continue
+        report["locators_checked"] += 1
+        reason = locators.check(locator["by"], locator["value"])
+        if reason is not None:
+            report["invalid_locators"].append(
+                {"by": locator["by"], "value": locator["value"], "line": locator["line"], "reason": reason}
+            )
+    report["valid"] = not report["invalid_locators"]
+    return report
+
+
+def problem_count(report: Dict[str, Any]) -> int:
+    return len(report["invalid_locators"]) + (1 if report["syntax_error"] else 0)
+
+
+def format_problems(report: Dict[str, Any]) -> str:
+    """The failures of a validation report, one per line, for a repair prompt."""
+    lines = []
+    if report["syntax_error"]:
+        error = report["syntax_error"]
+        lines.append(f"- line {error['line']}: the script does not parse ({error['message']})")
+    for locator in report["invalid_locators"]:
+        lines.append(f"- line {locator['line']}: By.{locator['by']} {locator['value']!r} ({locator['reason']})")
+    return "\n".join(lines)
+
+
+def _by_strategy(node: Optional[ast.AST]) -> Optional[str]:
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "By":
+        return node.attr if node.attr in LOCATOR_STRATEGIES else None
+    return None
+
+
+def _string(node: Optional[ast.AST]) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _locator(strategy: str, following: List[ast.AST], node: ast.AST) -> Dict[str, Any]:
+    value = _string(following[0]) if following else None
+    return {"by": strategy, "value": value, "line": node.lineno, "column": node.col_offset}
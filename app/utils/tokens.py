@@ -0,0 +1,10 @@
+import math
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for prompt budgeting (about 4 characters per token for
+    English text and markup). Good enough to compare prompt sizes without a
+    tokenizer round-trip.
+    """
+    return math.ceil(len(text) / 4) if text else 0
@@ -0,0 +1,498 @@
+"""
+Offline benchmark suite for the QA Agent backend.
+
+Runs without network access or API keys: embeddings come from the
+deterministic HashEmbeddings backend and the LLM from a canned-response
+StubBackend. Measures:
+  - ingestion throughput (docs/s, chunks/s) for each corpus size
+  - retrieve_context p50/p99 latency per retrieval mode as the corpus grows
+  - end-to-end /generate-tests/ latency (fresh and cached), i.e. the
+    service's own overhead around the LLM call
+  - cold start: `import app.main` and warmup time in a fresh interpreter
+  - vector memory per chunk and recall@10 of the compact int8/float16 index
+    against exact search, next to Chroma's HNSW index
+  - batch retrieval against the same queries one by one, with a simulated
+    round trip per embedding backend call
+  - map-reduce test generation against one call over the same context, with
+    generation time proportional to response length
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 100,1000 --queries 200 --output bench.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/results/previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+# Offline backends must be selected before the app modules read their settings
+os.environ["EMBEDDING_BACKEND"] = "hash"
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["VECTOR_STORE_MODE"] = "memory"
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import numpy as np
+
+from app.services import ingestion
+from app.services.llm_client import LLMClient, StubBackend, set_llm_client
+from app.services.embeddings import HashEmbeddings
+from app.services.llm_service import generate_test_cases, generate_test_cases_map_reduce
+from app.services.rag_service import RETRIEVAL_MODES, retrieve_context, retrieve_context_batch, retrieve_context_partitions
+from app.utils.tokens import estimate_tokens
+from app.services.vector_index import QUANTIZATIONS, CompactVectorIndex
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+FEATURES = ["checkout", "cart", "discount", "payment", "shipping", "login", "search", "profile", "wishlist", "invoice"]
+WORDS = (
+    "user clicks button form field validation error message total price quantity item "
+    "address email password card expiry submit cancel confirm redirect page modal banner "
+    "code coupon apply remove update display show hide enabled disabled required optional "
+    "express standard delivery tax currency rounding session timeout retry network offline"
+).split()
+
+
+def build_corpus(size: int, seed: int = 7) -> List[Tuple[str, bytes]]:
+    """Deterministic synthetic spec documents (Markdown, text and JSON) of a few KB each."""
+    rng = random.Random(seed)
+    files = []
+    for index in range(size):
+        feature = FEATURES[index % len(FEATURES)]
+        code = f"{feature[:4].upper()}{index}"
+        paragraphs = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 90))) + f" Reference {code}."
+            for _ in range(rng.randint(3, 7))
+        ]
+        kind = index % 3
+        if kind == 0:
+            name = f"spec_{index}.md"
+            body = f"# {feature.title()} {index}\n\n" + "\n\n".join(f"## Rule {n}\n{text}" for n, text in enumerate(paragraphs))
+        elif kind == 1:
+            name = f"guide_{index}.txt"
+            body = "\n\n".join(paragraphs)
+        else:
+            name = f"rules_{index}.json"
+            body = json.dumps({"feature": feature, "code": code, "rules": paragraphs})
+        files.append((name, body.encode("utf-8")))
+    return files
+
+
+def build_queries(count: int, corpus_size: int, seed: int = 11) -> List[str]:
+    """A mix of natural-language queries and exact-code lookups."""
+    rng = random.Random(seed)
+    queries = []
+    for index in range(count):
+        feature = rng.choice(FEATURES)
+        if index % 4 == 0:
+            queries.append(f"What does {feature[:4].upper()}{rng.randrange(corpus_size)} do?")
+        else:
+            queries.append(f"Test the {feature} {rng.choice(WORDS)} {rng.choice(WORDS)} behaviour")
+    return queries
+
+
+def canned_test_cases(prompt: str) -> str:
+    """Canned LLM response: a ten-case suite, or a short script for Selenium prompts."""
+    if "Selenium" in prompt:
+        return "from selenium.webdriver.common.by import By\n\ndef test_case(driver):\n    driver.find_element(By.ID, 'submit').click()\n"
+    cases = [
+        {
+            "Test_ID": f"TC{n:03d}",
+            "Feature": "Benchmark",
+            "Test_Scenario": f"Canned scenario {n}",
+            "Expected_Result": "Canned expected result",
+            "Grounded_In": "benchmark",
+        }
+        for n in range(1, 11)
+    ]
+    return "```json\n" + json.dumps(cases, indent=2) + "\n```"
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def reset_store():
+    ingestion.clear_knowledge_base()
+    ingestion.get_embeddings().cache.clear()
+
+
+def bench_ingest(corpus: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+    reset_store()
+    start = time.perf_counter()
+    result = ingestion.ingest_files(corpus)
+    elapsed = time.perf_counter() - start
+    failed = [file["filename"] for file in result["files"] if file["status"] != "ingested"]
+    if failed:
+        raise RuntimeError(f"Benchmark ingestion failed for {failed[:5]}")
+    return {
+        "docs": len(corpus),
+        "chunks": result["total_chunks"],
+        "bytes": sum(len(content) for _, content in corpus),
+        "seconds": round(elapsed, 4),
+        "docs_per_s": round(len(corpus) / elapsed, 2),
+        "chunks_per_s": round(result["total_chunks"] / elapsed, 2),
+    }
+
+
+def bench_retrieve(queries: List[str], mode: str) -> Dict[str, Any]:
+    # Warm up lazily built structures so they are not counted in the first sample
+    retrieve_context(queries[0], mode=mode)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        retrieve_context(query, mode=mode)
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def bench_generate_tests(queries: List[str]) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    fresh, cached = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = client.post("/generate-tests/", json={"query": query, "bypass_cache": True})
+        fresh.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+        start = time.perf_counter()
+        response = client.post("/generate-tests/", json={"query": query})
+        cached.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return {"fresh": latency_summary(fresh), "cached": latency_summary(cached)}
+
+
+def bench_vector_backends(queries: List[str], k: int = 10) -> List[Dict[str, Any]]:
+    """
+    Memory and recall@k of the compact vector index, in each quantization,
+    against the store just ingested. Ground truth is an exact search over the
+    full-precision vectors; Chroma's HNSW index is measured against it too
+    when it is the active backend. Memory counts vector storage only.
+    """
+    kb = ingestion.get_knowledge_base()
+    ids = kb.vector_store._collection.get(include=[])["ids"]
+    if ingestion.VECTOR_BACKEND == "compact":
+        vectors = ingestion.get_vector_index().get_vectors(ids)
+    else:
+        vectors = np.asarray(kb.vector_store._collection.get(ids=ids, include=["embeddings"])["embeddings"], dtype=np.float32)
+    query_vectors = [np.asarray(ingestion.get_embeddings().embed_query(query), dtype=np.float32) for query in queries]
+    rows = {doc_id: row for row, doc_id in enumerate(ids)}
+    n = min(k, len(ids))
+
+    def measure(search) -> Dict[str, Any]:
+        samples, found = [], 0
+        for query in query_vectors:
+            start = time.perf_counter()
+            hits = search(query)
+            samples.append(time.perf_counter() - start)
+            # Hash embeddings tie often: any chunk as close as the exact k-th neighbour counts
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            cutoff = np.partition(distances, n - 1)[n - 1] + 1e-6
+            found += min(n, sum(1 for doc_id in set(hits) if distances[rows[doc_id]] <= cutoff))
+        return {"recall": round(found / (n * len(query_vectors)), 4), **latency_summary(samples)}
+
+    results = []
+    if ingestion.VECTOR_BACKEND == "chroma":
+        search = lambda query: kb.vector_store._collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+        results.append({"backend": "chroma", "bytes_per_chunk": vectors.shape[1] * 4, **measure(search)})
+    for quantization in QUANTIZATIONS:
+        with tempfile.TemporaryDirectory() as path:
+            index = CompactVectorIndex(path, quantization)
+            index.add_many(ids, vectors)
+            search = lambda query: [doc_id for doc_id, _ in index.search(query, k)]
+            entry = {"backend": f"compact-{quantization}", "bytes_per_chunk": round(index.memory_bytes() / len(ids), 1), **measure(search)}
+            index.clear()
+        results.append(entry)
+    return results
+
+
+class RoundTripEmbeddings(HashEmbeddings):
+    """Hash embeddings that wait `delay` seconds per call, standing in for the network round trip to Gemini."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.delay)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.delay)
+        return super().embed_query(text)
+
+
+def bench_batch_retrieval(queries: List[str], mode: str = "vector", round_trip_ms: float = 20.0) -> Dict[str, Any]:
+    """
+    Time retrieve_context over `queries` one by one against one
+    retrieve_context_batch call, with uncached query embeddings and
+    `round_trip_ms` added to every embedding backend call.
+    """
+    embeddings = ingestion.get_embeddings()
+    backend = embeddings.backend
+    embeddings.backend = RoundTripEmbeddings(round_trip_ms / 1000)
+    try:
+        embeddings.cache.clear()
+        start = time.perf_counter()
+        for query in queries:
+            retrieve_context(query, mode=mode)
+        sequential = time.perf_counter() - start
+        sequential_calls, embeddings.backend.calls = embeddings.backend.calls, 0
+
+        embeddings.cache.clear()
+        start = time.perf_counter()
+        retrieve_context_batch(queries, mode=mode)
+        batch = time.perf_counter() - start
+        batch_calls = embeddings.backend.calls
+    finally:
+        embeddings.backend = backend
+    return {
+        "queries": len(queries),
+        "mode": mode,
+        "round_trip_ms": round_trip_ms,
+        "sequential_ms": round(sequential * 1000, 3),
+        "batch_ms": round(batch * 1000, 3),
+        "sequential_embed_calls": sequential_calls,
+        "batch_embed_calls": batch_calls,
+        "speedup": round(sequential / batch, 2) if batch else None,
+    }
+
+
+def scaled_test_cases(prompt: str) -> str:
+    """Canned LLM response with three cases per context block, so longer contexts get longer suites."""
+    context = prompt.split("Context:", 1)[-1].split("User Request:", 1)[0]
+    sources = [line[len("Source: "):] for line in context.splitlines() if line.strip().startswith("Source: ")]
+    cases = [
+        {
+            "Test_ID": f"TC{n + 1:03d}",
+            "Feature": "Benchmark",
+            "Test_Scenario": f"{source.strip()} " + " ".join(WORDS[(n * 5 + i) % len(WORDS)] for i in range(5)),
+            "Expected_Result": "Canned expected result",
+            "Grounded_In": source.strip(),
+        }
+        for n, source in enumerate(source for source in sources for _ in range(3))
+    ]
+    return "```json\n" + json.dumps(cases, indent=2) + "\n```"
+
+
+class TokenRateBackend(StubBackend):
+    """Stub LLM whose response time grows with response length, like real generation."""
+
+    def __init__(self, seconds_per_token: float):
+        super().__init__(scaled_test_cases)
+        self.seconds_per_token = seconds_per_token
+
+    async def generate(self, model: str, prompt: str) -> str:
+        text = self.responder(prompt)
+        await asyncio.sleep(estimate_tokens(text) * self.seconds_per_token)
+        return text
+
+
+def bench_map_reduce(query: str, ms_per_token: float = 2.0) -> Dict[str, Any]:
+    """
+    Time map-reduce generation over the partitions of a broad query against
+    one call whose context is all of those partitions together, with the LLM
+    taking `ms_per_token` per response token.
+    """
+    partitions = retrieve_context_partitions(query)
+    set_llm_client(LLMClient(TokenRateBackend(ms_per_token / 1000), rate=0, max_concurrency=len(partitions) or 1))
+    try:
+        start = time.perf_counter()
+        single = asyncio.run(generate_test_cases("".join(partition["context"] for partition in partitions), query))
+        single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        merged = asyncio.run(generate_test_cases_map_reduce(partitions, query))
+        map_reduce_seconds = time.perf_counter() - start
+    finally:
+        set_llm_client(LLMClient(StubBackend(canned_test_cases), rate=0))
+    return {
+        "partitions": len(partitions),
+        "ms_per_token": ms_per_token,
+        "single_call_ms": round(single_seconds * 1000, 3),
+        "single_call_cases": len(single),
+        "map_reduce_ms": round(map_reduce_seconds * 1000, 3),
+        "map_reduce_cases": len(merged["test_cases"]),
+        "duplicates_removed": merged["duplicates_removed"],
+        "speedup": round(single_seconds / map_reduce_seconds, 2) if map_reduce_seconds else None,
+    }
+
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+from app.services.warmup import warmup
+state = warmup()
+print(json.dumps({"import_s": imported, "warmup_s": state["warmup_seconds"], "ready": state["ready"]}))
+"""
+
+
+def bench_startup(runs: int) -> Dict[str, Any]:
+    """Import and warmup time of the API in fresh interpreters (median of `runs`)."""
+    samples = []
+    for _ in range(runs):
+        env = {**os.environ, "WARMUP_ON_STARTUP": "false"}
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True, env=env
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "runs": runs,
+        "import_ms": round(float(np.median([sample["import_s"] for sample in samples])) * 1000, 1),
+        "warmup_ms": round(float(np.median([sample["warmup_s"] for sample in samples])) * 1000, 1),
+        "ready": all(sample["ready"] for sample in samples),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print relative change against a previous results file (positive = slower / less throughput)."""
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}), positive = slower:")
+    old_ingest = {entry["docs"]: entry for entry in baseline.get("ingest", [])}
+    for entry in results["ingest"]:
+        old = old_ingest.get(entry["docs"])
+        if old:
+            change = (old["chunks_per_s"] - entry["chunks_per_s"]) / old["chunks_per_s"] * 100
+            print(f"  ingest {entry['docs']:>6} docs: {entry['chunks_per_s']:>10.1f} chunks/s ({change:+.1f}%)")
+    old_retrieve = {(entry["docs"], entry["mode"]): entry for entry in baseline.get("retrieve", [])}
+    for entry in results["retrieve"]:
+        old = old_retrieve.get((entry["docs"], entry["mode"]))
+        if old:
+            change = (entry["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+            print(f"  retrieve {entry['mode']:>7} @ {entry['docs']:>6} docs: p50 {entry['p50_ms']:.3f} ms ({change:+.1f}%)")
+    old_startup, startup = baseline.get("startup"), results.get("startup")
+    if old_startup and startup:
+        for key in ("import_ms", "warmup_ms"):
+            change = (startup[key] - old_startup[key]) / old_startup[key] * 100 if old_startup[key] else 0.0
+            print(f"  startup {key[:-3]:>7}: {startup[key]:.1f} ms ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for ingestion, retrieval and test generation.")
+    parser.add_argument("--sizes", default="50,200,1000", help="Comma-separated corpus sizes in documents")
+    parser.add_argument("--queries", type=int, default=100, help="Retrieval queries per corpus size and mode")
+    parser.add_argument("--generate-requests", type=int, default=20, help="/generate-tests/ requests to time")
+    parser.add_argument("--modes", default=",".join(RETRIEVAL_MODES), help="Retrieval modes to measure")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Fresh interpreters to time import and warmup in (0 = skip)")
+    parser.add_argument("--embed-round-trip-ms", type=float, default=20.0, help="Simulated latency per embedding call in the batch retrieval benchmark")
+    parser.add_argument("--llm-ms-per-token", type=float, default=2.0, help="Simulated generation time per response token in the map-reduce benchmark")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/bench-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    modes = [mode for mode in args.modes.split(",") if mode]
+    set_llm_client(LLMClient(StubBackend(canned_test_cases), rate=0))
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "embedding_model": ingestion.get_embeddings().model,
+            "params": {"sizes": sizes, "queries": args.queries, "generate_requests": args.generate_requests, "modes": modes, "startup_runs": args.startup_runs, "embed_round_trip_ms": args.embed_round_trip_ms, "llm_ms_per_token": args.llm_ms_per_token},
+        },
+        "ingest": [],
+        "retrieve": [],
+        "generate_tests": None,
+        "startup": None,
+        "vector_backends": [],
+        "batch_retrieval": [],
+        "map_reduce": None,
+    }
+
+    if args.startup_runs:
+        startup = bench_startup(args.startup_runs)
+        results["startup"] = startup
+        print(f"startup: import {startup['import_ms']:.1f} ms, warmup {startup['warmup_ms']:.1f} ms")
+
+    for size in sizes:
+        corpus = build_corpus(size)
+        ingest = bench_ingest(corpus)
+        results["ingest"].append(ingest)
+        print(f"ingest   {size:>6} docs: {ingest['docs_per_s']:>9.1f} docs/s {ingest['chunks_per_s']:>10.1f} chunks/s ({ingest['chunks']} chunks)")
+
+        queries = build_queries(args.queries, size)
+        for mode in modes:
+            summary = bench_retrieve(queries, mode)
+            results["retrieve"].append({"docs": size, "chunks": ingest["chunks"], "mode": mode, **summary})
+            print(f"retrieve {size:>6} docs {mode:>7}: p50 {summary['p50_ms']:8.3f} ms  p99 {summary['p99_ms']:8.3f} ms")
+
+        for entry in bench_vector_backends(queries):
+            results["vector_backends"].append({"docs": size, "chunks": ingest["chunks"], **entry})
+            print(
+                f"vectors  {size:>6} docs {entry['backend']:>15}: {entry['bytes_per_chunk']:8.1f} B/chunk, "
+                f"recall@10 {entry['recall']:.3f}, p50 {entry['p50_ms']:.3f} ms"
+            )
+
+        batch = bench_batch_retrieval(queries, round_trip_ms=args.embed_round_trip_ms)
+        results["batch_retrieval"].append({"docs": size, "chunks": ingest["chunks"], **batch})
+        print(
+            f"batch    {size:>6} docs {batch['queries']:>4} queries: sequential {batch['sequential_ms']:9.1f} ms "
+            f"({batch['sequential_embed_calls']} embed calls), batch {batch['batch_ms']:9.1f} ms "
+            f"({batch['batch_embed_calls']} embed calls)"
+        )
+
+    # Generation overhead is measured against the largest corpus
+    generate = bench_generate_tests(build_queries(args.generate_requests, sizes[-1], seed=13))
+    results["generate_tests"] = {"docs": sizes[-1], **generate}
+    print(
+        f"/generate-tests/: fresh p50 {generate['fresh']['p50_ms']:.3f} ms p99 {generate['fresh']['p99_ms']:.3f} ms, "
+        f"cached p50 {generate['cached']['p50_ms']:.3f} ms"
+    )
+
+    # A broad request whose context spans many documents, as map-reduce is meant for
+    map_reduce = bench_map_reduce("coupon code apply total price tax", args.llm_ms_per_token)
+    results["map_reduce"] = {"docs": sizes[-1], **map_reduce}
+    print(
+        f"map-reduce: single call {map_reduce['single_call_ms']:.1f} ms ({map_reduce['single_call_cases']} cases), "
+        f"{map_reduce['partitions']} partitions {map_reduce['map_reduce_ms']:.1f} ms ({map_reduce['map_reduce_cases']} cases)"
+    )
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+
+# Offline backends must be selected before the app modules read their settings
+os.environ["EMBEDDING_BACKEND"] = "hash"
+os.environ["LLM_BACKEND"] = "stub"
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["VECTOR_STORE_MODE"] = "memory"
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
@@ -0,0 +1,82 @@
+import threading
+import uuid
+import pytest
+from app.services import ingestion
+
+
+@pytest.fixture
+def collection():
+    name = f"test-{uuid.uuid4().hex[:8]}"
+    yield name
+    ingestion.clear_knowledge_base(name)
+
+
+def ingest(collection, files, **kwargs):
+    return ingestion.ingest_files([(name, text.encode()) for name, text in files.items()], collection=collection, **kwargs)
+
+
+def section(title, topic):
+    return f"# {title}\n" + " ".join(f"The {topic} rule number {i} applies to every order." for i in range(40))
+
+
+def chunk_ids(filename, text):
+    return {ingestion.chunk_id(filename, doc.page_content) for doc in ingestion.split_file(filename, text.encode())}
+
+
+V1 = "\n\n".join([section("Discounts", "discount"), section("Shipping", "shipping"), section("Payment", "payment")])
+V2 = "\n\n".join([section("Discounts", "discount"), section("Shipping", "express shipping"), section("Returns", "return")])
+
+
+def stored_ids(collection):
+    return set(ingestion.get_vector_store(collection)._collection.get(include=[])["ids"])
+
+
+def test_reupload_diffs_against_the_stored_version(collection):
+    v1_ids, v2_ids = chunk_ids("a.md", V1), chunk_ids("a.md", V2)
+    first = ingest(collection, {"a.md": V1})["files"][0]
+    assert (first["added"], first["unchanged"], first["removed"]) == (len(v1_ids), 0, 0)
+
+    same = ingest(collection, {"a.md": V1})["files"][0]
+    assert (same["added"], same["unchanged"], same["removed"]) == (0, len(v1_ids), 0)
+
+    changed = ingest(collection, {"a.md": V2})["files"][0]
+    assert changed["status"] == "ingested"
+    assert changed["added"] == len(v2_ids - v1_ids) > 0
+    assert changed["removed"] == len(v1_ids - v2_ids) > 0
+    assert changed["unchanged"] == len(v1_ids & v2_ids) > 0
+    assert ingestion.get_manifest(collection)["a.md"] == v2_ids
+    assert stored_ids(collection) == v2_ids
+    assert all(doc_id in ingestion.get_lexical_index(collection) for doc_id in v2_ids)
+
+
+def test_cancelled_reupload_keeps_the_previous_version(collection, monkeypatch):
+    ingest(collection, {"a.md": V1})
+    v1_ids = chunk_ids("a.md", V1)
+    # One small batch at a time, cancelled once the first one is stored
+    monkeypatch.setattr(ingestion, "EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr(ingestion, "EMBED_MAX_IN_FLIGHT", 1)
+    cancel_event = threading.Event()
+    embed_and_store = ingestion._embed_and_store
+
+    def embed_then_cancel(kb, documents):
+        result = embed_and_store(kb, documents)
+        cancel_event.set()
+        return result
+
+    monkeypatch.setattr(ingestion, "_embed_and_store", embed_then_cancel)
+    result = ingest(collection, {"a.md": V2}, cancel_event=cancel_event)["files"][0]
+    assert result["status"] == "cancelled"
+    assert (result["added"], result["removed"], result["unchanged"]) == (0, 0, 0)
+    assert ingestion.get_manifest(collection)["a.md"] == v1_ids
+    assert stored_ids(collection) == v1_ids
+    assert not any(doc_id in ingestion.get_lexical_index(collection) for doc_id in chunk_ids("a.md", V2) - v1_ids)
+
+
+def test_collection_in_use_is_not_evicted(collection, monkeypatch):
+    ingest(collection, {"a.md": "# A\nApply discount code SAVE15."})
+    monkeypatch.setattr(ingestion, "KB_MEMORY_BUDGET_MB", 0)
+    monkeypatch.setattr(ingestion, "KB_EVICT_MIN_IDLE_SECONDS", 0)
+    monkeypatch.setattr(ingestion, "KB_EVICTION_POLICY", "drop")
+    with ingestion.using_collection(collection):
+        assert collection not in ingestion.enforce_memory_budget()
+    assert collection in ingestion.enforce_memory_budget()
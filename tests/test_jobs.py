@@ -0,0 +1,35 @@
+import uuid
+import pytest
+from app.services import ingestion
+from app.services.jobs import IngestionJob
+
+
+@pytest.fixture
+def collection():
+    name = f"test-{uuid.uuid4().hex[:8]}"
+    yield name
+    ingestion.clear_knowledge_base(name)
+
+
+def test_cancel_after_last_file_is_stored_completes(collection):
+    job = IngestionJob([("a.md", b"# A\nApply discount code SAVE15.")], collection)
+    progress = job._progress
+
+    def cancel_when_done(files_done, chunks_embedded):
+        progress(files_done, chunks_embedded)
+        if job.files_done == job.files_total:
+            job.cancel_event.set()
+
+    job._progress = cancel_when_done
+    job.run()
+    assert job.cancel_event.is_set()
+    assert job.status == "completed"
+    assert "a.md" in ingestion.get_manifest(collection)
+
+
+def test_cancel_before_start_abandons_every_file(collection):
+    job = IngestionJob([("a.md", b"# A\nApply discount code SAVE15.")], collection)
+    job.cancel_event.set()
+    job.run()
+    assert job.status == "cancelled"
+    assert ingestion.get_manifest(collection) == {}
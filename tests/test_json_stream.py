@@ -0,0 +1,70 @@
+import json
+from app.utils.json_stream import JsonArrayStreamParser, parse_json_array_prefix
+
+CASES = [
+    {"Test_ID": "TC001", "Test_Scenario": "Apply code \"SAVE15\"", "Expected_Result": "Total is {discounted}"},
+    {"Test_ID": "TC002", "Test_Scenario": "Path C:\\temp\\ and ] inside a string", "Expected_Result": "[ok]"},
+    {"Test_ID": "TC003", "Steps": [{"action": "click"}, {"action": "type", "text": "}{"}]},
+]
+
+
+def test_objects_survive_any_chunking():
+    text = "```json\n" + json.dumps(CASES, indent=2) + "\n```"
+    for size in (1, 2, 7, 64, len(text)):
+        parser = JsonArrayStreamParser()
+        received = []
+        for start in range(0, len(text), size):
+            received.extend(parser.feed(text[start:start + size]))
+        assert received == CASES
+        assert parser.items == CASES
+        assert not parser.truncated
+
+
+def test_escaped_quote_split_across_chunks():
+    text = json.dumps([{"a": 'say \\"hi\\" }'}])
+    split = text.index("\\") + 1
+    parser = JsonArrayStreamParser()
+    assert parser.feed(text[:split]) == []
+    assert parser.feed(text[split:]) == [{"a": 'say \\"hi\\" }'}]
+
+
+def test_truncated_response_keeps_completed_objects():
+    text = json.dumps(CASES)
+    cut = text.index('"TC003"')
+    parser = JsonArrayStreamParser()
+    assert parser.feed(text[:cut]) == CASES[:2]
+    assert parser.truncated
+    assert parse_json_array_prefix(text[:cut]) == CASES[:2]
+
+
+def test_text_after_closing_bracket_is_ignored():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"a": 1}] trailing {"b": 2}') == [{"a": 1}]
+    assert parser.done
+    assert parser.feed('{"c": 3}') == []
+
+
+def test_invalid_object_is_skipped():
+    assert parse_json_array_prefix('[{"a": 1}, {"b": nope}, {"c": 3}]') == [{"a": 1}, {"c": 3}]
+
+
+def test_no_array():
+    parser = JsonArrayStreamParser()
+    assert parser.feed("I cannot help with that.") == []
+    assert parser.truncated
+    assert parse_json_array_prefix("") == []
+
+
+def test_bracket_in_preface_is_not_the_array():
+    text = "Here are the cases [see below]:\n[\n  " + json.dumps(CASES)[1:]
+    for size in (1, 3, len(text)):
+        parser = JsonArrayStreamParser()
+        received = []
+        for start in range(0, len(text), size):
+            received.extend(parser.feed(text[start:start + size]))
+        assert received == CASES
+        assert parser.done
+    assert parse_json_array_prefix('Cases [1] and [2]: [ {"a": 1}]') == [{"a": 1}]
+    empty = JsonArrayStreamParser()
+    assert empty.feed("No cases [none found]: [ ]") == []
+    assert empty.done
@@ -0,0 +1,30 @@
+from lxml import etree
+from app.utils.parsers import extract_interactive_elements, xpath_literal
+from app.utils.selenium_validation import LocatorIndex
+
+PAGE = """
+<html><body>
+  <form id="customer's-form">
+    <input type="radio" name="size" value='12" pizza'>
+    <input type="checkbox" name="it's" value="yes">
+    <button>Order</button>
+  </form>
+  <div id='say "hi" it&apos;s'><a href="/help">Help</a></div>
+  <button id="plain">Pay</button>
+</body></html>
+"""
+
+
+def test_xpath_literal_round_trips():
+    root = etree.XML("<r/>")
+    for value in ["plain", "it's", 'say "hi"', 'it\'s "quoted"', "'", "a''b", ""]:
+        assert root.xpath(f"string({xpath_literal(value)})") == value
+
+
+def test_page_index_xpaths_are_valid_with_quotes_in_values():
+    elements = extract_interactive_elements(PAGE)
+    assert len(elements) == 7
+    index = LocatorIndex(PAGE)
+    for element in elements:
+        assert index.check("XPATH", element["xpath"]) is None, element
+        assert len(index.tree.xpath(element["xpath"])) == 1, element
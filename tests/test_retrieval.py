@@ -0,0 +1,72 @@
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import ingestion, rag_service
+
+
+@pytest.fixture
+def collection():
+    name = f"test-{uuid.uuid4().hex[:8]}"
+    yield name
+    ingestion.clear_knowledge_base(name)
+
+
+def ingest(collection, files):
+    result = ingestion.ingest_files([(name, text.encode()) for name, text in files.items()], collection=collection)
+    assert [file["status"] for file in result["files"]] == ["ingested"] * len(files)
+    return result
+
+
+def test_dedupe_compares_raw_scores():
+    # Scaled per query, "b" looks stronger for the first query; raw scores say the second
+    hits = [[("a", 1.0), ("b", 0.9)], [("c", 1.0), ("b", 0.8)]]
+    raw_scores = [{"a": 5.0, "b": 2.0}, {"c": 9.0, "b": 7.0}]
+    assert rag_service._dedupe(hits, raw_scores) == [[("a", 1.0)], [("c", 1.0), ("b", 0.8)]]
+
+
+def test_dedupe_keeps_each_query_top_hit():
+    hits = [[("a", 1.0), ("b", 0.4)], [("a", 1.0)]]
+    assert rag_service._dedupe(hits, [{"a": 3.0, "b": 1.0}, {"a": 2.0}]) == [[("a", 1.0), ("b", 0.4)], [("a", 1.0)]]
+
+
+@pytest.mark.parametrize("mode", ["lexical", "hybrid"])
+def test_shared_only_hit_is_not_taken_from_later_query(collection, mode):
+    ingest(collection, {
+        "faq.md": "Shipping is free when a discount code is applied.",
+        "payment.md": "Payment accepts credit cards and gift cards.",
+    })
+    contexts = rag_service.retrieve_context_batch(["discount", "shipping"], mode=mode, collection=collection, dedupe=True)
+    assert all("Shipping is free" in context for context in contexts)
+
+
+FILES = {
+    "checkout.md": "# Discounts\nApply discount code SAVE15 at checkout for 15% off.",
+    "faq.md": "# Discounts\nA discount code cannot be combined with a gift card.",
+    "notes.txt": "Discount codes expire after thirty days.",
+}
+
+
+def test_filters_narrow_the_candidates(collection):
+    ingest(collection, FILES)
+    index = ingestion.get_lexical_index(collection)
+    assert {index.get(doc_id)[1]["source"] for doc_id in index.matching({"source": ["faq.md", "notes.txt"]})} == {"faq.md", "notes.txt"}
+    assert {index.get(doc_id)[1]["source"] for doc_id in index.matching({"doc_type": "md", "source": "faq.md"})} == {"faq.md"}
+    assert index.matching({"source": "faq.md", "doc_type": "txt"}) == set()
+    for mode in rag_service.RETRIEVAL_MODES:
+        docs = rag_service.retrieve_documents("discount code", k=5, mode=mode, collection=collection, filters={"doc_type": "md"})
+        assert docs and {doc.metadata["source"] for doc, _ in docs} <= {"checkout.md", "faq.md"}
+    assert rag_service.retrieve_documents("discount", collection=collection, filters={"source": "missing.md"}) == []
+
+
+def test_unknown_filter_is_rejected(collection):
+    ingest(collection, FILES)
+    client = TestClient(app)
+    response = client.post("/retrieve/", json={"query": "discount", "collection": collection, "filters": {"colour": "red"}})
+    assert response.status_code == 400
+    assert "Unknown filter: colour" in response.json()["detail"]
+    response = client.post("/retrieve/", json={"query": "discount", "collection": collection, "filters": {"source": 5}})
+    assert response.status_code == 400
+    response = client.post("/retrieve/", json={"query": "discount", "collection": collection, "filters": {"source": "faq.md"}})
+    assert response.status_code == 200
+    assert "faq.md" in response.json()["context"] and "checkout.md" not in response.json()["context"]
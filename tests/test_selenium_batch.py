@@ -0,0 +1,28 @@
+import io
+import json
+import zipfile
+from fastapi.testclient import TestClient
+from app.main import app, script_file_names
+
+HTML = '<html><body><button id="submit">Pay</button></body></html>'
+TEST_CASES = [{"Test_ID": "A"}, {"Test_ID": "A_2"}, {"Test_ID": "A"}, {"Test_ID": "A"}, {}]
+
+
+def test_repeated_test_ids_get_unique_file_names():
+    assert script_file_names(TEST_CASES) == ["test_a.py", "test_a_2.py", "test_a_3.py", "test_a_4.py", "test_case_5.py"]
+
+
+def test_every_format_keeps_every_script():
+    client = TestClient(app)
+    body = {"test_cases": TEST_CASES, "html_content": HTML}
+
+    scripts = client.post("/generate-selenium/batch", json=body).json()["scripts"]
+    assert len({entry["file_name"] for entry in scripts}) == len(TEST_CASES)
+
+    lines = client.post("/generate-selenium/batch", json={**body, "format": "ndjson"}).text.splitlines()
+    events = [json.loads(line) for line in lines if line]
+    names = [event["file_name"] for event in events if event["event"] == "script"]
+    assert sorted(names) == sorted(script_file_names(TEST_CASES))
+
+    archive = zipfile.ZipFile(io.BytesIO(client.post("/generate-selenium/batch", json={**body, "format": "zip"}).content))
+    assert sorted(archive.namelist()) == sorted(script_file_names(TEST_CASES))
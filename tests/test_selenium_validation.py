@@ -0,0 +1,56 @@
+from app.utils.selenium_validation import LocatorIndex, format_problems, problem_count, validate_script
+
+PAGE = """
+<html><body>
+  <form id="checkout" name="checkout-form">
+    <input id="promo" name="promo_code" class="input wide">
+    <button id="apply" class="btn primary">Apply</button>
+  </form>
+</body></html>
+"""
+
+SCRIPT = """
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+
+driver.find_element(By.ID, "promo").send_keys("SAVE15")
+driver.find_element(By.NAME, "promo_code")
+driver.find_element(By.CSS_SELECTOR, "#checkout button.primary")
+driver.find_element(By.XPATH, "//button[@id='apply']")
+wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "btn")))
+driver.find_element("id", "apply").click()
+"""
+
+
+def test_matching_locators_are_valid():
+    report = validate_script(SCRIPT, LocatorIndex(PAGE))
+    assert report["valid"]
+    assert report["locators_checked"] == 6
+    assert problem_count(report) == 0
+
+
+def test_bad_locators_are_rejected():
+    script = SCRIPT + """
+driver.find_element(By.ID, "coupon")
+wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "button[")))
+driver.find_element(By.CLASS_NAME, "btn primary")
+driver.find_element(By.XPATH, "//button[@id='apply'")
+driver.find_element(by=By.NAME, value="promo")
+"""
+    report = validate_script(script, LocatorIndex(PAGE))
+    assert not report["valid"]
+    invalid = {(locator["by"], locator["value"]): locator["reason"] for locator in report["invalid_locators"]}
+    assert invalid[("ID", "coupon")] == "no element has this id"
+    assert invalid[("CSS_SELECTOR", "button[")].startswith("invalid CSS selector")
+    assert invalid[("CLASS_NAME", "btn primary")].startswith("CLASS_NAME takes a single class name")
+    assert invalid[("XPATH", "//button[@id='apply'")].startswith("invalid XPath")
+    assert invalid[("NAME", "promo")] == "no element has this name"
+    assert problem_count(report) == 5
+    assert "By.ID 'coupon'" in format_problems(report)
+
+
+def test_syntax_error_and_dynamic_values():
+    report = validate_script("driver.find_element(By.ID, 'promo'", LocatorIndex(PAGE))
+    assert not report["valid"] and report["syntax_error"]["line"] == 1
+    report = validate_script("driver.find_element(By.ID, promo_id)", LocatorIndex(PAGE))
+    assert report["valid"] and report["unchecked_locators"] == 1 and report["locators_checked"] == 0
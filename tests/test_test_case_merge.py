@@ -0,0 +1,69 @@
+from app.services import llm_service
+from app.services.llm_service import merge_test_cases
+
+
+def case(test_id: str, scenario: str, expected: str = "The order is placed", **fields):
+    return {"Test_ID": test_id, "Feature": "Checkout", "Test_Scenario": scenario, "Expected_Result": expected, **fields}
+
+
+def test_merged_cases_are_renumbered_in_partition_order():
+    first = [case("TC001", "Apply discount code SAVE15"), case("TC002", "Apply an expired discount code")]
+    second = [case("TC001", "Pay with a saved credit card"), case("TC007", "Choose express shipping")]
+    merged, duplicates = merge_test_cases([first, second])
+    assert [test_case["Test_ID"] for test_case in merged] == ["TC001", "TC002", "TC003", "TC004"]
+    assert [test_case["Test_Scenario"] for test_case in merged] == [
+        "Apply discount code SAVE15",
+        "Apply an expired discount code",
+        "Pay with a saved credit card",
+        "Choose express shipping",
+    ]
+    assert duplicates == 0
+
+
+def test_near_duplicate_across_partitions_is_dropped():
+    first = [case("TC001", "Apply the discount code SAVE15 at checkout", "The total is reduced by 15%")]
+    second = [
+        case("TC001", "Apply discount code SAVE15 at checkout", "Total is reduced by 15%", Grounded_In="faq.md"),
+        case("TC002", "Remove an applied discount code", "The total returns to full price"),
+    ]
+    merged, duplicates = merge_test_cases([first, second])
+    assert duplicates == 1
+    assert [test_case["Test_ID"] for test_case in merged] == ["TC001", "TC002"]
+    # The first occurrence is the one kept
+    assert "Grounded_In" not in merged[0]
+    assert merged[1]["Test_Scenario"] == "Remove an applied discount code"
+
+
+def test_same_scenario_with_different_expectation_is_kept():
+    merged, duplicates = merge_test_cases([
+        [case("TC001", "Submit the payment form with card number 4111", "Payment is accepted")],
+        [case("TC001", "Submit the payment form with card number 4111", "An invalid card error is shown")],
+    ])
+    assert duplicates == 0
+    assert len(merged) == 2
+
+
+def test_threshold_controls_what_counts_as_duplicate():
+    strict = llm_service.TestCaseMerger(threshold=1.0)
+    assert strict.add(case("TC001", "Apply discount code SAVE15")) is not None
+    assert strict.add(case("TC001", "Apply the discount code SAVE15 now")) is not None
+    assert strict.add(case("TC009", "apply DISCOUNT code save15")) is None
+    assert strict.duplicates == 1
+    assert [test_case["Test_ID"] for test_case in strict.test_cases] == ["TC001", "TC002"]
+
+
+def test_non_objects_and_empty_cases_are_handled():
+    merger = llm_service.TestCaseMerger()
+    assert merger.add("not a test case") is None
+    assert merger.add(None) is None
+    # Cases without scenario terms are never treated as duplicates of each other
+    assert merger.add({"Test_ID": "X"})["Test_ID"] == "TC001"
+    assert merger.add({"Test_ID": "Y"})["Test_ID"] == "TC002"
+    assert merger.duplicates == 0
+
+
+def test_input_cases_are_not_modified():
+    original = case("TC042", "Apply discount code SAVE15")
+    merged, _ = merge_test_cases([[original]])
+    assert original["Test_ID"] == "TC042"
+    assert merged[0]["Test_ID"] == "TC001"
@@ -0,0 +1,11 @@
+from fastapi.testclient import TestClient
+from app import main
+
+
+def test_rejected_upload_is_counted_in_request_metrics(monkeypatch):
+    monkeypatch.setattr(main, "INGEST_MAX_REQUEST_MB", 0.001)
+    client = TestClient(main.app)
+    response = client.post("/ingest/", files=[("files", ("a.md", b"x" * 4096))])
+    assert response.status_code == 413
+    metrics = client.get("/metrics").text
+    assert 'qa_http_request_duration_seconds_count{method="POST",path="/ingest/",status="413"}' in metrics
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pytest
+from app.services.vector_index import QUANTIZATIONS, CompactVectorIndex
+
+
+def unit_vectors(count: int, dim: int = 16, seed: int = 3) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_order(vectors: np.ndarray, ids, query: np.ndarray, k: int):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    return [ids[i] for i in np.argsort(distances, kind="stable")[:k]]
+
+
+@pytest.mark.parametrize("quantization", QUANTIZATIONS)
+def test_search_matches_exact_ranking(tmp_path, quantization):
+    vectors = unit_vectors(200)
+    ids = [f"doc-{i}" for i in range(200)]
+    index = CompactVectorIndex(str(tmp_path), quantization)
+    index.add_many(ids, vectors)
+    for query in unit_vectors(5, seed=9):
+        hits = index.search(query, k=10)
+        assert [doc_id for doc_id, _ in hits] == exact_order(vectors, ids, query, 10)
+        expected = ((vectors[int(hits[0][0].split("-")[1])] - query) ** 2).sum()
+        assert hits[0][1] == pytest.approx(float(expected), abs=1e-5)
+
+
+def test_search_many_matches_single_searches(tmp_path):
+    vectors = unit_vectors(50)
+    index = CompactVectorIndex(str(tmp_path))
+    index.add_many([f"doc-{i}" for i in range(50)], vectors)
+    queries = unit_vectors(4, seed=5)
+    assert index.search_many(queries, k=5) == [index.search(query, k=5) for query in queries]
+
+
+def test_freed_slot_is_reused_and_survives_reload(tmp_path):
+    vectors = unit_vectors(4)
+    index = CompactVectorIndex(str(tmp_path))
+    index.add_many(["a", "b", "c"], vectors[:3])
+    freed_row = index._rows["b"]
+
+    index.remove_many(["b"])
+    assert "b" not in index and len(index) == 2
+    index.add_many(["d"], vectors[3:4])
+    assert index._rows["d"] == freed_row
+
+    reloaded = CompactVectorIndex(str(tmp_path))
+    assert len(reloaded) == 3
+    assert "b" not in reloaded
+    assert reloaded._rows["d"] == freed_row
+    np.testing.assert_allclose(reloaded.get_vectors(["a", "c", "d"]), vectors[[0, 2, 3]])
+    assert reloaded.search(vectors[3], k=1)[0][0] == "d"
+
+
+def test_replaced_vector_keeps_its_slot(tmp_path):
+    vectors = unit_vectors(3)
+    index = CompactVectorIndex(str(tmp_path))
+    index.add_many(["a", "b"], vectors[:2])
+    index.add_many(["a"], vectors[2:3])
+    reloaded = CompactVectorIndex(str(tmp_path))
+    assert len(reloaded) == 2
+    np.testing.assert_allclose(reloaded.get_vectors(["a"]), vectors[2:3])
+
+
+def test_reload_ignores_log_line_cut_off_by_a_crash(tmp_path):
+    vectors = unit_vectors(2)
+    index = CompactVectorIndex(str(tmp_path))
+    index.add_many(["a", "b"], vectors)
+    with open(os.path.join(str(tmp_path), "ids.log"), "a", encoding="utf-8") as f:
+        f.write("-0")
+    reloaded = CompactVectorIndex(str(tmp_path))
+    assert "a" in reloaded and "b" in reloaded
+
+
+def test_search_within_ids(tmp_path):
+    vectors = unit_vectors(20)
+    ids = [f"doc-{i}" for i in range(20)]
+    index = CompactVectorIndex(str(tmp_path))
+    index.add_many(ids, vectors)
+    scope = {"doc-3", "doc-7", "doc-11"}
+    hits = index.search(vectors[0], k=5, ids=scope)
+    assert {doc_id for doc_id, _ in hits} == scope
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    index = CompactVectorIndex(str(tmp_path))
+    index.add_many(["a"], unit_vectors(1, dim=8))
+    with pytest.raises(ValueError):
+        index.add_many(["b"], unit_vectors(1, dim=16))
+
+
+def test_reload_after_log_compaction(tmp_path):
+    vectors = unit_vectors(10)
+    index = CompactVectorIndex(str(tmp_path))
+    for _ in range(60):
+        index.add_many([f"doc-{i}" for i in range(10)], vectors)
+        index.remove_many([f"doc-{i}" for i in range(5)])
+    with open(os.path.join(str(tmp_path), "ids.log"), encoding="utf-8") as f:
+        assert sum(1 for _ in f) < 600
+    reloaded = CompactVectorIndex(str(tmp_path))
+    assert sorted(reloaded._rows) == [f"doc-{i}" for i in range(5, 10)]
+    np.testing.assert_allclose(reloaded.get_vectors(["doc-7"]), vectors[7:8])